@@ -0,0 +1,101 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, insert, delete, func, literal, exists
+from sqlalchemy.orm import joinedload, selectinload
+
+from extensions import db
+from models import (
+    Car, Advertisement, CarImage, PriceHistory, OwnershipHistory, Transaction, Notification,
+    ArchivedCar, ArchivedAdvertisement, ArchivedCarImage, ArchivedPriceHistory, ArchivedOwnershipHistory
+)
+from facets import facet_cell, apply_facet_deltas
+from changefeed import record_listing_deletions
+
+ARCHIVABLE_AD_STATUSES = ('sold', 'expired')
+# An offer still being negotiated keeps the listing hot
+OPEN_TRANSACTION_STATUSES = ('pending', 'accepted')
+# Parents first; rows are copied in this order and deleted in reverse
+CAR_CHILD_TABLES = [
+    (CarImage, ArchivedCarImage),
+    (PriceHistory, ArchivedPriceHistory),
+    (OwnershipHistory, ArchivedOwnershipHistory),
+]
+
+
+def cold_listing_batch(limit):
+    """Sold or expired ads untouched for ``ARCHIVE_AFTER_DAYS``, whose car has no open offer."""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['ARCHIVE_AFTER_DAYS'])
+    conditions = [
+        Advertisement.status.in_(ARCHIVABLE_AD_STATUSES),
+        Advertisement.updated_at < cutoff,
+        ~exists().where(Transaction.car_id == Car.id, Transaction.status.in_(OPEN_TRANSACTION_STATUSES)),
+    ]
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # SQLite reuses max(id) + 1 once the top row is deleted, which would collide with
+        # the archived copy, so there the newest car and ad stay hot; sequences never reuse ids
+        conditions += [
+            Car.id < select(func.max(Car.id)).scalar_subquery(),
+            Advertisement.id < select(func.max(Advertisement.id)).scalar_subquery(),
+        ]
+    return db.session.execute(
+        select(
+            Advertisement.id, Advertisement.car_id, Advertisement.price, Advertisement.status,
+            Car.make, Car.color, Car.status.label('car_status'), Car.year
+        )
+        .join(Car, Car.id == Advertisement.car_id)
+        .where(*conditions)
+        .order_by(Advertisement.id)
+        .limit(limit)
+        .with_for_update(of=Advertisement, skip_locked=True)
+    ).all()
+
+
+def _move(hot, archived, condition, now):
+    columns = list(hot.__table__.columns)
+    db.session.execute(insert(archived.__table__).from_select(
+        [column.name for column in columns] + ['archived_at'], select(*columns, literal(now)).where(condition)
+    ))
+
+
+def archive_listings(rows, now=None):
+    """Move a batch from ``cold_listing_batch`` into the archive tables; call before commit.
+
+    Returns the cache tags to invalidate once the batch has committed.
+    """
+    now = now or datetime.utcnow()
+    ad_ids = [row.id for row in rows]
+    car_ids = [row.car_id for row in rows]
+
+    _move(Car, ArchivedCar, Car.id.in_(car_ids), now)
+    _move(Advertisement, ArchivedAdvertisement, Advertisement.id.in_(ad_ids), now)
+    for hot, archived in CAR_CHILD_TABLES:
+        _move(hot, archived, hot.car_id.in_(car_ids), now)
+
+    # Inbox entries link to the live listing and are not kept for archived ones
+    db.session.execute(delete(Notification).where(Notification.advertisement_id.in_(ad_ids)))
+    for hot, _ in reversed(CAR_CHILD_TABLES):
+        db.session.execute(delete(hot).where(hot.car_id.in_(car_ids)))
+    db.session.execute(delete(Advertisement).where(Advertisement.id.in_(ad_ids)))
+    db.session.execute(delete(Car).where(Car.id.in_(car_ids)))
+
+    deltas = Counter()
+    stale_tags = {'cars', 'search'}
+    for row in rows:
+        deltas[facet_cell(row.make, row.color, row.car_status, row.year, row.price, row.status)] -= 1
+        stale_tags.update({f'car:{row.car_id}', f'ad:{row.id}', f'make:{row.make.strip().lower()}'})
+    apply_facet_deltas(deltas)
+    record_listing_deletions([(row.id, row.car_id) for row in rows])
+    return stale_tags
+
+
+def archived_car(car_id):
+    return db.session.get(ArchivedCar, car_id, options=[selectinload(ArchivedCar.images)])
+
+
+def archived_advertisement(ad_id):
+    return db.session.get(ArchivedAdvertisement, ad_id, options=[
+        joinedload(ArchivedAdvertisement.car_details).selectinload(ArchivedCar.images),
+        joinedload(ArchivedAdvertisement.publisher),
+    ])
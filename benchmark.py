@@ -0,0 +1,518 @@
+"""Benchmark the API routes against the current database.
+
+    python synthetic_data.py --users 10000 --ads 100000
+    python benchmark.py --requests 200 --output results.json
+    python benchmark.py --baseline results.json
+    python benchmark.py --contention --buyers 16 --hot-cars 5
+
+
+Requests run in-process through Flask's test client, so the numbers
+cover routing, queries and serialization without network noise. The
+result cache is off unless --cache is given, so every request reaches
+the database. Point SQLALCHEMY_DATABASE_URI at a local SQLite file or
+Postgres to choose the backend.
+
+--contention instead has many buyers bid on the same few cars from
+concurrent threads and then races the accepts; it writes offers into the
+database it runs against.
+
+--serialization is a micro-benchmark of the list endpoints' JSON: ORM
+objects through serialize_* and jsonify against row tuples through the
+row encoders, checking both produce the same bytes, plus what gzip and
+brotli make of the result.
+
+    python benchmark.py --serialization --rows 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from statistics import median
+
+from sqlalchemy import event, select, func
+
+
+def percentile(sorted_values, rank):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(rank / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'after_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+class Scenario:
+    """One named workload: ``request(client, rng)`` returns a test-client response."""
+
+    def __init__(self, name, request, client='anonymous'):
+        self.name = name
+        self.request = request
+        self.client = client
+
+
+def build_scenarios(sample):
+    def listing_first_page(client, rng):
+        return client.get('/api/advertisements?limit=20&sort=' + rng.choice(['newest', 'price_asc', 'price_desc']))
+
+    def listing_deep_page(client, rng):
+        page = client.get('/api/advertisements?limit=20&sort=newest').get_json()
+        for _ in range(rng.randint(1, 5)):
+            if not page['next_cursor']:
+                break
+            response = client.get(f"/api/advertisements?limit=20&sort=newest&cursor={page['next_cursor']}")
+            page = response.get_json()
+        return response
+
+    def search(client, rng):
+        make, model = rng.choice(sample['segments'])
+        params = [f'brand={make}', f'sort={rng.choice(["newest", "price_asc", "year_desc"])}', 'limit=20']
+        if rng.random() < 0.5:
+            params.append(f'model={model}')
+        if rng.random() < 0.5:
+            low = rng.choice([0, 5000, 10000, 20000])
+            params += [f'min_price={low}', f'max_price={low * 3 + 10000}']
+        return client.get('/api/search/cars?' + '&'.join(params))
+
+    def search_text(client, rng):
+        make, model = rng.choice(sample['segments'])
+        params = [f'q=well kept {model}', 'limit=20']
+        if rng.random() < 0.5:
+            params.append(f'brand={make}')
+        return client.get('/api/search/cars?' + '&'.join(params))
+
+    def search_facets(client, rng):
+        make, _ = rng.choice(sample['segments'])
+        return client.get(f'/api/search/cars/facets?brand={make}')
+
+    def related(client, rng):
+        return client.get(f"/api/cars/{rng.choice(sample['car_ids'])}/related")
+
+    def valuation(client, rng):
+        (make, model), year = rng.choice(sample['segments']), rng.choice(sample['years'])
+        return client.get(f'/api/valuation?make={make}&model={model}&year={year}')
+
+    def transactions_admin(client, rng):
+        return client.get('/api/transactions?limit=20&sort=newest')
+
+    def transactions_user(client, rng):
+        return client.get('/api/transactions?limit=20')
+
+    def users_directory(client, rng):
+        return client.get(f"/api/users?limit=50&mobile={rng.choice(sample['mobile_prefixes'])}")
+
+    def login(client, rng):
+        return client.post('/login_api', json={'mobile_number': rng.choice(sample['mobiles']), 'password': sample['password']})
+
+    return [
+        Scenario('listing_first_page', listing_first_page),
+        Scenario('listing_deep_page', listing_deep_page),
+        Scenario('search', search),
+        Scenario('search_text', search_text),
+        Scenario('search_facets', search_facets),
+        Scenario('related', related),
+        Scenario('valuation', valuation),
+        Scenario('transactions_admin', transactions_admin, client='admin'),
+        Scenario('transactions_user', transactions_user, client='user'),
+        Scenario('users_directory', users_directory, client='admin'),
+        Scenario('login', login),
+    ]
+
+
+def load_sample(db, models, synthetic):
+    Car, Advertisement, User, Transaction = models
+    car_ids = db.session.scalars(
+        select(Advertisement.car_id).where(Advertisement.status == 'active').order_by(func.random()).limit(1000)
+    ).all()
+    segments = db.session.execute(select(Car.make, Car.model).distinct().limit(500)).all()
+    years = db.session.scalars(select(Car.year).distinct()).all()
+    mobiles = db.session.scalars(
+        select(User.mobile_number)
+        .where(User.mobile_number.like(f'{synthetic.SYNTHETIC_MOBILE_PREFIX}%'))
+        .order_by(func.random()).limit(200)
+    ).all()
+    buyer = db.session.scalar(
+        select(User.mobile_number).join(Transaction, Transaction.buyer_id == User.id)
+        .where(User.mobile_number.like(f'{synthetic.SYNTHETIC_MOBILE_PREFIX}%')).limit(1)
+    )
+    if not car_ids or not mobiles:
+        sys.exit("No synthetic data found; run synthetic_data.py first.")
+    return {
+        'car_ids': car_ids,
+        'segments': [tuple(segment) for segment in segments],
+        'years': years,
+        'mobiles': mobiles,
+        'mobile_prefixes': sorted({mobile[:6] for mobile in mobiles}),
+        'buyer': buyer or mobiles[0],
+        'password': synthetic.BENCHMARK_PASSWORD,
+    }
+
+
+def run_scenario(scenario, clients, counter, rng, requests, warmup):
+    client = clients[scenario.client]
+    for _ in range(warmup):
+        scenario.request(client, rng)
+
+    latencies, queries, errors = [], [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        counter.count = 0
+        request_started = time.perf_counter()
+        response = scenario.request(client, rng)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p90_ms': round(percentile(latencies, 90), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'queries_median': median(queries),
+        'queries_max': max(queries),
+    }
+
+
+def print_report(results, dialect):
+    print(f"\nBackend: {dialect}")
+    header = f"{'scenario':<22}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'queries':>9}{'errors':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        print(
+            f"{name:<22}{result['throughput']:>9}{result['p50_ms']:>9}{result['p90_ms']:>9}"
+            f"{result['p99_ms']:>9}{result['max_ms']:>9}{result['queries_median']:>9}{result['errors']:>8}"
+        )
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a saved run: slower p50/p90 beyond ``tolerance`` or more queries."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p90_ms'):
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {result[metric]}")
+        if result['queries_max'] > previous['queries_max']:
+            regressions.append(f"{name}: queries_max {previous['queries_max']} -> {result['queries_max']}")
+        if result['errors'] > previous['errors']:
+            regressions.append(f"{name}: errors {previous['errors']} -> {result['errors']}")
+    return regressions
+
+
+def _timed_requests(jobs, threads):
+    """Run ``jobs`` (callables returning a response) on ``threads`` threads; returns the latency summary."""
+    latencies, statuses, lock = [], [], threading.Lock()
+    queue = list(jobs)
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                job = queue.pop()
+            request_started = time.perf_counter()
+            status = job().status_code
+            elapsed = (time.perf_counter() - request_started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(status)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(statuses),
+        'throughput': round(len(statuses) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'ok': sum(1 for status in statuses if status < 300),
+        'conflicts': statuses.count(409),
+        'errors': sum(1 for status in statuses if status >= 500),
+    }
+
+
+def run_contention(app, db, models, sample, admin, buyers, hot_cars):
+    """Concurrent buyers bid on the same few cars, then competing accepts race for each car."""
+    Car, Advertisement, User, Transaction = models
+    mobiles = sample['mobiles'][:buyers]
+    buyer_ids = db.session.scalars(select(User.id).where(User.mobile_number.in_(mobiles))).all()
+    cars = db.session.scalars(
+        select(Advertisement.car_id)
+        .where(
+            Advertisement.status == 'active',
+            Advertisement.user_id.not_in(buyer_ids),
+            ~select(Transaction.id).where(Transaction.car_id == Advertisement.car_id).exists(),
+        )
+        .order_by(func.random()).limit(hot_cars)
+    ).all()
+    if len(cars) < hot_cars:
+        sys.exit("Not enough untouched active listings for the contention run.")
+
+    clients = []
+    for mobile in mobiles:
+        client = app.test_client()
+        response = client.post('/login_api', json={'mobile_number': mobile, 'password': sample['password']})
+        if response.status_code != 200:
+            sys.exit(f"Could not log in buyer {mobile}.")
+        clients.append(client)
+
+    # Every buyer bids on every hot car, interleaved so the threads collide on the same rows
+    offers = [
+        (lambda client=client, car_id=car_id: client.post(
+            '/api/transactions', json={'car_id': car_id, 'agreed_price': 1000}
+        ))
+        for car_id in cars for client in clients
+    ]
+    results = {'offers': _timed_requests(offers, len(clients))}
+
+    pending = db.session.execute(
+        select(Transaction.id, Transaction.car_id).where(Transaction.car_id.in_(cars), Transaction.status == 'pending')
+    ).all()
+    accepts = [
+        (lambda offer_id=offer_id: admin.put(f'/api/transactions/{offer_id}/status', json={'status': 'accepted'}))
+        for offer_id, _ in pending
+    ]
+    results['accepts'] = _timed_requests(accepts, len(clients))
+
+    db.session.expire_all()
+    settled = db.session.execute(
+        select(Transaction.car_id, func.count())
+        .where(Transaction.car_id.in_(cars), Transaction.status.in_(('accepted', 'completed')))
+        .group_by(Transaction.car_id)
+    ).all()
+    results['invariant_held'] = len(settled) == len(cars) and all(count == 1 for _, count in settled)
+    return results
+
+
+def print_contention_report(results, dialect, buyers, hot_cars):
+    print(f"\nBackend: {dialect}, {buyers} concurrent buyers, {hot_cars} hot cars")
+    header = f"{'phase':<10}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'ok':>6}{'409':>6}{'5xx':>6}"
+    print(header)
+    print('-' * len(header))
+    for phase in ('offers', 'accepts'):
+        result = results[phase]
+        print(
+            f"{phase:<10}{result['requests']:>10}{result['throughput']:>9}{result['p50_ms']:>9}{result['p99_ms']:>9}"
+            f"{result['max_ms']:>9}{result['ok']:>6}{result['conflicts']:>6}{result['errors']:>6}"
+        )
+    print(f"\nOne accepted offer per car: {'yes' if results['invariant_held'] else 'NO'}")
+
+
+def _best_of(repeat, run):
+    """Run ``run()`` ``repeat`` times; returns its last result and the fastest time in ms."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, round(min(timings), 2)
+
+
+def run_serialization(app, db, rows, repeat):
+    """Time the ORM + serialize_* + jsonify path against the row encoders for ``rows`` rows per model."""
+    from flask import jsonify
+    from sqlalchemy.orm import joinedload
+    from models import Car, Transaction
+    import routes
+    from extensions import response_compression
+
+    orm_queries = {
+        'cars': lambda: Car.query.order_by(Car.id).limit(rows).all(),
+        'advertisements': lambda: routes.advertisement_listing_query().order_by(routes.Advertisement.id).limit(rows).all(),
+        'transactions': lambda: Transaction.query.options(
+            joinedload(Transaction.car_transaction), joinedload(Transaction.archived_car),
+            joinedload(Transaction.buyer), joinedload(Transaction.seller)
+        ).order_by(Transaction.id).limit(rows).all(),
+    }
+    serializers = {
+        'cars': routes.serialize_car, 'advertisements': routes.serialize_advertisement,
+        'transactions': routes.serialize_transaction,
+    }
+    # Each builds the endpoint's query for the ?fields= of the current request
+    row_queries = {
+        'cars': lambda: db.session.query(*routes.CAR_ENCODER.compile(routes.CAR_ENCODER.requested_fields()).columns),
+        'advertisements': lambda: routes.advertisement_rows()[0],
+        'transactions': lambda: routes.transaction_listing_query()[0],
+    }
+    encoders = {
+        'cars': routes.CAR_ENCODER, 'advertisements': routes.ADVERTISEMENT_ENCODER,
+        'transactions': routes.TRANSACTION_ENCODER,
+    }
+    id_columns = {'cars': Car.id, 'advertisements': routes.Advertisement.id, 'transactions': Transaction.id}
+    subsets = {'cars': 'id,make', 'advertisements': 'id,title,price', 'transactions': 'id,status,agreed_price'}
+
+    results = {}
+    # An admin session sees every transaction, like the unfiltered ORM query
+    admin = db.session.scalar(select(routes.User).where(routes.User.roles.any(name='Admin')).limit(1))
+    for name in orm_queries:
+        with app.test_request_context('/'):
+            routes.request.current_user = admin
+            db.session.expire_all()
+            objects, orm_load_ms = _best_of(repeat, orm_queries[name])
+            orm_body, orm_encode_ms = _best_of(
+                repeat, lambda: jsonify([serializers[name](obj) for obj in objects]).get_data()
+            )
+            encoder = encoders[name].compile()
+            query = row_queries[name]().order_by(id_columns[name]).limit(rows)
+            tuples, row_load_ms = _best_of(repeat, query.all)
+            row_body, row_encode_ms = _best_of(
+                repeat, lambda: routes.json_response(encoder.encode_rows(tuples)).get_data()
+            )
+        with app.test_request_context(f'/?fields={subsets[name]}'):
+            routes.request.current_user = admin
+            subset = encoders[name].compile(encoders[name].requested_fields())
+            subset_query = row_queries[name]().order_by(id_columns[name]).limit(rows)
+            subset_rows, subset_load_ms = _best_of(repeat, subset_query.all)
+            subset_body, subset_encode_ms = _best_of(repeat, lambda: subset.encode_rows(subset_rows).encode())
+
+        compressed = {}
+        for encoding in response_compression.encodings:
+            data, elapsed = _best_of(repeat, lambda: response_compression.compress(row_body, encoding))
+            compressed[encoding] = {'bytes': len(data), 'ms': elapsed}
+        results[name] = {
+            'rows': len(tuples),
+            'identical': orm_body == row_body,
+            'orm': {'load_ms': orm_load_ms, 'encode_ms': orm_encode_ms},
+            'row': {'load_ms': row_load_ms, 'encode_ms': row_encode_ms},
+            'fields': {'fields': subsets[name], 'load_ms': subset_load_ms, 'encode_ms': subset_encode_ms,
+                       'bytes': len(subset_body)},
+            'bytes': len(row_body),
+            'compressed': compressed,
+        }
+    return results
+
+
+def print_serialization_report(results, dialect):
+    print(f"\nBackend: {dialect} (best of the repeats)")
+    header = (f"{'endpoint':<16}{'rows':>7}{'path':>9}{'load ms':>10}{'encode ms':>11}{'total ms':>10}"
+              f"{'bytes':>10}{'same':>6}")
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        for path in ('orm', 'row', 'fields'):
+            timing = result[path]
+            size = timing['bytes'] if path == 'fields' else result['bytes']
+            same = 'yes' if result['identical'] else 'NO'
+            print(
+                f"{name if path == 'orm' else '':<16}{result['rows'] if path == 'orm' else '':>7}{path:>9}"
+                f"{timing['load_ms']:>10}{timing['encode_ms']:>11}{round(timing['load_ms'] + timing['encode_ms'], 2):>10}"
+                f"{size:>10}{same if path == 'row' else '':>6}"
+            )
+        for encoding, compressed in result['compressed'].items():
+            print(f"{'':<16}{'':>7}{encoding:>9}{'':>10}{compressed['ms']:>11}{'':>10}{compressed['bytes']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario.")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--scenario', action='append', help="Run only these scenarios (repeatable).")
+    parser.add_argument('--cache', action='store_true', help="Leave the result cache on.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Write the results as JSON.")
+    parser.add_argument('--baseline', help="Compare against a previous --output and exit 1 on regressions.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed latency growth vs the baseline.")
+    parser.add_argument('--contention', action='store_true', help="Run the concurrent offers benchmark instead.")
+    parser.add_argument('--buyers', type=int, default=16, help="Concurrent buyers for --contention.")
+    parser.add_argument('--hot-cars', type=int, default=5, help="Cars every buyer bids on for --contention.")
+    parser.add_argument('--serialization', action='store_true', help="Run the JSON serialization micro-benchmark instead.")
+    parser.add_argument('--rows', type=int, default=5000, help="Rows per endpoint for --serialization.")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed repeats per step for --serialization.")
+    args = parser.parse_args()
+
+    # Configuration is read when app.py is imported
+    if not args.cache:
+        os.environ['RESULT_CACHE_BACKEND'] = 'none'
+    os.environ.setdefault('METRICS_ENABLED', '0')
+
+    from app import app
+    from extensions import db
+    from models import Car, Advertisement, User, Transaction
+    import synthetic_data
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        sample = load_sample(db, (Car, Advertisement, User, Transaction), synthetic_data)
+        admin = db.session.scalar(select(User.mobile_number).where(User.roles.any(name='Admin')).limit(1))
+        counter = QueryCounter(db.engine)
+        dialect = db.engine.dialect.name
+
+    clients = {'anonymous': app.test_client(), 'admin': app.test_client(), 'user': app.test_client()}
+    logins = {'admin': (admin, 'adminpass'), 'user': (sample['buyer'], sample['password'])}
+    for name, (mobile, password) in logins.items():
+        response = clients[name].post('/login_api', json={'mobile_number': mobile, 'password': password})
+        if response.status_code != 200:
+            sys.exit(f"Could not log in the {name} client ({mobile}); run seed_db.py and synthetic_data.py first.")
+
+    if args.serialization:
+        with app.app_context():
+            results = run_serialization(app, db, args.rows, args.repeat)
+        print_serialization_report(results, dialect)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'backend': dialect, 'serialization': results}, f, indent=2)
+        sys.exit(0 if all(result['identical'] for result in results.values()) else 1)
+
+    if args.contention:
+        with app.app_context():
+            results = run_contention(
+                app, db, (Car, Advertisement, User, Transaction), sample, clients['admin'], args.buyers, args.hot_cars
+            )
+        print_contention_report(results, dialect, args.buyers, args.hot_cars)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'backend': dialect, 'contention': results}, f, indent=2)
+        sys.exit(0 if results['invariant_held'] else 1)
+
+    rng = random.Random(args.seed)
+    results = {}
+    for scenario in build_scenarios(sample):
+        if args.scenario and scenario.name not in args.scenario:
+            continue
+        print(f"Running {scenario.name}...", flush=True)
+        results[scenario.name] = run_scenario(scenario, clients, counter, rng, args.requests, args.warmup)
+
+    print_report(results, dialect)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': dialect, 'requests': args.requests, 'scenarios': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
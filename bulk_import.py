@@ -0,0 +1,332 @@
+import csv
+import io
+import json
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from flask import abort
+from sqlalchemy import bindparam, insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db, result_cache
+from models import Car, Advertisement
+from facets import facet_cell, apply_facet_deltas
+from price_trends import segment_of, record_price_changes, mark_segments_dirty
+from similarity import related_index
+from changefeed import record_listing_changes
+from saved_searches import REASON_NEW, REASON_REPRICED, Listing, notify_saved_searches
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+FEED_FORMATS = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+
+TEXT_LIMITS = {'make': 100, 'model': 100, 'color': 50, 'status': 50, 'ad_status': 50, 'title': 255, 'external_id': 100}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text_stream(stream):
+    if not isinstance(stream, io.BufferedIOBase) and hasattr(stream, 'readinto'):
+        stream = io.BufferedReader(stream)
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def _feed_format(mimetype, filename=None):
+    if mimetype in FEED_FORMATS:
+        return FEED_FORMATS[mimetype]
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        return {'json': 'json', 'ndjson': 'ndjson', 'jsonl': 'ndjson', 'csv': 'csv'}.get(extension)
+    return None
+
+
+def feed_rows(req):
+    """Yield ``(row_number, raw_row)`` from a JSON array, NDJSON or CSV upload.
+
+    NDJSON and CSV are read incrementally from the request stream; a raw
+    row that could not be decoded is yielded as a ``RowError``.
+    """
+    if req.mimetype == 'multipart/form-data':
+        upload = req.files.get('file')
+        if upload is None:
+            abort(400, description="Upload the feed as a 'file' field.")
+        stream, feed_format = upload.stream, _feed_format(upload.mimetype, upload.filename)
+    else:
+        stream, feed_format = req.stream, _feed_format(req.mimetype)
+
+    if feed_format is None:
+        abort(415, description="Feed must be JSON, NDJSON or CSV.")
+
+    text = _text_stream(stream)
+    if feed_format == 'json':
+        try:
+            rows = json.load(text)
+        except ValueError as e:
+            abort(400, description=f"Invalid JSON feed: {e}")
+        if not isinstance(rows, list):
+            abort(400, description="JSON feed must be an array of rows.")
+        return enumerate(rows, 1)
+    if feed_format == 'ndjson':
+        return _ndjson_rows(text)
+    return enumerate(csv.DictReader(text), 1)
+
+
+def _ndjson_rows(text):
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, RowError(f"Invalid JSON: {e}")
+
+
+def validate_row(raw):
+    if isinstance(raw, RowError):
+        raise raw
+    if not isinstance(raw, dict):
+        raise RowError("Row must be an object.")
+
+    row = dict(raw)
+    car = row.pop('car', None)
+    if isinstance(car, dict):
+        # Nested rows mirror POST /api/advertisements, where a top-level status is the ad's
+        if 'status' in row:
+            row['ad_status'] = row.pop('status')
+        row.update(car)
+
+    values = {}
+    for field in ('make', 'model', 'color', 'title'):
+        value = str(row.get(field) or '').strip()
+        if not value:
+            raise RowError(f"Missing {field}.")
+        values[field] = value
+
+    values['status'] = str(row.get('status') or 'used').strip()
+    values['ad_status'] = str(row.get('ad_status') or 'active').strip()
+    values['description'] = row.get('description') or None
+    external_id = row.get('external_id')
+    values['external_id'] = str(external_id).strip() if external_id not in (None, '') else None
+
+    for field, limit in TEXT_LIMITS.items():
+        if values[field] is not None and len(values[field]) > limit:
+            raise RowError(f"{field} is longer than {limit} characters.")
+
+    try:
+        values['year'] = int(row.get('year'))
+    except (TypeError, ValueError):
+        raise RowError("year must be an integer.")
+    if not 1886 <= values['year'] <= datetime.utcnow().year + 1:
+        raise RowError("year is out of range.")
+
+    try:
+        values['price'] = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise RowError("price must be a number.")
+    # NaN survives quantize and would make the range check below raise
+    if not values['price'].is_finite():
+        raise RowError("price must be a number.")
+    if not Decimal(0) <= values['price'] < Decimal(10) ** 13:
+        raise RowError("price is out of range.")
+
+    return values
+
+
+def _database_error(error):
+    # The driver's message names the constraint or column without echoing the statement
+    return f"{error.__class__.__name__}: {getattr(error, 'orig', None) or error}"
+
+
+class FeedImporter:
+    """Validate and write a dealer feed in batches.
+
+    Rows carrying an ``external_id`` are upserted against the dealer's
+    existing advertisements, so re-sending a feed only touches what changed.
+    A bad row is reported and skipped. When a batch fails in the database
+    it is written again one row per savepoint, so only the rows that fail
+    on their own are reported, with the database's error, and the rest
+    commit; earlier batches are never undone.
+    """
+
+    def __init__(self, user_id, batch_size=IMPORT_BATCH_SIZE):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.report = {'inserted': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+
+    def fail(self, row_number, external_id, message):
+        self.report['failed'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append({'row': row_number, 'external_id': external_id, 'error': message})
+
+    def run(self, rows):
+        batch = []
+        for row_number, raw in rows:
+            try:
+                batch.append((row_number, validate_row(raw)))
+            except RowError as e:
+                external_id = raw.get('external_id') if isinstance(raw, dict) else None
+                self.fail(row_number, external_id, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return self.report
+
+    def _flush(self, batch):
+        # Within a batch the last row for an external id wins, as it would across batches
+        latest = {}
+        for row_number, row in batch:
+            key = row['external_id'] if row['external_id'] is not None else ('row', row_number)
+            if key in latest:
+                self.report['skipped'] += 1
+            latest[key] = (row_number, row)
+        rows = list(latest.values())
+
+        try:
+            inserted, updated, stale_tags, car_ids = self._write([row for _, row in rows])
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            inserted, updated, stale_tags, car_ids = self._flush_rows(rows)
+
+        self.report['inserted'] += inserted
+        self.report['updated'] += updated
+        result_cache.invalidate('cars', 'search', *stale_tags)
+        related_index.refresh_cars(car_ids)
+
+    def _flush_rows(self, rows):
+        inserted = updated = 0
+        stale_tags, car_ids, written = set(), [], []
+        for row_number, row in rows:
+            try:
+                with db.session.begin_nested():
+                    row_inserted, row_updated, row_tags, row_car_ids = self._write([row])
+            except SQLAlchemyError as e:
+                self.fail(row_number, row['external_id'], _database_error(e))
+                continue
+            inserted += row_inserted
+            updated += row_updated
+            stale_tags.update(row_tags)
+            car_ids.extend(row_car_ids)
+            written.append((row_number, row))
+
+        try:
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            for row_number, row in written:
+                self.fail(row_number, row['external_id'], _database_error(e))
+            return 0, 0, set(), []
+        return inserted, updated, stale_tags, car_ids
+
+    def _write(self, rows):
+        cars, ads = Car.__table__, Advertisement.__table__
+        now = datetime.utcnow()
+
+        external_ids = [row['external_id'] for row in rows if row['external_id'] is not None]
+        existing = {}
+        if external_ids:
+            query = (
+                db.session.query(
+                    ads.c.external_id, ads.c.id, ads.c.car_id, ads.c.price, ads.c.status,
+                    cars.c.make, cars.c.model, cars.c.color, cars.c.status.label('car_status'), cars.c.year
+                )
+                .join(cars, cars.c.id == ads.c.car_id)
+                .filter(ads.c.user_id == self.user_id, ads.c.external_id.in_(external_ids))
+            )
+            existing = {match.external_id: match for match in query}
+
+        car_ids = [match.car_id for match in existing.values()]
+        inserts = [row for row in rows if row['external_id'] not in existing]
+        updates = [row for row in rows if row['external_id'] in existing]
+        deltas = Counter()
+        stale_tags = set()
+
+        if inserts:
+            new_car_ids = db.session.execute(
+                insert(cars).returning(cars.c.id, sort_by_parameter_order=True),
+                [{field: row[field] for field in ('make', 'model', 'year', 'color', 'status')} for row in inserts]
+            ).scalars().all()
+            new_ad_ids = db.session.execute(insert(ads).returning(ads.c.id, sort_by_parameter_order=True), [
+                {
+                    'title': row['title'],
+                    'description': row['description'],
+                    'price': row['price'],
+                    'status': row['ad_status'],
+                    'external_id': row['external_id'],
+                    'car_id': car_id,
+                    'user_id': self.user_id,
+                    'created_at': now,
+                    'updated_at': now,
+                }
+                for car_id, row in zip(new_car_ids, inserts)
+            ]).scalars().all()
+            record_price_changes([(car_id, row['price']) for car_id, row in zip(new_car_ids, inserts)], when=now)
+            car_ids.extend(new_car_ids)
+            notify_saved_searches([
+                Listing(ad_id, self.user_id, row['make'], row['model'], row['color'], row['status'], row['year'],
+                        row['price'], row['ad_status'])
+                for ad_id, row in zip(new_ad_ids, inserts)
+            ], REASON_NEW, when=now)
+
+        if updates:
+            db.session.execute(
+                cars.update().where(cars.c.id == bindparam('b_id')).values(
+                    make=bindparam('b_make'), model=bindparam('b_model'), year=bindparam('b_year'),
+                    color=bindparam('b_color'), status=bindparam('b_status'),
+                    version=cars.c.version + 1, updated_at=now
+                ),
+                [
+                    {'b_id': existing[row['external_id']].car_id, 'b_make': row['make'], 'b_model': row['model'],
+                     'b_year': row['year'], 'b_color': row['color'], 'b_status': row['status']}
+                    for row in updates
+                ]
+            )
+            db.session.execute(
+                ads.update().where(ads.c.id == bindparam('b_id')).values(
+                    title=bindparam('b_title'), description=bindparam('b_description'),
+                    price=bindparam('b_price'), status=bindparam('b_status'),
+                    version=ads.c.version + 1, updated_at=now
+                ),
+                [
+                    {'b_id': existing[row['external_id']].id, 'b_title': row['title'],
+                     'b_description': row['description'], 'b_price': row['price'], 'b_status': row['ad_status']}
+                    for row in updates
+                ]
+            )
+
+        segments = set()
+        for row in inserts + updates:
+            deltas[facet_cell(row['make'], row['color'], row['status'], row['year'], row['price'], row['ad_status'])] += 1
+            stale_tags.add(f"make:{row['make'].lower()}")
+            segments.add(segment_of(row['make'], row['model'], row['year']))
+        price_changes, repriced = [], []
+        for row in updates:
+            old = existing[row['external_id']]
+            deltas[facet_cell(old.make, old.color, old.car_status, old.year, old.price, old.status)] -= 1
+            stale_tags.update({f'car:{old.car_id}', f'ad:{old.id}', f'make:{old.make.strip().lower()}'})
+            segments.add(segment_of(old.make, old.model, old.year))
+            if row['price'] != old.price:
+                price_changes.append((old.car_id, row['price']))
+                repriced.append(Listing(old.id, self.user_id, row['make'], row['model'], row['color'], row['status'],
+                                        row['year'], row['price'], row['ad_status']))
+        apply_facet_deltas(deltas)
+        record_price_changes(price_changes, when=now)
+        notify_saved_searches(repriced, REASON_REPRICED, when=now)
+        record_listing_changes(car_ids)
+        mark_segments_dirty(segments)
+
+        return len(inserts), len(updates), stale_tags, car_ids
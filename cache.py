@@ -0,0 +1,273 @@
+import json
+import time
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from threading import Lock
+
+from flask import request, g, current_app, Response
+
+from routing import replica_binds, pinned_to_primary, served_from_replica
+from conditional import not_modified_etag
+
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+
+try:
+    import redis
+except ImportError:  # optional shared backend
+    redis = None
+
+
+class LocalLRUBackend:
+    """In-process LRU with a size bound and per-entry TTL."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Tag versions live apart from entries; an evicted version raises the floor
+        # reported for unknown tags, so it can never resurrect a stale entry
+        self._versions = OrderedDict()
+        self._version_floor = 0
+        self._lock = Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key.startswith('tag:'):
+                    found[key] = self._versions.get(key, self._version_floor)
+                    continue
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at is not None and expires_at <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._versions.pop(key, self._version_floor) + 1
+            self._versions[key] = value
+            while len(self._versions) > self.max_entries:
+                _, evicted = self._versions.popitem(last=False)
+                self._version_floor = max(self._version_floor + 1, evicted + 1)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version_floor = max(self._versions.values(), default=self._version_floor) + 1
+            self._versions.clear()
+
+
+class RedisBackend:
+    """Shared backend so every worker sees the same entries and invalidations.
+
+    Tag version keys carry no TTL; run Redis with a ``volatile-*`` eviction
+    policy so only cached results are evicted under memory pressure.
+    """
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("RESULT_CACHE_BACKEND='redis' requires the 'redis' package.")
+        self._client = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        values = self._client.mget(keys)
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, json.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+    def clear(self):
+        self._client.flushdb()
+
+
+class ResultCache:
+    """Response cache for anonymous read endpoints with tag-based invalidation.
+
+    Every entry remembers the version of each tag it depends on; writers bump
+    tag versions, so stale entries are detected on read without scanning.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_ttl = 60
+        self.replica_lag_seconds = 0
+        self._stats = defaultdict(lambda: defaultdict(int))
+        self._invalidated_tags = 0
+        self._stats_lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESULT_CACHE_BACKEND', 'local')
+        app.config.setdefault('RESULT_CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('RESULT_CACHE_TTL', 60)
+        app.config.setdefault('RESULT_CACHE_URL', None)
+
+        backend = app.config['RESULT_CACHE_BACKEND']
+        if backend == 'redis':
+            self.backend = RedisBackend(app.config['RESULT_CACHE_URL'])
+        elif backend == 'local':
+            self.backend = LocalLRUBackend(app.config['RESULT_CACHE_MAX_ENTRIES'])
+        else:
+            self.backend = None
+        self.default_ttl = app.config['RESULT_CACHE_TTL']
+        # A replica can serve pre-invalidation rows for about as long as writers stick to the primary
+        self.replica_lag_seconds = app.config.get('REPLICA_STICKY_SECONDS', 0) if replica_binds(app) else 0
+        app.extensions['result_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def _count(self, namespace, event, amount=1):
+        with self._stats_lock:
+            self._stats[namespace][event] += amount
+
+    def stats(self):
+        with self._stats_lock:
+            namespaces = {namespace: dict(counters) for namespace, counters in self._stats.items()}
+            invalidated_tags = self._invalidated_tags
+        for counters in namespaces.values():
+            lookups = counters.get('hits', 0) + counters.get('misses', 0)
+            counters['hit_ratio'] = round(counters.get('hits', 0) / lookups, 4) if lookups else None
+        return {'namespaces': namespaces, 'invalidated_tags': invalidated_tags}
+
+    def tag_versions(self, tags):
+        keys = [f'tag:{tag}' for tag in tags]
+        found = self.backend.get_many(keys)
+        return {tag: found.get(key, 0) for tag, key in zip(tags, keys)}
+
+    def invalidate(self, *tags):
+        if not self.enabled:
+            return
+        for tag in set(tags):
+            self.backend.incr(f'tag:{tag}')
+            if self.replica_lag_seconds:
+                self.backend.set(f'invalidated:{tag}', True, self.replica_lag_seconds)
+        with self._stats_lock:
+            self._invalidated_tags += len(set(tags))
+
+    def lookup(self, namespace, key):
+        entry = self.backend.get_many([key]).get(key)
+        if entry is not None:
+            current = self.tag_versions(list(entry['tags']))
+            if current == entry['tags']:
+                self._count(namespace, 'hits')
+                return entry
+            self.backend.delete(key)
+            self._count(namespace, 'stale')
+        self._count(namespace, 'misses')
+        return None
+
+    def recently_invalidated(self, tags):
+        """Whether any of ``tags`` changed within the replica lag window."""
+        if not self.replica_lag_seconds:
+            return False
+        return bool(self.backend.get_many([f'invalidated:{tag}' for tag in tags]))
+
+    def store(self, namespace, key, body, mimetype, headers, tags, ttl=None):
+        entry = {'body': body, 'mimetype': mimetype, 'headers': headers, 'tags': tags}
+        self.backend.set(key, entry, ttl or self.default_ttl)
+        self._count(namespace, 'stores')
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
+        with self._stats_lock:
+            self._stats.clear()
+            self._invalidated_tags = 0
+
+
+def normalized_cache_key(namespace):
+    """Cache key from the route, its path args and the sorted non-empty query params."""
+    params = sorted(
+        (name, ' '.join(value.split()).lower() if name in ('brand', 'model', 'color') else value.strip())
+        for name, value in request.args.items(multi=True)
+        if value.strip()
+    )
+    view_args = sorted((request.view_args or {}).items())
+    return f'result:{namespace}:{json.dumps([view_args, params], separators=(",", ":"))}'
+
+
+def tag_cached_result(*tags):
+    """Declare extra tags the response being built depends on.
+
+    Versions are read at call time, so call this before running the queries
+    the tags guard.
+    """
+    cache = current_app.extensions.get('result_cache')
+    if cache is None or not cache.enabled or 'cache_tags' not in g:
+        return
+    g.cache_tags.update(cache.tag_versions(list(tags)))
+
+
+def cached_result(namespace, tags=None, ttl=None):
+    """Serve a GET view from the result cache.
+
+    ``tags`` maps the view's keyword arguments to the tags its response
+    depends on; views can add more with ``tag_cached_result``. A browser
+    session pinned to the primary after a write bypasses the cache, and a
+    response read from a replica is not stored while any of its tags was
+    invalidated within the replica lag window.
+    """
+    def wrapper(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            cache = current_app.extensions.get('result_cache')
+            if cache is None or not cache.enabled:
+                return f(*args, **kwargs)
+            if pinned_to_primary():
+                # Entries may come from a replica that has not seen this session's write yet
+                response = current_app.make_response(f(*args, **kwargs))
+                response.headers['X-Cache'] = 'BYPASS'
+                return response
+
+            key = normalized_cache_key(namespace)
+            entry = cache.lookup(namespace, key)
+            if entry is not None:
+                response = Response(entry['body'], mimetype=entry['mimetype'], headers=entry.get('headers'))
+                response.headers['X-Cache'] = 'HIT'
+                etag = response.get_etag()[0]
+                # Last-Modified alone is left to make_conditional
+                current = etag and not_modified_etag(etag, None)
+                if current:
+                    not_modified = Response(status=304, headers={'X-Cache': 'HIT'})
+                    not_modified.set_etag(current)
+                    return not_modified
+                return response.make_conditional(request)
+
+            g.cache_tags = cache.tag_versions([namespace] + list(tags(**kwargs) if tags else []))
+            response = current_app.make_response(f(*args, **kwargs))
+            stale_risk = served_from_replica() and cache.recently_invalidated(g.cache_tags)
+            if response.status_code == 200 and not response.is_streamed and not stale_risk:
+                headers = {name: response.headers[name] for name in VALIDATOR_HEADERS if name in response.headers}
+                cache.store(namespace, key, response.get_data(as_text=True), response.mimetype, headers, g.cache_tags, ttl)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return decorated_function
+    return wrapper
@@ -0,0 +1,167 @@
+from datetime import datetime, timedelta
+from itertools import takewhile
+
+from flask import current_app
+from sqlalchemy import select, insert, delete, func, literal, event
+from sqlalchemy.orm import Session
+from werkzeug.exceptions import Gone
+
+from extensions import db
+from models import Advertisement, ListingChange
+
+CHANGE_UPSERT = 'upsert'
+CHANGE_DELETE = 'delete'
+
+
+class ChangeCursorExpired(Gone):
+    description = "This change cursor is older than the retained change log. Reload the listing and start over."
+
+
+def _queue_change(action, items):
+    # Tagged with the open savepoint, if any, so rolling it back drops the change too
+    session = db.session()
+    session.info.setdefault('listing_changes', []).append((session.get_nested_transaction(), action, items))
+
+
+def record_listing_changes(car_ids):
+    """Log an upsert for the advertisements of ``car_ids`` when the session commits."""
+    car_ids = list(car_ids)
+    if car_ids:
+        _queue_change(CHANGE_UPSERT, car_ids)
+
+
+def record_listing_deletion(ad_id, car_id):
+    record_listing_deletions([(ad_id, car_id)])
+
+
+def record_listing_deletions(pairs):
+    """Log a delete for each ``(ad_id, car_id)`` when the session commits."""
+    pairs = list(pairs)
+    if pairs:
+        _queue_change(CHANGE_DELETE, pairs)
+
+
+# Change rows take their id and timestamp as the last statement before commit, so the gap a
+# reader has to wait out is one commit, not the rest of the writer's transaction
+@event.listens_for(Session, 'before_commit')
+def _write_listing_changes(db_session):
+    if db_session.in_nested_transaction():
+        return
+    queued = db_session.info.pop('listing_changes', None)
+    if not queued:
+        return
+    db_session.flush()
+    now = datetime.utcnow()
+    for _, action, items in queued:
+        if action == CHANGE_UPSERT:
+            source = select(
+                Advertisement.id, Advertisement.car_id, literal(CHANGE_UPSERT), literal(now)
+            ).where(Advertisement.car_id.in_(items))
+            db_session.execute(insert(ListingChange.__table__).from_select(
+                ['advertisement_id', 'car_id', 'action', 'changed_at'], source
+            ))
+        else:
+            db_session.execute(insert(ListingChange.__table__), [
+                {'advertisement_id': ad_id, 'car_id': car_id, 'action': CHANGE_DELETE, 'changed_at': now}
+                for ad_id, car_id in items
+            ])
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_listing_changes(db_session, previous_transaction):
+    if not previous_transaction.nested:
+        db_session.info.pop('listing_changes', None)
+        return
+    queued = db_session.info.get('listing_changes')
+    if queued:
+        db_session.info['listing_changes'] = [
+            entry for entry in queued if not _within(entry[0], previous_transaction)
+        ]
+
+
+def _within(transaction, savepoint):
+    while transaction is not None:
+        if transaction is savepoint:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+def _settled_before():
+    # Two commits can still finish out of id order, so fresh rows wait out this window
+    return datetime.utcnow() - timedelta(seconds=current_app.config['CHANGE_FEED_SETTLE_SECONDS'])
+
+
+def head_change_id():
+    """The cursor position a client should start from before loading the listing."""
+    return db.session.scalar(
+        select(func.max(ListingChange.id)).where(ListingChange.changed_at <= _settled_before())
+    ) or 0
+
+
+def check_cursor_retained(since_id):
+    """Raise ``ChangeCursorExpired`` if changes after ``since_id`` have been pruned."""
+    oldest = db.session.scalar(select(func.min(ListingChange.id)))
+    if oldest is not None and since_id < oldest - 1:
+        raise ChangeCursorExpired()
+
+
+def listing_changes_since(since_id, limit):
+    """Collapse the changes after ``since_id`` into the latest action per advertisement.
+
+    Returns ``(upserted_ids, deleted_ids, last_id, has_more)``.
+    """
+    check_cursor_retained(since_id)
+    rows = db.session.execute(
+        select(ListingChange.id, ListingChange.advertisement_id, ListingChange.action, ListingChange.changed_at)
+        .where(ListingChange.id > since_id)
+        .order_by(ListingChange.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    settled_before = _settled_before()
+    settled = list(takewhile(lambda row: row.changed_at <= settled_before, rows))
+    if len(settled) < len(rows):
+        has_more = False
+
+    latest = {}
+    for row in settled:
+        latest[row.advertisement_id] = row.action
+    upserted = [ad_id for ad_id, action in latest.items() if action == CHANGE_UPSERT]
+    deleted = [ad_id for ad_id, action in latest.items() if action == CHANGE_DELETE]
+    last_id = settled[-1].id if settled else since_id
+    return upserted, deleted, last_id, has_more
+
+
+def prune_listing_changes(retention_days=None, batch_size=None, on_batch=None):
+    """Delete change log rows older than the retention window; returns how many went.
+
+    With ``batch_size`` the rows go in chunks, each its own transaction;
+    ``on_batch(rows)`` runs before each chunk commits.
+    """
+    if retention_days is None:
+        retention_days = current_app.config['CHANGE_LOG_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    # The newest row always stays, so SQLite never hands out a used id again
+    newest = db.session.scalar(select(func.max(ListingChange.id)))
+    if newest is None:
+        return 0
+    expired = (ListingChange.changed_at < cutoff, ListingChange.id < newest)
+    if batch_size is None:
+        result = db.session.execute(delete(ListingChange).where(*expired))
+        db.session.commit()
+        return result.rowcount
+
+    pruned = 0
+    while True:
+        chunk = select(ListingChange.id).where(*expired).order_by(ListingChange.id).limit(batch_size)
+        deleted = db.session.execute(delete(ListingChange).where(ListingChange.id.in_(chunk))).rowcount
+        if not deleted:
+            db.session.rollback()
+            return pruned
+        if on_batch is not None:
+            on_batch(deleted)
+        db.session.commit()
+        pruned += deleted
@@ -0,0 +1,81 @@
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # gzip only; install Brotli to also offer br
+    brotli = None
+
+DEFAULT_COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/css', 'text/csv', 'text/javascript')
+# Every coding any worker may send, whether or not Brotli is installed in this one
+CONTENT_CODINGS = ('br', 'gzip')
+
+
+def coded_etag(etag, encoding):
+    """The validator of ``etag``'s representation sent with ``encoding``."""
+    return f'{etag}-{encoding}'
+
+
+class ResponseCompression:
+    """Compresses response bodies with brotli or gzip, whichever the client prefers.
+
+    Streamed responses (exports, SSE, image files), responses that already
+    carry a Content-Encoding and bodies under ``COMPRESSION_MIN_BYTES`` go
+    out as they are. A compressed body is a different representation, so
+    its ETag gets the coding as a suffix (``"<tag>-gzip"``); the
+    ``conditional`` helpers accept those suffixed tags as the same version.
+    """
+
+    def __init__(self, app=None):
+        self.min_bytes = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+        self.mimetypes = frozenset(DEFAULT_COMPRESSIBLE_MIMETYPES)
+        self.encodings = CONTENT_CODINGS if brotli else ('gzip',)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESSION_ENABLED', True)
+        app.config.setdefault('COMPRESSION_MIN_BYTES', 1024)
+        app.config.setdefault('COMPRESSION_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESSION_BROTLI_QUALITY', 4)
+        app.config.setdefault('COMPRESSION_MIMETYPES', DEFAULT_COMPRESSIBLE_MIMETYPES)
+
+        self.min_bytes = app.config['COMPRESSION_MIN_BYTES']
+        self.gzip_level = app.config['COMPRESSION_GZIP_LEVEL']
+        self.brotli_quality = app.config['COMPRESSION_BROTLI_QUALITY']
+        self.mimetypes = frozenset(app.config['COMPRESSION_MIMETYPES'])
+        if app.config['COMPRESSION_ENABLED']:
+            app.after_request(self._compress)
+        app.extensions['response_compression'] = self
+
+    def negotiate(self):
+        # best_match honours q-values, including q=0 refusals; on a tie br wins
+        return request.accept_encodings.best_match(self.encodings)
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, mode=brotli.MODE_TEXT, quality=self.brotli_quality)
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def _compress(self, response):
+        if response.mimetype not in self.mimetypes or response.status_code in (204, 304) or response.status_code < 200:
+            return response
+        if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+            return response
+
+        # The body depends on Accept-Encoding whether or not this one is compressed
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        encoding = self.negotiate()
+        if encoding is None or len(data) < self.min_bytes:
+            return response
+        response.set_data(self.compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(coded_etag(etag, encoding), weak)
+        return response
@@ -0,0 +1,52 @@
+import hashlib
+
+from flask import request, make_response, abort
+
+from compression import CONTENT_CODINGS, coded_etag
+
+
+def etag_for(*parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return digest[:32]
+
+
+def _matching_etag(etags, etag):
+    # The client may hold the identity body or any compressed one; all name the same version
+    for candidate in (etag, *(coded_etag(etag, coding) for coding in CONTENT_CODINGS)):
+        if etags.contains(candidate):
+            return candidate
+    return None
+
+
+def not_modified_etag(etag, last_modified):
+    """The ETag to send with a 304 when the client's copy is current, else ``None``."""
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return _matching_etag(request.if_none_match, etag)
+    if request.if_modified_since and last_modified:
+        if last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None):
+            return etag
+    return None
+
+
+def conditional_response(etag, last_modified, build):
+    """Answer 304 when the client's copy is current, otherwise ``build()`` the body.
+
+    ``build`` is only called for a full response, so validators should be
+    cheap to compute from row versions.
+    """
+    current = not_modified_etag(etag, last_modified)
+    if current:
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+    response.set_etag(current or etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def require_if_match(etag):
+    """Reject a write with 412 when its If-Match names a different version."""
+    if request.if_match and not request.if_match.star_tag and not _matching_etag(request.if_match, etag):
+        abort(412, description="The resource was modified by someone else. Reload it and try again.")
@@ -0,0 +1,136 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+
+from flask import Response, request, abort, stream_with_context
+from sqlalchemy import select, func
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from models import Car, Advertisement, Transaction, User, ArchivedCar
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_BATCH_SIZE = 1000
+# Rows are buffered into chunks of roughly this size before being (compressed and) sent
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def advertisement_export_query():
+    publisher = aliased(User)
+    return (
+        select(
+            Advertisement.id, Advertisement.title, Advertisement.description, Advertisement.price,
+            Advertisement.status, Advertisement.created_at, Advertisement.updated_at,
+            Advertisement.car_id, Advertisement.user_id, Advertisement.external_id,
+            Car.make, Car.model, Car.year, Car.color, Car.status.label('car_status'),
+            publisher.mobile_number.label('publisher_mobile')
+        )
+        .join(Car, Car.id == Advertisement.car_id)
+        .outerjoin(publisher, publisher.id == Advertisement.user_id)
+        .order_by(Advertisement.id)
+    ), Advertisement.updated_at
+
+
+def transaction_export_query():
+    buyer, seller = aliased(User), aliased(User)
+    return (
+        select(
+            Transaction.id, Transaction.car_id, Transaction.buyer_id, Transaction.seller_id,
+            Transaction.status, Transaction.agreed_price, Transaction.transaction_date,
+            func.coalesce(Car.make, ArchivedCar.make).label('car_make'),
+            buyer.mobile_number.label('buyer_mobile'),
+            seller.mobile_number.label('seller_mobile')
+        )
+        .outerjoin(Car, Car.id == Transaction.car_id)
+        .outerjoin(ArchivedCar, ArchivedCar.id == Transaction.car_id)
+        .outerjoin(buyer, buyer.id == Transaction.buyer_id)
+        .outerjoin(seller, seller.id == Transaction.seller_id)
+        .order_by(Transaction.id)
+    ), Transaction.transaction_date
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _encode_rows(rows, columns, export_format):
+    if export_format == 'ndjson':
+        for row in rows:
+            yield json.dumps(dict(zip(columns, map(_plain, row))), separators=(',', ':')) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _chunked(pieces, compress):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    chunk, size = [], 0
+    for piece in pieces:
+        chunk.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_BYTES:
+            data = ''.join(chunk).encode()
+            chunk, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(chunk).encode()
+    if compressor:
+        yield compressor.compress(data) + compressor.flush()
+    elif data:
+        yield data
+
+
+def export_response(name, query_factory):
+    """Stream ``query_factory()``'s rows as NDJSON or CSV, optionally gzipped.
+
+    Rows are pulled through a server-side cursor in batches, so memory use
+    stays flat regardless of table size.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        abort(400, description=f"Invalid format. Must be one of: {', '.join(EXPORT_FORMATS)}.")
+
+    query, timestamp_column = query_factory()
+    since = request.args.get('since')
+    if since:
+        try:
+            query = query.where(timestamp_column >= datetime.fromisoformat(since))
+        except ValueError:
+            abort(400, description="since must be an ISO 8601 timestamp.")
+
+    # gzip;q=0 names gzip only to refuse it
+    compress = request.accept_encodings['gzip'] > 0
+    columns = [column.name for column in query.selected_columns]
+
+    def generate():
+        result = db.session.execute(
+            query.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        )
+        try:
+            yield from _chunked(_encode_rows(result, columns, export_format), compress)
+        finally:
+            result.close()
+
+    extension = 'ndjson' if export_format == 'ndjson' else 'csv'
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{extension}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -2,5 +2,17 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
-db = SQLAlchemy()
-migrate = Migrate()
\ No newline at end of file
+from cache import ResultCache
+from metrics import Metrics
+from routing import RoutingSession
+from passwords import PasswordHasher
+from images import ImageStore
+from compression import ResponseCompression
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
+result_cache = ResultCache()
+metrics = Metrics()
+password_hasher = PasswordHasher()
+image_store = ImageStore()
+response_compression = ResponseCompression()
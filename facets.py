@@ -0,0 +1,198 @@
+from decimal import Decimal
+
+from sqlalchemy import case, func, and_, literal, literal_column
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import Car, Advertisement, SearchFacetCount
+from search import text_filter, search_filters, fulltext_match
+
+# Lower edges of the price buckets; the last bucket is open-ended
+PRICE_BUCKET_EDGES = [0, 5000, 10000, 20000, 30000, 50000, 100000]
+
+FACET_DIMENSIONS = ('make', 'color', 'car_status', 'year', 'price_bucket', 'ad_status')
+
+
+def price_bucket(price):
+    price = Decimal(price)
+    bucket = 0
+    for i, edge in enumerate(PRICE_BUCKET_EDGES):
+        if price >= edge:
+            bucket = i
+    return bucket
+
+
+def price_bucket_expression(price_column):
+    # Literal edges keep the expression identical in SELECT and GROUP BY on PostgreSQL
+    whens = [(price_column >= literal_column(str(edge)), literal_column(str(i)))
+             for i, edge in reversed(list(enumerate(PRICE_BUCKET_EDGES)))]
+    return case(*whens, else_=literal_column('0'))
+
+
+def price_bucket_bounds(bucket):
+    upper = PRICE_BUCKET_EDGES[bucket + 1] if bucket + 1 < len(PRICE_BUCKET_EDGES) else None
+    return PRICE_BUCKET_EDGES[bucket], upper
+
+
+def facet_cell(make, color, car_status, year, price, ad_status):
+    return (make.strip().lower(), color.strip().lower(), car_status, year, price_bucket(price), ad_status)
+
+
+def facet_key(car, ad):
+    """The aggregate cell an advertised car is counted in."""
+    return facet_cell(car.make, car.color, car.status, car.year, ad.price, ad.status)
+
+
+def _upsert_counts(rows):
+    """Add each row's ``count`` to its cell, creating cells as needed."""
+    dialect = db.session.get_bind().dialect.name
+    table = SearchFacetCount.__table__
+
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(FACET_DIMENSIONS),
+            set_={'count': table.c.count + stmt.excluded.count}
+        )
+        # One statement for the whole batch, sent as an executemany
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        values = {name: row[name] for name in FACET_DIMENSIONS}
+        updated = db.session.execute(
+            table.update()
+            .where(and_(*[table.c[name] == value for name, value in values.items()]))
+            .values(count=table.c.count + row['count'])
+        )
+        if updated.rowcount == 0:
+            db.session.execute(table.insert().values(count=row['count'], **values))
+
+
+def _increment(key, delta):
+    _upsert_counts([dict(zip(FACET_DIMENSIONS, key), count=delta)])
+
+
+def record_facet_change(old_key, new_key):
+    """Move one listing between aggregate cells inside the caller's transaction.
+
+    Pass ``None`` for ``old_key`` on create and for ``new_key`` on delete.
+    """
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        _increment(old_key, -1)
+    if new_key is not None:
+        _increment(new_key, 1)
+
+
+def apply_facet_deltas(deltas):
+    """Apply a ``{cell: delta}`` mapping accumulated over a batch of writes."""
+    rows = [dict(zip(FACET_DIMENSIONS, key), count=delta) for key, delta in deltas.items() if delta]
+    if rows:
+        _upsert_counts(rows)
+
+
+def _live_dimensions():
+    return [
+        func.lower(func.trim(Car.make)).label('make'),
+        func.lower(func.trim(Car.color)).label('color'),
+        Car.status.label('car_status'),
+        Car.year.label('year'),
+        price_bucket_expression(Advertisement.price).label('price_bucket'),
+        Advertisement.status.label('ad_status'),
+    ]
+
+
+def rebuild_facet_counts():
+    """Recompute every aggregate cell from the live tables."""
+    table = SearchFacetCount.__table__
+    dimensions = _live_dimensions()
+    source = (
+        db.session.query(*dimensions, func.count().label('count'))
+        .join(Advertisement, Advertisement.car_id == Car.id)
+        .group_by(*[d.element for d in dimensions])
+    )
+    db.session.execute(table.delete())
+    db.session.execute(table.insert().from_select(list(FACET_DIMENSIONS) + ['count'], source))
+    db.session.commit()
+
+
+def _cube_filters(criteria):
+    cube = SearchFacetCount
+    match = criteria.get('match', 'contains')
+    filters = [cube.count > 0]
+
+    if criteria.get('min_price') is not None:
+        # Price filters apply at bucket granularity: any bucket overlapping the range counts
+        filters.append(cube.price_bucket >= price_bucket(criteria['min_price']))
+    if criteria.get('max_price') is not None:
+        filters.append(cube.price_bucket <= price_bucket(max(criteria['max_price'], 0)))
+    if criteria.get('min_year') is not None:
+        filters.append(cube.year >= criteria['min_year'])
+    if criteria.get('max_year') is not None:
+        filters.append(cube.year <= criteria['max_year'])
+    if criteria.get('brand'):
+        filters.append(text_filter(cube.make, criteria['brand'], match))
+    if criteria.get('color'):
+        filters.append(text_filter(cube.color, criteria['color'], match))
+    if criteria.get('status'):
+        filters.append(cube.car_status == criteria['status'])
+    if criteria.get('ad_status'):
+        filters.append(cube.ad_status == criteria['ad_status'])
+    return filters
+
+
+def _live_source(criteria):
+    query = (
+        db.session.query(*_live_dimensions(), literal(1).label('count'))
+        .join(Advertisement, Advertisement.car_id == Car.id)
+    )
+    filters = search_filters(criteria)
+    if filters:
+        query = query.filter(and_(*filters))
+    if criteria.get('text'):
+        query, _ = fulltext_match(query, criteria['text'], db.session.get_bind().dialect.name)
+    return query.subquery()
+
+
+def facet_counts(criteria):
+    """Per-dimension listing counts for a set of search criteria.
+
+    Served from ``search_facet_counts``; model and text filters are not cube
+    dimensions, so those requests fall back to aggregating the live tables.
+    """
+    if criteria.get('model') or criteria.get('text'):
+        source = _live_source(criteria)
+        filters = []
+    else:
+        source = SearchFacetCount.__table__
+        filters = _cube_filters(criteria)
+
+    facets = {}
+    for dimension in FACET_DIMENSIONS:
+        column = source.c[dimension]
+        query = db.session.query(column, func.sum(source.c['count'])).group_by(column)
+        if filters:
+            query = query.filter(and_(*filters))
+        facets[dimension] = [(value, int(total)) for value, total in query.all() if total]
+
+    return {
+        'makes': _named(facets['make']),
+        'colors': _named(facets['color']),
+        'statuses': _named(facets['car_status']),
+        'ad_statuses': _named(facets['ad_status']),
+        'years': sorted(({'value': year, 'count': n} for year, n in facets['year']), key=lambda f: f['value']),
+        'price_buckets': [_bucket(bucket, n) for bucket, n in sorted(facets['price_bucket'])],
+        'total': sum(n for _, n in facets['make']),
+    }
+
+
+def _named(pairs):
+    return sorted(({'value': value, 'count': n} for value, n in pairs), key=lambda f: (-f['count'], f['value']))
+
+
+def _bucket(bucket, count):
+    lower, upper = price_bucket_bounds(bucket)
+    return {'min': lower, 'max': upper, 'count': count}
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from flask import abort, send_file
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+ORIGINAL = 'original'
+# rendition -> longest edge in pixels; renditions are always JPEG
+RENDITIONS = {'thumb': 320, 'medium': 1280}
+RENDITION_QUALITY = 82
+# Pillow format -> (file extension, mimetype) accepted for originals
+UPLOAD_FORMATS = {'JPEG': ('jpg', 'image/jpeg'), 'PNG': ('png', 'image/png'), 'WEBP': ('webp', 'image/webp')}
+MIMETYPES = {extension: mimetype for extension, mimetype in UPLOAD_FORMATS.values()}
+CHUNK_SIZE = 64 * 1024
+# Stored files never change under a URL, so clients may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASH_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+class ImageStore:
+    """Content-addressed storage for uploaded car images and their renditions.
+
+    Files live under ``IMAGE_STORAGE_PATH/<rendition>/ab/cd/<sha256>.<ext>``, so
+    the same upload is only stored once. Renditions are rendered by a small
+    thread pool after upload, and on demand if a request beats the pool.
+    """
+
+    def __init__(self, app=None):
+        self.root = None
+        self.url_prefix = '/media/images'
+        self.max_bytes = 10 * 1024 * 1024
+        self.max_pixels = 40_000_000
+        self.workers = 0
+        self._logger = None
+        self._pool = None
+        self._pool_pid = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_STORAGE_PATH', os.path.join(app.instance_path, 'images'))
+        app.config.setdefault('IMAGE_URL_PREFIX', '/media/images')
+        app.config.setdefault('IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+        app.config.setdefault('IMAGE_MAX_PIXELS', 40_000_000)
+        app.config.setdefault('IMAGE_RENDITION_WORKERS', 2)
+
+        self.root = app.config['IMAGE_STORAGE_PATH']
+        self.url_prefix = app.config['IMAGE_URL_PREFIX'].rstrip('/')
+        self.max_bytes = app.config['IMAGE_MAX_BYTES']
+        self.max_pixels = app.config['IMAGE_MAX_PIXELS']
+        self.workers = app.config['IMAGE_RENDITION_WORKERS']
+        self._logger = app.logger
+        app.add_url_rule(f'{self.url_prefix}/<content_hash>/<name>', 'car_image_file', self.serve)
+        app.extensions['image_store'] = self
+
+    def path(self, content_hash, rendition, extension):
+        # Two levels of fan-out keep each directory small
+        return os.path.join(self.root, rendition, content_hash[:2], content_hash[2:4], f'{content_hash}.{extension}')
+
+    def url(self, content_hash, rendition, extension='jpg'):
+        return f'{self.url_prefix}/{content_hash}/{rendition}.{extension}'
+
+    def store(self, upload):
+        """Stream an uploaded file into storage and return its metadata.
+
+        The upload is hashed while it is copied, so it is read once and never
+        held in memory; an identical file that is already stored is reused.
+        """
+        staging = os.path.join(self.root, 'tmp')
+        os.makedirs(staging, exist_ok=True)
+        fd, staged = tempfile.mkstemp(dir=staging)
+        try:
+            digest, size = hashlib.sha256(), 0
+            with os.fdopen(fd, 'wb') as out:
+                while chunk := upload.stream.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        abort(413, description=f"Images may be at most {self.max_bytes // (1024 * 1024)} MB.")
+                    digest.update(chunk)
+                    out.write(chunk)
+            image_format, width, height = self._inspect(staged)
+            extension, mimetype = UPLOAD_FORMATS[image_format]
+            content_hash = digest.hexdigest()
+            target = self.path(content_hash, ORIGINAL, extension)
+            if os.path.exists(target):
+                os.remove(staged)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(staged, target)
+        except BaseException:
+            if os.path.exists(staged):
+                os.remove(staged)
+            raise
+        return {
+            'content_hash': content_hash,
+            'content_type': mimetype,
+            'extension': extension,
+            'width': width,
+            'height': height,
+            'byte_size': size,
+        }
+
+    def _inspect(self, path):
+        try:
+            with Image.open(path) as image:
+                image_format, (width, height) = image.format, image.size
+                if image_format not in UPLOAD_FORMATS:
+                    abort(415, description=f"Unsupported image type. Use one of: {', '.join(UPLOAD_FORMATS)}.")
+                # Refuse decompression bombs before anything decodes the pixels
+                if width * height > self.max_pixels:
+                    abort(413, description="Image dimensions are too large.")
+                image.verify()
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+            abort(400, description="The uploaded file is not a valid image.")
+        return image_format, width, height
+
+    def render(self, content_hash, extension):
+        """Write every missing rendition of a stored original."""
+        missing = {
+            name: edge for name, edge in RENDITIONS.items()
+            if not os.path.exists(self.path(content_hash, name, 'jpg'))
+        }
+        if not missing:
+            return
+        with Image.open(self.path(content_hash, ORIGINAL, extension)) as image:
+            largest = max(missing.values())
+            # JPEGs decode straight at a reduced scale, which is most of the work saved
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            for name, edge in sorted(missing.items(), key=lambda item: -item[1]):
+                image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+                self._write_atomically(image, self.path(content_hash, name, 'jpg'))
+
+    def _write_atomically(self, image, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, staged = tempfile.mkstemp(dir=os.path.dirname(target))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, 'JPEG', quality=RENDITION_QUALITY, optimize=True, progressive=True)
+            os.replace(staged, target)
+        except BaseException:
+            if os.path.exists(staged):
+                os.remove(staged)
+            raise
+
+    def _executor(self):
+        # Threads do not survive fork, so each web worker process starts its own pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='image-renditions')
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def schedule_renditions(self, content_hash, extension):
+        if not self.workers:
+            self.render(content_hash, extension)
+            return
+        future = self._executor().submit(self.render, content_hash, extension)
+        future.add_done_callback(lambda f: self._log_failure(f, content_hash))
+
+    def _log_failure(self, future, content_hash):
+        if future.exception() is not None:
+            self._logger.error('Rendering image %s failed: %s', content_hash, future.exception())
+
+    def _original_extension(self, content_hash):
+        for extension in MIMETYPES:
+            if os.path.exists(self.path(content_hash, ORIGINAL, extension)):
+                return extension
+        return None
+
+    def serve(self, content_hash, name):
+        rendition, _, extension = name.partition('.')
+        if not HASH_PATTERN.fullmatch(content_hash) or extension not in MIMETYPES:
+            abort(404)
+        if rendition != ORIGINAL and (rendition not in RENDITIONS or extension != 'jpg'):
+            abort(404)
+
+        path = self.path(content_hash, rendition, extension)
+        if not os.path.exists(path):
+            original = self._original_extension(content_hash) if rendition != ORIGINAL else None
+            if original is None:
+                abort(404)
+            self.render(content_hash, original)
+
+        # conditional=True answers If-None-Match and Range requests (206) from the file
+        response = send_file(
+            path, mimetype=MIMETYPES[extension], conditional=True,
+            etag=f'{content_hash}-{rendition}', max_age=IMMUTABLE_MAX_AGE
+        )
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=True)
+            self._pool = None
@@ -0,0 +1,207 @@
+import os
+import socket
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from sqlalchemy import select, update, or_
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import JobState
+
+JOB_IDLE = 'idle'
+JOB_RUNNING = 'running'
+JOB_FAILED = 'failed'
+
+Job = namedtuple('Job', 'name run interval_setting')
+
+
+class LeaseLost(RuntimeError):
+    pass
+
+
+class JobProgress:
+    """Handed to a running job; ``advance`` is called once per batch, before the batch commits.
+
+    The progress update and lease extension ride in the batch's own
+    transaction, so the recorded progress never runs ahead of the data.
+    """
+
+    def __init__(self, runner, name):
+        self.runner = runner
+        self.name = name
+        self.processed = 0
+        self.batches = 0
+        self.started = time.monotonic()
+
+    def advance(self, rows):
+        self.processed += rows
+        self.batches += 1
+        result = db.session.execute(
+            update(JobState)
+            .where(JobState.name == self.name, JobState.lease_owner == self.runner.owner)
+            .values(
+                processed=self.processed, batches=self.batches,
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=self.runner.lease_seconds)
+            )
+        )
+        if result.rowcount == 0:
+            raise LeaseLost(f"Job {self.name} lost its lease.")
+        self.runner.logger.info(
+            'Job %s: batch %d, %d rows so far (%.1fs)', self.name, self.batches, self.processed,
+            time.monotonic() - self.started
+        )
+
+
+class JobRunner:
+    """Periodic background jobs with their schedule and state kept in ``job_states``.
+
+    Any number of runners, in web workers (``JOB_RUNNER_IN_PROCESS``) or a
+    ``flask run-jobs`` sidecar, may poll the same database: a job runs only
+    in the runner that wins its lease, and a lease left by a crashed runner
+    lapses after ``JOB_LEASE_SECONDS`` without a batch.
+    """
+
+    def __init__(self, app=None):
+        self.jobs = {}
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self.poll_seconds = 30
+        self.lease_seconds = 300
+        self.batch_size = 500
+        self.logger = None
+        self._app = None
+        self._thread = None
+        self._thread_pid = None
+        self._stop = Event()
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_POLL_SECONDS', 30)
+        app.config.setdefault('JOB_LEASE_SECONDS', 300)
+        app.config.setdefault('JOB_BATCH_SIZE', 500)
+        app.config.setdefault('JOB_RUNNER_IN_PROCESS', False)
+
+        self.poll_seconds = app.config['JOB_POLL_SECONDS']
+        self.lease_seconds = app.config['JOB_LEASE_SECONDS']
+        self.batch_size = app.config['JOB_BATCH_SIZE']
+        self.logger = app.logger
+        self._app = app
+        if app.config['JOB_RUNNER_IN_PROCESS']:
+            # Started on the first request, so every forked worker gets its own thread
+            app.before_request(self._ensure_started)
+        app.extensions['job_runner'] = self
+
+    def register(self, name, interval_setting):
+        """Decorator adding ``run(progress)`` as a job repeated every ``config[interval_setting]`` seconds."""
+        def decorator(run):
+            self.jobs[name] = Job(name, run, interval_setting)
+            return run
+        return decorator
+
+    def _interval(self, job):
+        return timedelta(seconds=self._app.config[job.interval_setting])
+
+    def _ensure_state(self, name):
+        if db.session.get(JobState, name) is None:
+            db.session.add(JobState(name=name))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+
+    def _acquire(self, name, force):
+        now = datetime.utcnow()
+        conditions = [JobState.name == name, or_(JobState.lease_expires_at.is_(None), JobState.lease_expires_at < now)]
+        if not force:
+            conditions.append(or_(JobState.next_run_at.is_(None), JobState.next_run_at <= now))
+        result = db.session.execute(
+            update(JobState).where(*conditions).values(
+                status=JOB_RUNNING, lease_owner=self.owner,
+                lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                last_started_at=now, processed=0, batches=0, last_error=None,
+            )
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def run_job(self, name, force=False):
+        """Run one job if it is due (or ``force``) and no other runner holds it.
+
+        Returns its report, or ``None`` when the job was skipped.
+        """
+        job = self.jobs[name]
+        self._ensure_state(name)
+        if not self._acquire(name, force):
+            return None
+
+        progress = JobProgress(self, name)
+        error = None
+        try:
+            job.run(progress)
+        except Exception as e:
+            db.session.rollback()
+            error = f'{e.__class__.__name__}: {e}'
+            self.logger.exception('Job %s failed', name)
+
+        finished = datetime.utcnow()
+        duration_ms = round((time.monotonic() - progress.started) * 1000)
+        db.session.execute(
+            update(JobState)
+            .where(JobState.name == name, JobState.lease_owner == self.owner)
+            .values(
+                status=JOB_FAILED if error else JOB_IDLE, lease_owner=None, lease_expires_at=None,
+                last_finished_at=finished, last_duration_ms=duration_ms, next_run_at=finished + self._interval(job),
+                last_error=error,
+            )
+        )
+        db.session.commit()
+        self.logger.info('Job %s %s: %d rows in %d batches, %d ms', name, 'failed' if error else 'finished',
+                         progress.processed, progress.batches, duration_ms)
+        return {
+            'job': name, 'status': JOB_FAILED if error else JOB_IDLE, 'processed': progress.processed,
+            'batches': progress.batches, 'duration_ms': duration_ms, 'error': error,
+        }
+
+    def run_pending(self):
+        """Run every due job once; returns the reports of those that ran."""
+        reports = []
+        for name in self.jobs:
+            report = self.run_job(name)
+            if report is not None:
+                reports.append(report)
+        return reports
+
+    def run_forever(self, stop=None):
+        stop = stop or self._stop
+        while not stop.is_set():
+            with self._app.app_context():
+                try:
+                    self.run_pending()
+                except Exception:
+                    self.logger.exception('Job runner poll failed')
+                finally:
+                    db.session.remove()
+            stop.wait(self.poll_seconds)
+
+    def _ensure_started(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                self.owner = f'{socket.gethostname()}:{os.getpid()}'
+                self._thread = Thread(target=self.run_forever, name='job-runner', daemon=True)
+                self._thread.start()
+                self._thread_pid = os.getpid()
+
+    def states(self):
+        return db.session.scalars(select(JobState).where(JobState.name.in_(list(self.jobs))).order_by(JobState.name)).all()
+
+    def shutdown(self):
+        self._stop.set()
+
+
+job_runner = JobRunner()
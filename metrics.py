@@ -0,0 +1,198 @@
+import hmac
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+from flask import g, request, has_request_context, Response, abort
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+EXPOSITION_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LOOPBACK_ADDRESSES = frozenset({'127.0.0.1', '::1'})
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a label tuple, as Prometheus expects."""
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_labels(self.label_names + ("le",), labels + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_sum{base} {total}')
+            lines.append(f'{self.name}_count{base} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._series = defaultdict(int)
+
+    def inc(self, labels, amount=1):
+        self._series[labels] += amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'none'
+
+
+class Metrics:
+    """Request latency, per-request SQL counts/time and slow-query logging.
+
+    Every worker process keeps its own series; scrape each one. With
+    ``METRICS_ENABLED`` off no hooks are installed at all. ``/metrics`` is
+    only routed with ``METRICS_ENDPOINT_ENABLED`` and then answers
+    ``Authorization: Bearer <METRICS_TOKEN>``, or loopback scrapes when no
+    token is set. The ``Server-Timing`` header goes out only with
+    ``SERVER_TIMING_ENABLED``.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_query_seconds = 0.2
+        self.token = None
+        self.server_timing = False
+        self._lock = Lock()
+        self.request_latency = Histogram(
+            'http_request_duration_seconds', 'Time spent handling a request.',
+            ('endpoint', 'method'), LATENCY_BUCKETS
+        )
+        self.requests = Counter('http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+        self.request_queries = Histogram(
+            'http_request_sql_queries', 'SQL statements executed per request.', ('endpoint',), QUERY_COUNT_BUCKETS
+        )
+        self.request_sql_time = Histogram(
+            'http_request_sql_duration_seconds', 'Time spent in SQL per request.', ('endpoint',), LATENCY_BUCKETS
+        )
+        self.slow_queries = Counter('sql_slow_queries_total', 'Statements slower than the slow-query threshold.', ('endpoint',))
+        self.retries = Counter('sql_transaction_retries_total', 'Transactions run again after lock contention.', ('operation',))
+        self._logger = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, db=None):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 200)
+        app.config.setdefault('METRICS_ENDPOINT_ENABLED', False)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('SERVER_TIMING_ENABLED', False)
+        app.extensions['metrics'] = self
+        self.enabled = app.config['METRICS_ENABLED']
+        if not self.enabled:
+            return
+
+        self.slow_query_seconds = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+        self.token = app.config['METRICS_TOKEN']
+        self.server_timing = app.config['SERVER_TIMING_ENABLED']
+        self._logger = app.logger
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        if app.config['METRICS_ENDPOINT_ENABLED']:
+            app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        if db is not None:
+            with app.app_context():
+                for engine in db.engines.values():
+                    event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = _endpoint()
+        with self._lock:
+            self.request_latency.observe((endpoint, request.method), elapsed)
+            self.requests.inc((endpoint, request.method, str(response.status_code)))
+            self.request_queries.observe((endpoint,), g.sql_queries)
+            self.request_sql_time.observe((endpoint,), g.sql_seconds)
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_queries} queries", app;dur={elapsed * 1000:.1f}'
+            )
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_started'].pop()
+        if has_request_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_seconds += elapsed
+        if elapsed >= self.slow_query_seconds:
+            endpoint = _endpoint()
+            with self._lock:
+                self.slow_queries.inc((endpoint,))
+            self._logger.warning('Slow query (%.1f ms) in %s: %s', elapsed * 1000, endpoint, ' '.join(statement.split())[:1000])
+
+    def record_retry(self, operation):
+        with self._lock:
+            self.retries.inc((operation,))
+
+    def expose(self):
+        with self._lock:
+            lines = []
+            for metric in (
+                self.request_latency, self.requests, self.request_queries, self.request_sql_time, self.slow_queries,
+                self.retries
+            ):
+                lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+    def _authorized(self):
+        if not self.token:
+            return request.remote_addr in LOOPBACK_ADDRESSES
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), self.token.encode())
+
+    def metrics_view(self):
+        if not self._authorized():
+            abort(403, description="Metrics are only served to authorized scrapers.")
+        return Response(self.expose(), mimetype=EXPOSITION_MIMETYPE)
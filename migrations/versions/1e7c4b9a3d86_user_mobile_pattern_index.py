@@ -0,0 +1,26 @@
+"""Pattern index for mobile number prefix search
+
+Revision ID: 1e7c4b9a3d86
+Revises: 6a1f9c3e7d52
+Create Date: 2026-10-19 14:21:40.318257
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e7c4b9a3d86'
+down_revision = '6a1f9c3e7d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE INDEX ix_users_mobile_number_pattern ON users (mobile_number varchar_pattern_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_users_mobile_number_pattern')
@@ -0,0 +1,30 @@
+"""Dirty price segments, recomputed by the rollup job instead of by writers
+
+Revision ID: 2d8e4b7a9f35
+Revises: 9c3f6a2e8b71
+Create Date: 2026-10-19 10:12:40.318264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d8e4b7a9f35'
+down_revision = '9c3f6a2e8b71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('dirty_price_segments',
+    sa.Column('make', sa.String(length=100), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('year', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('marked_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('make', 'model', 'year')
+    )
+
+
+def downgrade():
+    op.drop_table('dirty_price_segments')
@@ -0,0 +1,61 @@
+"""Full-text search over advertisement title and description
+
+Revision ID: 3c8f5a2d9e71
+Revises: b6e1d4f8a3c5
+Create Date: 2026-10-18 16:12:09.418263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8f5a2d9e71'
+down_revision = 'b6e1d4f8a3c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # The generated column is filled in for existing rows as part of the ALTER
+        op.execute(
+            "ALTER TABLE advertisements ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED"
+        )
+        op.execute('CREATE INDEX ix_advertisements_search_vector ON advertisements USING gin (search_vector)')
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE advertisements_fts USING fts5("
+            "title, description, content='advertisements', content_rowid='id', tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER advertisements_fts_ai AFTER INSERT ON advertisements BEGIN "
+            "INSERT INTO advertisements_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER advertisements_fts_ad AFTER DELETE ON advertisements BEGIN "
+            "INSERT INTO advertisements_fts(advertisements_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER advertisements_fts_au AFTER UPDATE OF title, description ON advertisements BEGIN "
+            "INSERT INTO advertisements_fts(advertisements_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            "INSERT INTO advertisements_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+        )
+        op.execute("INSERT INTO advertisements_fts(advertisements_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_advertisements_search_vector')
+        op.execute('ALTER TABLE advertisements DROP COLUMN IF EXISTS search_vector')
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS advertisements_fts_au')
+        op.execute('DROP TRIGGER IF EXISTS advertisements_fts_ad')
+        op.execute('DROP TRIGGER IF EXISTS advertisements_fts_ai')
+        op.execute('DROP TABLE IF EXISTS advertisements_fts')
@@ -0,0 +1,24 @@
+"""Index car images by car
+
+Revision ID: 4c2a8e6f1b39
+Revises: 1e7c4b9a3d86
+Create Date: 2026-10-19 16:08:12.551904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2a8e6f1b39'
+down_revision = '1e7c4b9a3d86'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_car_images_car_id_id', 'car_images', ['car_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_car_images_car_id_id', table_name='car_images')
@@ -0,0 +1,50 @@
+"""Allow several offers per car; enforce a single accepted offer with partial unique indexes
+
+Revision ID: 4e9a1c6b2d58
+Revises: f5b3e8d2a417
+Create Date: 2026-10-18 21:07:41.305219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e9a1c6b2d58'
+down_revision = 'f5b3e8d2a417'
+branch_labels = None
+depends_on = None
+
+PENDING = sa.text("status = 'pending'")
+SETTLED = sa.text("status IN ('accepted', 'completed')")
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        # The initial schema left the constraint unnamed; name it on reflection so the table copy can drop it
+        with op.batch_alter_table(
+            'transactions', schema=None, naming_convention={'uq': '%(table_name)s_%(column_0_name)s_key'}
+        ) as batch_op:
+            batch_op.drop_constraint('transactions_car_id_key', type_='unique')
+    else:
+        op.drop_constraint('transactions_car_id_key', 'transactions', type_='unique')
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_transactions_car_id'), ['car_id'], unique=False)
+        batch_op.create_index(
+            'uq_transactions_car_id_buyer_id_pending', ['car_id', 'buyer_id'], unique=True,
+            postgresql_where=PENDING, sqlite_where=PENDING
+        )
+        batch_op.create_index(
+            'uq_transactions_car_id_settled', ['car_id'], unique=True,
+            postgresql_where=SETTLED, sqlite_where=SETTLED
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('uq_transactions_car_id_settled')
+        batch_op.drop_index('uq_transactions_car_id_buyer_id_pending')
+        batch_op.drop_index(batch_op.f('ix_transactions_car_id'))
+        # Fails while any car still has more than one offer
+        batch_op.create_unique_constraint('transactions_car_id_key', ['car_id'])
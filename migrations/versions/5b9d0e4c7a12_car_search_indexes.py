@@ -0,0 +1,40 @@
+"""Car search indexes
+
+Revision ID: 5b9d0e4c7a12
+Revises: a3c5e81f2d47
+Create Date: 2026-10-18 10:03:55.114092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9d0e4c7a12'
+down_revision = 'a3c5e81f2d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_cars_lower_make_model_year', 'cars',
+                    [sa.text('lower(make)'), sa.text('lower(model)'), 'year'], unique=False)
+    op.create_index('ix_cars_lower_color', 'cars', [sa.text('lower(color)')], unique=False)
+    op.create_index('ix_advertisements_status_price_id', 'advertisements', ['status', 'price', 'id'], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX ix_cars_make_trgm ON cars USING gin (lower(make) gin_trgm_ops)')
+        op.execute('CREATE INDEX ix_cars_model_trgm ON cars USING gin (lower(model) gin_trgm_ops)')
+        op.execute('CREATE INDEX ix_cars_color_trgm ON cars USING gin (lower(color) gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_cars_color_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_cars_model_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_cars_make_trgm')
+
+    op.drop_index('ix_advertisements_status_price_id', table_name='advertisements')
+    op.drop_index('ix_cars_lower_color', table_name='cars')
+    op.drop_index('ix_cars_lower_make_model_year', table_name='cars')
@@ -0,0 +1,48 @@
+"""Index substring saved searches under a trigram of their term
+
+Revision ID: 6a1f9c3e7d52
+Revises: 2d8e4b7a9f35
+Create Date: 2026-10-19 11:02:17.904532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1f9c3e7d52'
+down_revision = '2d8e4b7a9f35'
+branch_labels = None
+depends_on = None
+
+TEXT_FIELDS = ('brand', 'model', 'color')
+
+terms = sa.table('saved_search_terms', sa.column('field', sa.String), sa.column('term', sa.String))
+
+
+def upgrade():
+    # substr and length count characters, as the Python slicing in saved_searches does
+    for field in TEXT_FIELDS:
+        op.execute(
+            terms.update()
+            .where(terms.c.field == field, sa.func.length(terms.c.term) >= 3)
+            .values(field=f'{field}_gram', term=sa.func.substr(terms.c.term, 1, 3))
+        )
+        op.execute(terms.update().where(terms.c.field == field).values(field=f'{field}_short'))
+
+
+def downgrade():
+    searches = sa.table(
+        'saved_searches', sa.column('id', sa.Integer), *(sa.column(field, sa.String) for field in TEXT_FIELDS)
+    )
+    anchored = sa.table('saved_search_terms', sa.column('field', sa.String), sa.column('term', sa.String),
+                        sa.column('saved_search_id', sa.Integer))
+    for field in TEXT_FIELDS:
+        op.execute(
+            anchored.update()
+            .where(anchored.c.field.in_([f'{field}_gram', f'{field}_short']))
+            .values(
+                field=field,
+                term=sa.select(searches.c[field]).where(searches.c.id == anchored.c.saved_search_id).scalar_subquery()
+            )
+        )
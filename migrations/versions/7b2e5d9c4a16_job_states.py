@@ -0,0 +1,42 @@
+"""Background job state and the ad expiry index
+
+Revision ID: 7b2e5d9c4a16
+Revises: 4e9a1c6b2d58
+Create Date: 2026-10-18 22:31:55.604812
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2e5d9c4a16'
+down_revision = '4e9a1c6b2d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_states',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('lease_owner', sa.String(length=100), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('next_run_at', sa.DateTime(), nullable=True),
+    sa.Column('last_started_at', sa.DateTime(), nullable=True),
+    sa.Column('last_finished_at', sa.DateTime(), nullable=True),
+    sa.Column('last_duration_ms', sa.Integer(), nullable=True),
+    sa.Column('processed', sa.Integer(), nullable=False),
+    sa.Column('batches', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    with op.batch_alter_table('advertisements', schema=None) as batch_op:
+        batch_op.create_index('ix_advertisements_status_created_at_id', ['status', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('advertisements', schema=None) as batch_op:
+        batch_op.drop_index('ix_advertisements_status_created_at_id')
+
+    op.drop_table('job_states')
@@ -0,0 +1,28 @@
+"""Dealer external id on advertisements
+
+Revision ID: 7f2e9a1b4c68
+Revises: e4a7b2c9f013
+Create Date: 2026-10-18 13:31:46.092711
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f2e9a1b4c68'
+down_revision = 'e4a7b2c9f013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('advertisements', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('external_id', sa.String(length=100), nullable=True))
+        batch_op.create_unique_constraint('_advertisement_dealer_external_id_uc', ['user_id', 'external_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('advertisements', schema=None) as batch_op:
+        batch_op.drop_constraint('_advertisement_dealer_external_id_uc', type_='unique')
+        batch_op.drop_column('external_id')
@@ -0,0 +1,36 @@
+"""Content-addressed car image uploads
+
+Revision ID: 8a4d2c7f1b93
+Revises: 3c8f5a2d9e71
+Create Date: 2026-10-18 17:05:41.652390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4d2c7f1b93'
+down_revision = '3c8f5a2d9e71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('car_images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('content_type', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('height', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('byte_size', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_car_images_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('car_images', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_car_images_content_hash'))
+        batch_op.drop_column('byte_size')
+        batch_op.drop_column('height')
+        batch_op.drop_column('width')
+        batch_op.drop_column('content_type')
+        batch_op.drop_column('content_hash')
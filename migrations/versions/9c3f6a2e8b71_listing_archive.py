@@ -0,0 +1,105 @@
+"""Archive tables for cold listings; transactions no longer reference cars by foreign key
+
+Revision ID: 9c3f6a2e8b71
+Revises: 7b2e5d9c4a16
+Create Date: 2026-10-18 23:48:12.417305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3f6a2e8b71'
+down_revision = '7b2e5d9c4a16'
+branch_labels = None
+depends_on = None
+
+SQLITE_NAMING = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+SQLITE_CAR_FK = 'fk_transactions_car_id_cars'
+
+
+def upgrade():
+    op.create_table('archived_cars',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('make', sa.String(length=100), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('color', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_cars_lower_make_model_year', 'archived_cars',
+                    [sa.text('lower(make)'), sa.text('lower(model)'), 'year'], unique=False)
+    op.create_table('archived_advertisements',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('price', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('external_id', sa.String(length=100), nullable=True),
+    sa.Column('car_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_advertisements_car_id', 'archived_advertisements', ['car_id'], unique=False)
+    op.create_table('archived_car_images',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('car_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('image_url', sa.String(length=255), nullable=False),
+    sa.Column('description', sa.String(length=255), nullable=True),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('content_type', sa.String(length=50), nullable=True),
+    sa.Column('width', sa.Integer(), nullable=True),
+    sa.Column('height', sa.Integer(), nullable=True),
+    sa.Column('byte_size', sa.Integer(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('car_id', 'id')
+    )
+    op.create_table('archived_price_history',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('car_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('price', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('change_date', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('car_id', 'id')
+    )
+    op.create_table('archived_ownership_history',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('car_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('owner_id', sa.Integer(), autoincrement=False, nullable=True),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('end_date', sa.Date(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('car_id', 'id')
+    )
+
+    # Transactions outlive their car in the hot table
+    if op.get_bind().dialect.name == 'sqlite':
+        # The initial schema left the constraint unnamed; name it on reflection so the table copy can drop it
+        with op.batch_alter_table('transactions', schema=None, naming_convention=SQLITE_NAMING) as batch_op:
+            batch_op.drop_constraint(SQLITE_CAR_FK, type_='foreignkey')
+    else:
+        op.drop_constraint('transactions_car_id_fkey', 'transactions', type_='foreignkey')
+
+
+def downgrade():
+    name = SQLITE_CAR_FK if op.get_bind().dialect.name == 'sqlite' else 'transactions_car_id_fkey'
+    # Fails while any transaction belongs to an archived car
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_foreign_key(name, 'cars', ['car_id'], ['id'], ondelete='RESTRICT')
+
+    op.drop_table('archived_ownership_history')
+    op.drop_table('archived_price_history')
+    op.drop_table('archived_car_images')
+    op.drop_index('ix_archived_advertisements_car_id', table_name='archived_advertisements')
+    op.drop_table('archived_advertisements')
+    op.drop_index('ix_archived_cars_lower_make_model_year', table_name='archived_cars')
+    op.drop_table('archived_cars')
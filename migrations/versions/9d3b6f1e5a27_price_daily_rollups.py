@@ -0,0 +1,47 @@
+"""Price history index and daily price rollups
+
+Revision ID: 9d3b6f1e5a27
+Revises: 7f2e9a1b4c68
+Create Date: 2026-10-18 14:02:11.538410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3b6f1e5a27'
+down_revision = '7f2e9a1b4c68'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('price_daily_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('make', sa.String(length=100), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('min_price', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('median_price', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('max_price', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('sample_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('make', 'model', 'year', 'day', name='_price_rollup_segment_day_uc')
+    )
+    with op.batch_alter_table('price_history', schema=None) as batch_op:
+        batch_op.create_index('ix_price_history_car_id_change_date', ['car_id', 'change_date'], unique=False)
+
+    # Existing ads have no history yet; seed each with its current price
+    op.execute(
+        "INSERT INTO price_history (car_id, price, change_date) "
+        "SELECT car_id, price, COALESCE(updated_at, created_at, CURRENT_TIMESTAMP) FROM advertisements"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('price_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_price_history_car_id_change_date')
+
+    op.drop_table('price_daily_rollups')
@@ -0,0 +1,28 @@
+"""Advertisement keyset pagination indexes
+
+Revision ID: a3c5e81f2d47
+Revises: 17991e890eec
+Create Date: 2026-10-18 09:12:41.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e81f2d47'
+down_revision = '17991e890eec'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('advertisements', schema=None) as batch_op:
+        batch_op.create_index('ix_advertisements_created_at_id', ['created_at', 'id'], unique=False)
+        batch_op.create_index('ix_advertisements_price_id', ['price', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('advertisements', schema=None) as batch_op:
+        batch_op.drop_index('ix_advertisements_price_id')
+        batch_op.drop_index('ix_advertisements_created_at_id')
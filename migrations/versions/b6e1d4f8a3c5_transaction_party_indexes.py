@@ -0,0 +1,30 @@
+"""Indexes for per-party transaction listings
+
+Revision ID: b6e1d4f8a3c5
+Revises: 9d3b6f1e5a27
+Create Date: 2026-10-18 14:48:37.204155
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1d4f8a3c5'
+down_revision = '9d3b6f1e5a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_index('ix_transactions_buyer_id_date_id', ['buyer_id', 'transaction_date', 'id'], unique=False)
+        batch_op.create_index('ix_transactions_seller_id_date_id', ['seller_id', 'transaction_date', 'id'], unique=False)
+        batch_op.create_index('ix_transactions_date_id', ['transaction_date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_date_id')
+        batch_op.drop_index('ix_transactions_seller_id_date_id')
+        batch_op.drop_index('ix_transactions_buyer_id_date_id')
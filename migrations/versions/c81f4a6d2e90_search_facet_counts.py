@@ -0,0 +1,51 @@
+"""Search facet counts
+
+Revision ID: c81f4a6d2e90
+Revises: 5b9d0e4c7a12
+Create Date: 2026-10-18 11:24:07.630518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4a6d2e90'
+down_revision = '5b9d0e4c7a12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_facet_counts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('make', sa.String(length=100), nullable=False),
+    sa.Column('color', sa.String(length=50), nullable=False),
+    sa.Column('car_status', sa.String(length=50), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('price_bucket', sa.Integer(), nullable=False),
+    sa.Column('ad_status', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('make', 'color', 'car_status', 'year', 'price_bucket', 'ad_status', name='_search_facet_cell_uc')
+    )
+
+    # Backfill; bucket edges mirror facets.PRICE_BUCKET_EDGES
+    op.execute("""
+        INSERT INTO search_facet_counts (make, color, car_status, year, price_bucket, ad_status, count)
+        SELECT lower(trim(c.make)), lower(trim(c.color)), c.status, c.year,
+               CASE WHEN a.price >= 100000 THEN 6
+                    WHEN a.price >= 50000 THEN 5
+                    WHEN a.price >= 30000 THEN 4
+                    WHEN a.price >= 20000 THEN 3
+                    WHEN a.price >= 10000 THEN 2
+                    WHEN a.price >= 5000 THEN 1
+                    ELSE 0 END,
+               a.status, count(*)
+        FROM cars c JOIN advertisements a ON a.car_id = c.id
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """)
+
+
+def downgrade():
+    op.drop_table('search_facet_counts')
@@ -0,0 +1,36 @@
+"""Listing change log for the delta feed
+
+Revision ID: d2f7c1a9e645
+Revises: 8a4d2c7f1b93
+Create Date: 2026-10-18 18:20:14.930577
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f7c1a9e645'
+down_revision = '8a4d2c7f1b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('listing_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('advertisement_id', sa.Integer(), nullable=False),
+    sa.Column('car_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=10), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('listing_changes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_listing_changes_changed_at'), ['changed_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('listing_changes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_listing_changes_changed_at'))
+
+    op.drop_table('listing_changes')
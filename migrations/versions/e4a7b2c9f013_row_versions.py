@@ -0,0 +1,39 @@
+"""Row versions for cars and advertisements
+
+Revision ID: e4a7b2c9f013
+Revises: c81f4a6d2e90
+Create Date: 2026-10-18 12:40:19.874402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7b2c9f013'
+down_revision = 'c81f4a6d2e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cars', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('advertisements', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+    op.execute('UPDATE advertisements SET updated_at = created_at')
+    op.execute('UPDATE cars SET updated_at = (SELECT a.created_at FROM advertisements a WHERE a.car_id = cars.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('advertisements', schema=None) as batch_op:
+        batch_op.drop_column('version')
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('cars', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('version')
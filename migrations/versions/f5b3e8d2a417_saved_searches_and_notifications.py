@@ -0,0 +1,81 @@
+"""Saved searches, their term index and the notification inbox
+
+Revision ID: f5b3e8d2a417
+Revises: d2f7c1a9e645
+Create Date: 2026-10-18 19:34:52.117046
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5b3e8d2a417'
+down_revision = 'd2f7c1a9e645'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('saved_searches',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('brand', sa.String(length=100), nullable=True),
+    sa.Column('model', sa.String(length=100), nullable=True),
+    sa.Column('color', sa.String(length=50), nullable=True),
+    sa.Column('status', sa.String(length=50), nullable=True),
+    sa.Column('min_price', sa.Numeric(precision=15, scale=2), nullable=True),
+    sa.Column('max_price', sa.Numeric(precision=15, scale=2), nullable=True),
+    sa.Column('min_year', sa.Integer(), nullable=True),
+    sa.Column('max_year', sa.Integer(), nullable=True),
+    sa.Column('match', sa.String(length=10), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('saved_searches', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_saved_searches_user_id'), ['user_id'], unique=False)
+
+    op.create_table('saved_search_terms',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('field', sa.String(length=20), nullable=False),
+    sa.Column('term', sa.String(length=100), nullable=False),
+    sa.Column('saved_search_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['saved_search_id'], ['saved_searches.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('saved_search_terms', schema=None) as batch_op:
+        batch_op.create_index('ix_saved_search_terms_field_term', ['field', 'term', 'saved_search_id'], unique=False)
+
+    op.create_table('notifications',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('saved_search_id', sa.Integer(), nullable=True),
+    sa.Column('advertisement_id', sa.Integer(), nullable=True),
+    sa.Column('reason', sa.String(length=20), nullable=False),
+    sa.Column('price', sa.Numeric(precision=15, scale=2), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['advertisement_id'], ['advertisements.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['saved_search_id'], ['saved_searches.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_user_id_id', ['user_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_id_id')
+
+    op.drop_table('notifications')
+    with op.batch_alter_table('saved_search_terms', schema=None) as batch_op:
+        batch_op.drop_index('ix_saved_search_terms_field_term')
+
+    op.drop_table('saved_search_terms')
+    with op.batch_alter_table('saved_searches', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_saved_searches_user_id'))
+
+    op.drop_table('saved_searches')
@@ -1,5 +1,5 @@
 from extensions import db
-from sqlalchemy import ForeignKey, UniqueConstraint
+from sqlalchemy import ForeignKey, UniqueConstraint, func, event, DDL
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -17,6 +17,12 @@ class User(db.Model):
     roles = db.relationship('Role', secondary='user_roles',
                             backref=db.backref('users', lazy='dynamic'))
 
+    # The unique index compares by the database collation; LIKE 'prefix%' needs byte order on PostgreSQL
+    __table_args__ = (
+        db.Index('ix_users_mobile_number_pattern', 'mobile_number',
+                 postgresql_ops={'mobile_number': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
+
     @property
     def is_authenticated(self):
         return self.active
@@ -61,12 +67,35 @@ class Car(db.Model):
     year = db.Column(db.Integer, nullable=False)
     color = db.Column(db.String(50), nullable=False, index=True)
     status = db.Column(db.String(50), nullable=False, default='used', index=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Every UPDATE checks and bumps version, so concurrent writers fail instead of clobbering
+    __mapper_args__ = {'version_id_col': version}
 
     advertisement = relationship('Advertisement', backref='car_details', uselist=False, cascade="all, delete-orphan")
     price_history = relationship('PriceHistory', backref='car', lazy=True, cascade="all, delete-orphan")
     ownership_history = relationship('OwnershipHistory', backref='car', lazy=True, cascade="all, delete-orphan")
-    images = relationship('CarImage', backref='car', lazy=True, cascade="all, delete-orphan")
-    transaction = relationship('Transaction', backref='car_transaction', uselist=False)
+    images = relationship('CarImage', backref='car', lazy=True, cascade="all, delete-orphan", order_by='CarImage.id')
+    # No foreign key: a sold car moves to archived_cars while its transactions stay
+    transactions = relationship(
+        'Transaction', primaryjoin='Car.id == foreign(Transaction.car_id)', backref='car_transaction', lazy=True
+    )
+
+    # Search matches on lower(column); trigram indexes back substring matching on PostgreSQL
+    __table_args__ = (
+        db.Index('ix_cars_lower_make_model_year', func.lower(make), func.lower(model), year),
+        db.Index('ix_cars_lower_color', func.lower(color)),
+        db.Index('ix_cars_make_trgm', func.lower(make).label('lower_make'),
+                 postgresql_using='gin', postgresql_ops={'lower_make': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_cars_model_trgm', func.lower(model).label('lower_model'),
+                 postgresql_using='gin', postgresql_ops={'lower_model': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_cars_color_trgm', func.lower(color).label('lower_color'),
+                 postgresql_using='gin', postgresql_ops={'lower_color': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+event.listen(Car.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
 
 class Advertisement(db.Model):
     __tablename__ = 'advertisements'
@@ -76,10 +105,54 @@ class Advertisement(db.Model):
     price = db.Column(db.Numeric(15, 2), nullable=False, index=True)
     status = db.Column(db.String(50), nullable=False, default='active')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Dealer-supplied id used to upsert feed imports
+    external_id = db.Column(db.String(100))
 
     car_id = db.Column(db.Integer, db.ForeignKey('cars.id', ondelete='CASCADE'), unique=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
 
+    __table_args__ = (
+        db.Index('ix_advertisements_created_at_id', 'created_at', 'id'),
+        db.Index('ix_advertisements_price_id', 'price', 'id'),
+        db.Index('ix_advertisements_status_price_id', 'status', 'price', 'id'),
+        # Lets the expiry sweep range-scan only the active ads past their age
+        db.Index('ix_advertisements_status_created_at_id', 'status', 'created_at', 'id'),
+        UniqueConstraint('user_id', 'external_id', name='_advertisement_dealer_external_id_uc'),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+# Full-text search over title/description is maintained by the database itself: a generated
+# tsvector column with a GIN index on PostgreSQL, an FTS5 table kept in step by triggers on SQLite
+ADVERTISEMENT_FULLTEXT_DDL = {
+    'postgresql': [
+        "ALTER TABLE advertisements ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')) STORED",
+        "CREATE INDEX ix_advertisements_search_vector ON advertisements USING gin (search_vector)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE advertisements_fts USING fts5("
+        "title, description, content='advertisements', content_rowid='id', tokenize='porter unicode61')",
+        "CREATE TRIGGER advertisements_fts_ai AFTER INSERT ON advertisements BEGIN "
+        "INSERT INTO advertisements_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+        "CREATE TRIGGER advertisements_fts_ad AFTER DELETE ON advertisements BEGIN "
+        "INSERT INTO advertisements_fts(advertisements_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); END",
+        "CREATE TRIGGER advertisements_fts_au AFTER UPDATE OF title, description ON advertisements BEGIN "
+        "INSERT INTO advertisements_fts(advertisements_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO advertisements_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    ],
+}
+
+for _dialect, _statements in ADVERTISEMENT_FULLTEXT_DDL.items():
+    for _statement in _statements:
+        event.listen(Advertisement.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+event.listen(Advertisement.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS advertisements_fts').execute_if(dialect='sqlite'))
+
 class PriceHistory(db.Model):
     __tablename__ = 'price_history'
     id = db.Column(db.Integer, primary_key=True)
@@ -87,6 +160,10 @@ class PriceHistory(db.Model):
     price = db.Column(db.Numeric(15, 2), nullable=False)
     change_date = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_price_history_car_id_change_date', 'car_id', 'change_date'),
+    )
+
 class OwnershipHistory(db.Model):
     __tablename__ = 'ownership_history'
     id = db.Column(db.Integer, primary_key=True)
@@ -101,13 +178,215 @@ class CarImage(db.Model):
     car_id = db.Column(db.Integer, db.ForeignKey('cars.id', ondelete='CASCADE'), nullable=False)
     image_url = db.Column(db.String(255), nullable=False)
     description = db.Column(db.String(255))
+    # Set for uploads held in the image store; hotlinked images only have image_url
+    content_hash = db.Column(db.String(64), index=True)
+    content_type = db.Column(db.String(50))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    byte_size = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_car_images_car_id_id', 'car_id', 'id'),
+    )
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
     id = db.Column(db.Integer, primary_key=True)
-    car_id = db.Column(db.Integer, db.ForeignKey('cars.id', ondelete='RESTRICT'), unique=True, nullable=False)
+    car_id = db.Column(db.Integer, nullable=False, index=True)
     buyer_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='RESTRICT'), nullable=False)
     seller_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='RESTRICT'), nullable=False)
     status = db.Column(db.String(50), nullable=False, default='pending')
     agreed_price = db.Column(db.Numeric(15, 2), nullable=False)
-    transaction_date = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    transaction_date = db.Column(db.DateTime, default=datetime.utcnow)
+    archived_car = relationship('ArchivedCar', primaryjoin='foreign(Transaction.car_id) == ArchivedCar.id', viewonly=True)
+
+    # Per-party indexes back the buyer-or-seller listing and its keyset order
+    __table_args__ = (
+        db.Index('ix_transactions_buyer_id_date_id', 'buyer_id', 'transaction_date', 'id'),
+        db.Index('ix_transactions_seller_id_date_id', 'seller_id', 'transaction_date', 'id'),
+        db.Index('ix_transactions_date_id', 'transaction_date', 'id'),
+        # A car takes many offers, but each buyer has one open offer and only one offer is ever accepted
+        db.Index(
+            'uq_transactions_car_id_buyer_id_pending', 'car_id', 'buyer_id', unique=True,
+            postgresql_where=db.text("status = 'pending'"), sqlite_where=db.text("status = 'pending'")
+        ),
+        db.Index(
+            'uq_transactions_car_id_settled', 'car_id', unique=True,
+            postgresql_where=db.text("status IN ('accepted', 'completed')"),
+            sqlite_where=db.text("status IN ('accepted', 'completed')")
+        ),
+    )
+
+class SearchFacetCount(db.Model):
+    __tablename__ = 'search_facet_counts'
+    id = db.Column(db.Integer, primary_key=True)
+    make = db.Column(db.String(100), nullable=False)
+    color = db.Column(db.String(50), nullable=False)
+    car_status = db.Column(db.String(50), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    price_bucket = db.Column(db.Integer, nullable=False)
+    ad_status = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('make', 'color', 'car_status', 'year', 'price_bucket', 'ad_status', name='_search_facet_cell_uc'),
+    )
+
+
+class PriceDailyRollup(db.Model):
+    __tablename__ = 'price_daily_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    # Segment columns hold lower-cased values so spellings of a make share a row
+    make = db.Column(db.String(100), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    min_price = db.Column(db.Numeric(15, 2), nullable=False)
+    median_price = db.Column(db.Numeric(15, 2), nullable=False)
+    max_price = db.Column(db.Numeric(15, 2), nullable=False)
+    sample_count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('make', 'model', 'year', 'day', name='_price_rollup_segment_day_uc'),
+    )
+
+
+class DirtyPriceSegment(db.Model):
+    """A segment whose rollup is due for a recompute by the ``refresh_price_rollups`` job."""
+    __tablename__ = 'dirty_price_segments'
+    make = db.Column(db.String(100), primary_key=True)
+    model = db.Column(db.String(100), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    marked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ListingChange(db.Model):
+    __tablename__ = 'listing_changes'
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign keys: a deletion has to outlive the rows it describes
+    advertisement_id = db.Column(db.Integer, nullable=False)
+    car_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class SavedSearch(db.Model):
+    __tablename__ = 'saved_searches'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    # Text criteria are stored normalized, as parse_search_criteria produces them
+    brand = db.Column(db.String(100))
+    model = db.Column(db.String(100))
+    color = db.Column(db.String(50))
+    status = db.Column(db.String(50))
+    min_price = db.Column(db.Numeric(15, 2))
+    max_price = db.Column(db.Numeric(15, 2))
+    min_year = db.Column(db.Integer)
+    max_year = db.Column(db.Integer)
+    match = db.Column(db.String(10), nullable=False, default='contains')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    terms = relationship('SavedSearchTerm', backref='saved_search', lazy=True, cascade="all, delete-orphan")
+
+
+class SavedSearchTerm(db.Model):
+    """Inverted index entry: the saved search is a candidate for listings that produce (field, term)."""
+    __tablename__ = 'saved_search_terms'
+    id = db.Column(db.Integer, primary_key=True)
+    field = db.Column(db.String(20), nullable=False)
+    term = db.Column(db.String(100), nullable=False)
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_searches.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_saved_search_terms_field_term', 'field', 'term', 'saved_search_id'),
+    )
+
+
+class Notification(db.Model):
+    __tablename__ = 'notifications'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    saved_search_id = db.Column(db.Integer, db.ForeignKey('saved_searches.id', ondelete='SET NULL'))
+    advertisement_id = db.Column(db.Integer, db.ForeignKey('advertisements.id', ondelete='CASCADE'))
+    reason = db.Column(db.String(20), nullable=False)
+    price = db.Column(db.Numeric(15, 2))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    read_at = db.Column(db.DateTime)
+
+    saved_search = relationship('SavedSearch')
+    advertisement = relationship('Advertisement')
+
+    # Backs the per-user inbox, paged newest first
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_id', 'user_id', 'id'),
+    )
+
+
+class JobState(db.Model):
+    """Schedule, lease and last-run report of one background job."""
+    __tablename__ = 'job_states'
+    name = db.Column(db.String(100), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='idle')
+    # The runner holding the lease; it is extended after every batch and lapses if the runner dies
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    next_run_at = db.Column(db.DateTime)
+    last_started_at = db.Column(db.DateTime)
+    last_finished_at = db.Column(db.DateTime)
+    last_duration_ms = db.Column(db.Integer)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    batches = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+
+
+def _archive_table(table, name, primary_key=('id',), *indexes):
+    """A copy of ``table``'s columns, without its constraints, plus when each row was archived."""
+    columns = [db.Column(column.name, column.type, nullable=column.nullable, autoincrement=False) for column in table.columns]
+    return db.Table(
+        name, db.metadata, *columns, db.Column('archived_at', db.DateTime, nullable=False),
+        db.PrimaryKeyConstraint(*primary_key), *indexes
+    )
+
+
+# Cold listings and everything hanging off their car; rows keep their ids, so
+# lookups fall back here by the same key. Child rows are keyed by (car_id, id).
+class ArchivedCar(db.Model):
+    __table__ = _archive_table(Car.__table__, 'archived_cars')
+
+    images = relationship(
+        'ArchivedCarImage', primaryjoin='ArchivedCar.id == foreign(ArchivedCarImage.car_id)',
+        order_by='ArchivedCarImage.id', viewonly=True
+    )
+
+
+# Valuation matches completed sales of archived cars by segment
+db.Index(
+    'ix_archived_cars_lower_make_model_year',
+    func.lower(ArchivedCar.__table__.c.make), func.lower(ArchivedCar.__table__.c.model), ArchivedCar.__table__.c.year
+)
+
+
+class ArchivedAdvertisement(db.Model):
+    __table__ = _archive_table(
+        Advertisement.__table__, 'archived_advertisements', ('id',), db.Index('ix_archived_advertisements_car_id', 'car_id')
+    )
+
+    car_details = relationship(
+        'ArchivedCar', primaryjoin='foreign(ArchivedAdvertisement.car_id) == ArchivedCar.id', viewonly=True
+    )
+    publisher = relationship(
+        'User', primaryjoin='foreign(ArchivedAdvertisement.user_id) == User.id', viewonly=True
+    )
+
+
+class ArchivedCarImage(db.Model):
+    __table__ = _archive_table(CarImage.__table__, 'archived_car_images', primary_key=('car_id', 'id'))
+
+
+class ArchivedPriceHistory(db.Model):
+    __table__ = _archive_table(PriceHistory.__table__, 'archived_price_history', primary_key=('car_id', 'id'))
+
+
+class ArchivedOwnershipHistory(db.Model):
+    __table__ = _archive_table(OwnershipHistory.__table__, 'archived_ownership_history', primary_key=('car_id', 'id'))
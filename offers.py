@@ -0,0 +1,113 @@
+import random
+import time
+
+from flask import abort, current_app
+from sqlalchemy import select, update, case, exists
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import aliased
+from werkzeug.exceptions import ServiceUnavailable
+
+from extensions import db
+from models import Car, Transaction
+
+OFFER_PENDING = 'pending'
+OFFER_ACCEPTED = 'accepted'
+OFFER_REJECTED = 'rejected'
+SETTLED_STATUSES = ('accepted', 'completed')
+# Postgres serialization failure and deadlock; both are safe to run again from the start
+TRANSIENT_SQLSTATES = ('40001', '40P01')
+
+
+class OfferContention(ServiceUnavailable):
+    description = "This car is receiving too many offers at once. Please retry shortly."
+
+
+def _is_transient(error):
+    orig = error.orig
+    if getattr(orig, 'sqlstate', None) in TRANSIENT_SQLSTATES or getattr(orig, 'pgcode', None) in TRANSIENT_SQLSTATES:
+        return True
+    return 'database is locked' in str(orig)
+
+
+def run_with_retries(name, operation):
+    """Run ``operation`` (which commits) again after deadlocks and lock timeouts, a bounded number of times.
+
+    Backoff is exponential with jitter so colliding requests do not retry in step;
+    once the attempts run out the client gets a 503 with Retry-After.
+    """
+    attempts = current_app.config['OFFER_RETRY_ATTEMPTS']
+    backoff = current_app.config['OFFER_RETRY_BACKOFF_MS'] / 1000
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except OperationalError as e:
+            db.session.rollback()
+            if not _is_transient(e):
+                raise
+            current_app.extensions['metrics'].record_retry(name)
+            if attempt + 1 < attempts:
+                time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+    raise OfferContention(retry_after=1)
+
+
+def _lock_car(car_id, exclusive):
+    # Offers share the car row and acceptance takes it exclusively, so no offer
+    # slips in between accepting one and rejecting the rest. SQLite ignores
+    # this; it only ever has one writer.
+    query = select(Car.id).where(Car.id == car_id).with_for_update(read=not exclusive)
+    db.session.execute(query)
+
+
+def car_is_sold(car_id):
+    return db.session.scalar(
+        select(exists().where(Transaction.car_id == car_id, Transaction.status.in_(SETTLED_STATUSES)))
+    )
+
+
+def place_offer(car_id, buyer_id, seller_id, agreed_price):
+    """Insert a pending offer and commit; a buyer has one open offer per car."""
+    _lock_car(car_id, exclusive=False)
+    if car_is_sold(car_id):
+        db.session.rollback()
+        abort(409, description="An offer on this car has already been accepted.")
+    offer = Transaction(
+        car_id=car_id, buyer_id=buyer_id, seller_id=seller_id, agreed_price=agreed_price, status=OFFER_PENDING
+    )
+    db.session.add(offer)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, description="You already have a pending offer on this car.")
+    return offer
+
+
+def accept_offer(offer):
+    """Accept ``offer`` and reject every other pending offer on its car in one statement, then commit.
+
+    Returns how many competing offers were rejected.
+    """
+    car_id, offer_id = offer.car_id, offer.id
+    _lock_car(car_id, exclusive=True)
+    target = aliased(Transaction)
+    statement = (
+        update(Transaction)
+        .where(
+            Transaction.car_id == car_id,
+            Transaction.status == OFFER_PENDING,
+            # Nothing changes unless the accepted offer itself is still pending
+            exists().where(target.id == offer_id, target.status == OFFER_PENDING),
+        )
+        .values(status=case((Transaction.id == offer_id, OFFER_ACCEPTED), else_=OFFER_REJECTED))
+    )
+    try:
+        rejected = db.session.execute(statement, execution_options={'synchronize_session': False}).rowcount - 1
+        if rejected < 0:
+            db.session.rollback()
+            abort(409, description="Only pending offers can be accepted.")
+        db.session.commit()
+    except IntegrityError:
+        # The partial unique index catches an acceptance the row lock cannot, e.g. one that was already settled
+        db.session.rollback()
+        abort(409, description="Another offer on this car has already been accepted.")
+    return rejected
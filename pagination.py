@@ -0,0 +1,71 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from flask import request, abort
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def get_page_size(default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    limit = request.args.get('limit', default, type=int)
+    if limit is None or limit < 1:
+        abort(400, description="limit must be a positive integer.")
+    return min(limit, maximum)
+
+
+def _dump(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values):
+    payload = json.dumps([_dump(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, converters):
+    """Turn an opaque cursor back into key values, one converter per key column."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(values) != len(converters):
+            raise ValueError(cursor)
+        return [convert(v) for convert, v in zip(converters, values)]
+    except (ValueError, TypeError, binascii.Error, ArithmeticError):
+        abort(400, description="Invalid cursor.")
+
+
+def keyset_filter(columns, values, descending=False):
+    # (a, b) > (x, y) spelled out as a > x OR (a = x AND b > y) so it works everywhere
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def paginate_keyset(query, columns, key, converters, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """Fetch one page ordered by ``columns`` and return ``(rows, next_cursor)``.
+
+    ``key`` maps a result row to the tuple of values for ``columns``; the last
+    column must be unique so the ordering is total.
+    """
+    if cursor:
+        query = query.filter(keyset_filter(columns, decode_cursor(cursor, converters), descending))
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return rows, next_cursor
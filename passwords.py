@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+
+
+def _pool_context():
+    # The pool starts lazily from a threaded server, where a plain fork can copy a held lock
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class HashingBusy(ServiceUnavailable):
+    description = "Too many sign-ins are being processed. Please retry shortly."
+
+
+class PasswordHasher:
+    """Runs password hashing and checks in a bounded process pool.
+
+    At most ``PASSWORD_HASH_MAX_PENDING`` hashes queue per web process;
+    beyond that, and when a hash outlives ``PASSWORD_HASH_TIMEOUT``, callers
+    get a 503 with Retry-After instead of tying up the request thread.
+    ``PASSWORD_HASH_WORKERS = 0`` hashes inline.
+    """
+
+    def __init__(self, app=None):
+        self.method = DEFAULT_HASH_METHOD
+        self.workers = 0
+        self.timeout = 10
+        self._slots = None
+        self._method_prefix = None
+        self._pool = None
+        self._pool_pid = None
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', None)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = BoundedSemaphore(app.config['PASSWORD_HASH_MAX_PENDING'] or max(self.workers, 1) * 4)
+        self._method_prefix = None
+        app.extensions['password_hasher'] = self
+
+    def _executor(self):
+        # A pool does not survive fork, so each web worker process starts its own on first use
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=_pool_context())
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            self._pool = None
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy(retry_after=1)
+        try:
+            future = self._executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset_pool()
+            raise HashingBusy(retry_after=1)
+        # The slot is held until the hash finishes, even if the caller stops waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy(retry_after=int(self.timeout))
+        except BrokenProcessPool:
+            self._reset_pool()
+            raise HashingBusy(retry_after=1)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Whether ``pwhash`` was made with other parameters than the configured method."""
+        if self._method_prefix is None:
+            # Werkzeug fills in default parameters, so compare against what it actually writes
+            self._method_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,198 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from statistics import median
+
+from sqlalchemy import func, insert, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import Car, Advertisement, PriceHistory, PriceDailyRollup, DirtyPriceSegment
+
+ROLLUP_AD_STATUS = 'active'
+DEFAULT_TREND_DAYS = 90
+MAX_TREND_DAYS = 365
+
+
+def segment_of(make, model, year):
+    # Matches lower(make), lower(model), year so segment lookups use ix_cars_lower_make_model_year
+    return (make.lower(), model.lower(), int(year))
+
+
+def record_price_change(car_id, price, when=None):
+    db.session.add(PriceHistory(car_id=car_id, price=price, change_date=when or datetime.utcnow()))
+
+
+def record_price_changes(changes, when=None):
+    """Append history rows for ``(car_id, price)`` pairs in one multi-row insert."""
+    if not changes:
+        return
+    when = when or datetime.utcnow()
+    db.session.execute(
+        insert(PriceHistory.__table__),
+        [{'car_id': car_id, 'price': price, 'change_date': when} for car_id, price in changes]
+    )
+
+
+def _segment_prices(segments):
+    segment = (func.lower(Car.make), func.lower(Car.model), Car.year)
+    prices = defaultdict(list)
+    for make, model, year, price in db.session.execute(
+        db.select(*segment, Advertisement.price)
+        .join(Advertisement, Advertisement.car_id == Car.id)
+        .where(tuple_(*segment).in_(list(segments)), Advertisement.status == ROLLUP_AD_STATUS)
+    ):
+        prices[(make, model, year)].append(price)
+    return prices
+
+
+def _rollup_values(segment, day, prices):
+    make, model, year = segment
+    return {
+        'day': day, 'make': make, 'model': model, 'year': year,
+        'min_price': min(prices), 'median_price': Decimal(median(prices)).quantize(Decimal('0.01')),
+        'max_price': max(prices), 'sample_count': len(prices),
+    }
+
+
+def _upsert_rollups(rows):
+    table = PriceDailyRollup.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if not rows:
+            return
+        insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert_(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['make', 'model', 'year', 'day'],
+            set_={name: stmt.excluded[name] for name in ('min_price', 'median_price', 'max_price', 'sample_count')}
+        )
+        db.session.execute(stmt, rows)
+        return
+
+    if rows:
+        db.session.execute(table.delete().where(
+            table.c.day == rows[0]['day'],
+            tuple_(table.c.make, table.c.model, table.c.year).in_([(r['make'], r['model'], r['year']) for r in rows])
+        ))
+        db.session.execute(table.insert(), rows)
+
+
+def mark_segments_dirty(segments):
+    """Queue ``(make, model, year)`` segments for the rollup job; call before commit.
+
+    Writers only insert a marker, so they neither recompute a segment nor
+    wait on its rollup row. A marker that already exists is left alone.
+    """
+    now = datetime.utcnow()
+    rows = [{'make': make, 'model': model, 'year': year, 'marked_at': now} for make, model, year in set(segments)]
+    if not rows:
+        return
+    table = DirtyPriceSegment.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert_ = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        db.session.execute(insert_(table).on_conflict_do_nothing(index_elements=['make', 'model', 'year']), rows)
+        return
+
+    db.session.execute(table.delete().where(
+        tuple_(table.c.make, table.c.model, table.c.year).in_([(r['make'], r['model'], r['year']) for r in rows])
+    ))
+    db.session.execute(table.insert(), rows)
+
+
+def claim_dirty_segments(limit):
+    """Take up to ``limit`` marked segments, oldest first, clearing their markers; call before commit.
+
+    The markers go before the caller reads any prices, so a write that
+    commits after that read marks its segment again for the next run.
+    """
+    table = DirtyPriceSegment.__table__
+    segments = [tuple(row) for row in db.session.execute(
+        db.select(table.c.make, table.c.model, table.c.year)
+        .order_by(table.c.marked_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )]
+    if segments:
+        db.session.execute(table.delete().where(tuple_(table.c.make, table.c.model, table.c.year).in_(segments)))
+    return segments
+
+
+def refresh_segment_rollups(segments, day=None):
+    """Recompute today's asking-price rollup for each ``(make, model, year)`` segment.
+
+    A segment left without active ads loses its row for the day. Writers
+    call ``mark_segments_dirty`` instead; this runs from the rollup job.
+    """
+    segments = set(segments)
+    if not segments:
+        return
+    day = day or datetime.utcnow().date()
+    prices = _segment_prices(segments)
+    _upsert_rollups([_rollup_values(segment, day, prices[segment]) for segment in segments if prices[segment]])
+
+    table = PriceDailyRollup.__table__
+    emptied = [segment for segment in segments if not prices[segment]]
+    if emptied:
+        db.session.execute(table.delete().where(
+            table.c.day == day, tuple_(table.c.make, table.c.model, table.c.year).in_(emptied)
+        ))
+
+
+def refresh_all_rollups(day=None):
+    """Snapshot every segment's active asking prices for ``day`` in one ordered pass."""
+    day = day or datetime.utcnow().date()
+    segment = (func.lower(Car.make), func.lower(Car.model), Car.year)
+    result = db.session.execute(
+        db.select(*segment, Advertisement.price)
+        .join(Advertisement, Advertisement.car_id == Car.id)
+        .where(Advertisement.status == ROLLUP_AD_STATUS)
+        .order_by(*segment)
+        .execution_options(stream_results=True, yield_per=5000)
+    )
+
+    rows, current, prices = [], None, []
+    for make, model, year, price in result:
+        if (make, model, year) != current:
+            if prices:
+                rows.append(_rollup_values(current, day, prices))
+            current, prices = (make, model, year), []
+        prices.append(price)
+    if prices:
+        rows.append(_rollup_values(current, day, prices))
+
+    _upsert_rollups(rows)
+    db.session.commit()
+    return len(rows)
+
+
+def car_price_series(car_id, history=PriceHistory):
+    """Pass ``ArchivedPriceHistory`` as ``history`` for an archived car."""
+    return [
+        {'price': str(entry.price), 'change_date': entry.change_date.isoformat()}
+        for entry in history.query
+        .filter_by(car_id=car_id)
+        .order_by(history.change_date, history.id)
+    ]
+
+
+def segment_trend(make, model, year, days=DEFAULT_TREND_DAYS):
+    make, model, year = segment_of(make.strip(), model.strip(), year)
+    since = datetime.utcnow().date() - timedelta(days=days)
+    rollups = (
+        PriceDailyRollup.query
+        .filter_by(make=make, model=model, year=year)
+        .filter(PriceDailyRollup.day >= since)
+        .order_by(PriceDailyRollup.day)
+    )
+    return [
+        {
+            'day': rollup.day.isoformat(),
+            'min_price': str(rollup.min_price),
+            'median_price': str(rollup.median_price),
+            'max_price': str(rollup.max_price),
+            'sample_count': rollup.sample_count,
+        }
+        for rollup in rollups
+    ]
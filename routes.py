@@ -1,12 +1,52 @@
-from flask import Blueprint, jsonify, request, abort
-from werkzeug.security import generate_password_hash
+import json
+import time
+from collections import namedtuple
+
+from flask import Blueprint, Response, current_app, jsonify, request, abort, stream_with_context
+from werkzeug.datastructures import MultiDict
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import and_
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from datetime import datetime
+from decimal import Decimal
 
-from extensions import db
-from models import User, Role, Car, Advertisement, PriceHistory, OwnershipHistory, CarImage, Transaction
+from extensions import db, result_cache, password_hasher, image_store
+from models import (
+    User, Role, Car, Advertisement, PriceHistory, OwnershipHistory, CarImage, Transaction, SavedSearch, Notification,
+    ArchivedCar, ArchivedPriceHistory
+)
 
-from utils import login_required, roles_required
+from utils import login_required, roles_required, invalidate_principal
+from routing import replica_reads
+from pagination import get_page_size, paginate_keyset, encode_cursor, decode_cursor
+from search import (
+    SEARCH_SORTS, RELEVANCE_SORT, escape_like, parse_search_criteria, search_filters, fulltext_match, sort_key
+)
+from facets import facet_key, record_facet_change, facet_counts
+from cache import cached_result, tag_cached_result
+from conditional import etag_for, conditional_response, require_if_match
+from serialization import Field, RowEncoder, dumps, json_response, json_rows
+from bulk_import import FeedImporter, feed_rows
+from export import export_response, advertisement_export_query, transaction_export_query
+from price_trends import (
+    DEFAULT_TREND_DAYS, MAX_TREND_DAYS, segment_of, record_price_change, mark_segments_dirty,
+    car_price_series, segment_trend
+)
+from valuation import parse_segment, market_valuation
+from images import ORIGINAL
+from saved_searches import (
+    MAX_SAVED_SEARCHES_PER_USER, REASON_NEW, REASON_REPRICED, validate_saved_search, create_saved_search, listing_of,
+    notify_saved_searches
+)
+from changefeed import (
+    ChangeCursorExpired, record_listing_changes, record_listing_deletion, head_change_id, check_cursor_retained,
+    listing_changes_since
+)
+from offers import OFFER_ACCEPTED, run_with_retries, place_offer, accept_offer
+from jobs import job_runner
+from archive import archived_car, archived_advertisement
+from similarity import DEFAULT_RELATED_LIMIT, MAX_RELATED_LIMIT, related_index, related_cars
 
 bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -20,6 +60,18 @@ def serialize_car(car):
         'status': car.status
     }
 
+def serialize_car_image(image):
+    if image.content_hash is None:
+        # Hotlinked image: the one URL stands in for every rendition
+        urls = dict.fromkeys(('thumbnail_url', 'medium_url', 'original_url'), image.image_url)
+    else:
+        urls = {
+            'thumbnail_url': image_store.url(image.content_hash, 'thumb'),
+            'medium_url': image_store.url(image.content_hash, 'medium'),
+            'original_url': image.image_url,
+        }
+    return dict(urls, id=image.id, description=image.description, width=image.width, height=image.height)
+
 def serialize_advertisement(ad):
     return {
         'id': ad.id,
@@ -31,9 +83,98 @@ def serialize_advertisement(ad):
         'car_id': ad.car_id,
         'user_id': ad.user_id,
         'car_details': serialize_car(ad.car_details) if ad.car_details else None,
-        'publisher_mobile': ad.publisher.mobile_number if ad.publisher else None
+        'publisher_mobile': ad.publisher.mobile_number if ad.publisher else None,
+        'images': [serialize_car_image(image) for image in ad.car_details.images] if ad.car_details else []
     }
 
+# Row encoders for the list endpoints; each writes the same JSON as its serialize_* function
+# above, which `benchmark.py --serialization` checks
+CAR_ENCODER = RowEncoder({
+    'id': Field(Car.id, 'int'),
+    'make': Field(Car.make, 'str'),
+    'model': Field(Car.model, 'str'),
+    'year': Field(Car.year, 'int'),
+    'color': Field(Car.color, 'str'),
+    'status': Field(Car.status, 'str'),
+})
+
+CarImageRow = namedtuple('CarImageRow', 'id image_url description content_hash width height')
+
+def encode_car_images(value):
+    if value == '[]':
+        return value
+    return dumps([serialize_car_image(CarImageRow(*image)) for image in json.loads(value)])
+
+def car_images_column(car_id):
+    # One correlated aggregate in the row query instead of a second query per page
+    images = (
+        select(CarImage.id, CarImage.image_url, CarImage.description, CarImage.content_hash, CarImage.width,
+               CarImage.height)
+        .where(CarImage.car_id == car_id)
+        .correlate_except(CarImage)
+        .order_by(CarImage.id)
+        .subquery()
+    )
+    return func.coalesce(select(json_rows(*images.c)).scalar_subquery(), '[]')
+
+ad_publisher = aliased(User)
+
+ADVERTISEMENT_ENCODER = RowEncoder({
+    'id': Field(Advertisement.id, 'int'),
+    'title': Field(Advertisement.title, 'str'),
+    'description': Field(Advertisement.description, 'str'),
+    'price': Field(Advertisement.price, 'decimal'),
+    'status': Field(Advertisement.status, 'str'),
+    'created_at': Field(Advertisement.created_at, 'datetime'),
+    'car_id': Field(Advertisement.car_id, 'int'),
+    'user_id': Field(Advertisement.user_id, 'int'),
+    'car_details': CAR_ENCODER,
+    'publisher_mobile': Field(ad_publisher.mobile_number, 'str'),
+    'images': Field(car_images_column(Advertisement.car_id), encode_car_images),
+})
+
+def advertisement_rows(*leading):
+    """``(leading..., fields...)`` rows for the requested advertisement fields, and their encoder."""
+    encoder = ADVERTISEMENT_ENCODER.compile(ADVERTISEMENT_ENCODER.requested_fields(), offset=len(leading))
+    query = (
+        db.session.query(*leading, *encoder.columns)
+        .select_from(Advertisement)
+        .join(Car, Car.id == Advertisement.car_id)
+        .outerjoin(ad_publisher, ad_publisher.id == Advertisement.user_id)
+    )
+    return query, encoder
+
+def car_etag(car):
+    return f'car-{car.id}-{car.version}'
+
+def advertisement_etag(ad):
+    car_version = ad.car_details.version if ad.car_details else 0
+    return f'ad-{ad.id}-{ad.version}-{car_version}'
+
+def advertisement_last_modified(ad):
+    stamps = [ad.updated_at, ad.car_details.updated_at if ad.car_details else None]
+    return max((stamp for stamp in stamps if stamp), default=None)
+
+def archived_or_404(load, row_id):
+    # Archived listings are only served to callers that ask for them
+    row = load(row_id) if request.args.get('include_archived') == 'true' else None
+    if row is None:
+        abort(404)
+    return row
+
+def with_archived_at(payload, row):
+    return dict(payload, archived=True, archived_at=row.archived_at.isoformat())
+
+def listing_cache_tags(car, ad):
+    # Everything a write to this car/ad can change in the cached read endpoints
+    tags = ['cars', 'search', f'car:{car.id}', f'make:{car.make.strip().lower()}']
+    return tags + [f'ad:{ad.id}'] if ad is not None else tags
+
+def offer_cache_tags(transaction):
+    # Settling a car, or reopening it, changes its listings and its segment's valuation
+    car = transaction.car_transaction
+    return listing_cache_tags(car, car.advertisement) if car is not None else []
+
 @bp.route('/register', methods=['POST'])
 def register_user_api():
     data = request.get_json()
@@ -46,8 +187,10 @@ def register_user_api():
     if User.query.filter_by(mobile_number=mobile_number).first():
         abort(409, description="Mobile number already registered.")
 
+    password_hash = password_hasher.hash(password)
+
     try:
-        new_user = User(mobile_number=mobile_number, password_hash=generate_password_hash(password))
+        new_user = User(mobile_number=mobile_number, password_hash=password_hash)
         db.session.add(new_user)
         db.session.commit()
 
@@ -63,12 +206,87 @@ def register_user_api():
         db.session.rollback()
         abort(500, description=f"Registration failed: {e}")
 
+MAX_BULK_DEACTIVATE = 1000
+
+def serialize_user(u):
+    return {'id': u.id, 'mobile_number': u.mobile_number, 'active': u.active, 'roles': [r.name for r in u.roles]}
+
+def user_directory_query():
+    # Roles for the whole page arrive in one extra SELECT ... WHERE user_id IN (...)
+    query = User.query.options(selectinload(User.roles))
+
+    prefix = (request.args.get('mobile') or '').strip()
+    if prefix:
+        # Served on PostgreSQL by ix_users_mobile_number_pattern
+        query = query.filter(User.mobile_number.like(f'{escape_like(prefix)}%', escape='\\'))
+
+    role = request.args.get('role')
+    if role:
+        query = query.filter(User.roles.any(Role.name == role))
+
+    active = request.args.get('active')
+    if active is not None:
+        if active not in ('true', 'false'):
+            abort(400, description="active must be 'true' or 'false'.")
+        query = query.filter(User.active.is_(active == 'true'))
+    return query
+
 @bp.route('/users', methods=['GET'])
 @login_required
 @roles_required('Admin', 'Senior')
 def get_all_users():
-    users = User.query.all()
-    return jsonify([{'id': u.id, 'mobile_number': u.mobile_number, 'active': u.active, 'roles': [r.name for r in u.roles]} for u in users])
+    query = user_directory_query()
+
+    # Legacy callers without paging params still get the full list
+    if not any(arg in request.args for arg in ('limit', 'cursor')):
+        return jsonify([serialize_user(u) for u in query.order_by(User.id).all()])
+
+    limit = get_page_size()
+    users, next_cursor = paginate_keyset(
+        query,
+        (User.id,),
+        key=lambda u: (u.id,),
+        converters=(int,),
+        cursor=request.args.get('cursor'),
+        limit=limit
+    )
+    return jsonify({
+        'items': [serialize_user(u) for u in users],
+        'next_cursor': next_cursor,
+        'limit': limit
+    })
+
+@bp.route('/users/deactivate', methods=['POST'])
+@login_required
+@roles_required('Admin', 'Senior', 'Moderator')
+def bulk_deactivate_users():
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get('user_ids')
+    if not isinstance(user_ids, list) or not user_ids or not all(isinstance(i, int) for i in user_ids):
+        abort(400, description="user_ids must be a non-empty list of user IDs.")
+    if len(user_ids) > MAX_BULK_DEACTIVATE:
+        abort(400, description=f"At most {MAX_BULK_DEACTIVATE} users can be deactivated at once.")
+    if request.current_user.id in user_ids:
+        abort(400, description="You cannot deactivate your own account.")
+
+    users = User.__table__
+    conditions = [users.c.id.in_(set(user_ids)), users.c.active.is_(True)]
+    if not request.current_user.has_roles('Admin', 'Senior'):
+        # Moderators can act on ordinary accounts only
+        conditions.append(~User.roles.any(Role.name.in_(['Admin', 'Senior'])))
+
+    try:
+        deactivated = db.session.execute(
+            users.update().where(*conditions).values(active=False).returning(users.c.id)
+        ).scalars().all()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        abort(500, description=f"An error occurred: {e}")
+
+    # A Core UPDATE bypasses the session's principal tracking, so evict explicitly
+    invalidate_principal(*deactivated)
+    return jsonify({'deactivated': sorted(deactivated), 'count': len(deactivated)})
 
 @bp.route('/users/<int:user_id>/deactivate', methods=['PUT'])
 @login_required
@@ -86,24 +304,181 @@ def deactivate_user(user_id):
         abort(500, description=f"An error occurred: {e}")
 
 @bp.route('/cars', methods=['GET'])
+@replica_reads
+@cached_result('cars')
 def get_all_cars():
-    cars = Car.query.all()
-    return jsonify([serialize_car(car) for car in cars])
+    # count/max id/version sum change on every insert, delete and update
+    count, max_id, versions = db.session.query(
+        func.count(Car.id), func.max(Car.id), func.sum(Car.version)
+    ).one()
+    encoder = CAR_ENCODER.compile(CAR_ENCODER.requested_fields())
+    return conditional_response(
+        etag_for('cars', count, max_id, versions, request.args.get('fields')),
+        None,
+        lambda: json_response(encoder.encode_rows(db.session.query(*encoder.columns).all()))
+    )
 
 @bp.route('/cars/<int:car_id>', methods=['GET'])
+@replica_reads
+@cached_result('car', tags=lambda car_id: [f'car:{car_id}'])
 def get_car_by_id(car_id):
-    car = Car.query.get_or_404(car_id)
-    return jsonify(serialize_car(car))
+    car = db.session.get(Car, car_id)
+    if car is None:
+        car = archived_or_404(archived_car, car_id)
+        return conditional_response(
+            f'{car_etag(car)}-archived', car.updated_at, lambda: jsonify(with_archived_at(serialize_car(car), car))
+        )
+    return conditional_response(car_etag(car), car.updated_at, lambda: jsonify(serialize_car(car)))
+
+# sort name -> (keyset columns, cursor converters, descending)
+ADVERTISEMENT_SORTS = {
+    'newest': ((Advertisement.created_at, Advertisement.id), (datetime.fromisoformat, int), True),
+    'oldest': ((Advertisement.created_at, Advertisement.id), (datetime.fromisoformat, int), False),
+    'price_asc': ((Advertisement.price, Advertisement.id), (Decimal, int), False),
+    'price_desc': ((Advertisement.price, Advertisement.id), (Decimal, int), True),
+}
+
+MAX_IMAGES_PER_UPLOAD = 10
+
+def advertisement_listing_query():
+    return Advertisement.query.options(
+        joinedload(Advertisement.car_details).selectinload(Car.images),
+        joinedload(Advertisement.publisher)
+    )
 
 @bp.route('/advertisements', methods=['GET'])
+@replica_reads
 def get_all_advertisements():
-    advertisements = Advertisement.query.all()
-    return jsonify([serialize_advertisement(ad) for ad in advertisements])
+    # Legacy callers without paging params still get the full list, just without the N+1
+    if not any(arg in request.args for arg in ('limit', 'cursor', 'sort')):
+        count, max_id, ad_versions, car_versions = db.session.query(
+            func.count(Advertisement.id), func.max(Advertisement.id),
+            func.sum(Advertisement.version), func.sum(Car.version)
+        ).join(Car, Car.id == Advertisement.car_id).one()
+        query, encoder = advertisement_rows()
+        return conditional_response(
+            etag_for('advertisements', count, max_id, ad_versions, car_versions, request.args.get('fields')),
+            None,
+            lambda: json_response(encoder.encode_rows(query.all()))
+        )
+
+    sort = request.args.get('sort', 'newest')
+    if sort not in ADVERTISEMENT_SORTS:
+        abort(400, description=f"Invalid sort. Must be one of: {', '.join(ADVERTISEMENT_SORTS)}.")
+    columns, converters, descending = ADVERTISEMENT_SORTS[sort]
+    limit = get_page_size()
+
+    # Keyset values and versions lead each row, ahead of the requested fields
+    query, encoder = advertisement_rows(*columns, Advertisement.version, Car.version)
+    rows, next_cursor = paginate_keyset(
+        query,
+        columns,
+        key=lambda row: tuple(row[:len(columns)]),
+        converters=converters,
+        cursor=request.args.get('cursor'),
+        limit=limit,
+        descending=descending
+    )
+    ad_id, ad_version, car_version = len(columns) - 1, len(columns), len(columns) + 1
+    etag = etag_for(
+        sort, limit, next_cursor, request.args.get('fields'),
+        *(f'ad-{row[ad_id]}-{row[ad_version]}-{row[car_version]}' for row in rows)
+    )
+    return conditional_response(etag, None, lambda: json_response({
+        'items': encoder.encode_rows(rows),
+        'next_cursor': next_cursor,
+        'sort': sort,
+        'limit': limit
+    }))
+
+CHANGE_FEED_PAGE_SIZE = 100
+MAX_CHANGE_FEED_PAGE_SIZE = 500
+
+def parse_change_cursor(value):
+    return decode_cursor(value, (int,))[0]
+
+def listing_change_batch(since_id, limit):
+    upserted_ids, deleted_ids, last_id, has_more = listing_changes_since(since_id, limit)
+    ads = advertisement_listing_query().filter(Advertisement.id.in_(upserted_ids)).all() if upserted_ids else []
+    # An upsert whose row is gone by now was deleted in a later, not yet settled change
+    found = {ad.id for ad in ads}
+    return {
+        'upserted': [serialize_advertisement(ad) for ad in ads],
+        'deleted': deleted_ids + [ad_id for ad_id in upserted_ids if ad_id not in found],
+        'cursor': encode_cursor([last_id]),
+        'has_more': has_more
+    }
+
+@bp.route('/advertisements/changes', methods=['GET'])
+@replica_reads
+def get_advertisement_changes():
+    # Without since, hand out the current position; fetch it before loading the listing
+    since = request.args.get('since')
+    if not since:
+        return jsonify({'upserted': [], 'deleted': [], 'cursor': encode_cursor([head_change_id()]), 'has_more': False})
+    limit = get_page_size(default=CHANGE_FEED_PAGE_SIZE, maximum=MAX_CHANGE_FEED_PAGE_SIZE)
+    return jsonify(listing_change_batch(parse_change_cursor(since), limit))
+
+@bp.route('/advertisements/changes/stream', methods=['GET'])
+@replica_reads
+def stream_advertisement_changes():
+    if not current_app.config['CHANGE_STREAM_ENABLED']:
+        abort(404)
+    # EventSource resends the last event id when it reconnects
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    since_id = parse_change_cursor(since) if since else head_change_id()
+    check_cursor_retained(since_id)
+
+    poll_seconds = current_app.config['CHANGE_STREAM_POLL_SECONDS']
+    keepalive_seconds = current_app.config['CHANGE_STREAM_KEEPALIVE_SECONDS']
+    deadline = time.monotonic() + current_app.config['CHANGE_STREAM_MAX_SECONDS']
+
+    def events(since_id):
+        yield f"retry: {int(poll_seconds * 1000)}\n\n"
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            try:
+                batch = listing_change_batch(since_id, MAX_CHANGE_FEED_PAGE_SIZE)
+            except ChangeCursorExpired:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            finally:
+                # Give the connection back to the pool between polls
+                db.session.remove()
+            since_id = parse_change_cursor(batch['cursor'])
+            if batch['upserted'] or batch['deleted']:
+                yield f"id: {batch['cursor']}\nevent: changes\ndata: {json.dumps(batch)}\n\n"
+                last_sent = time.monotonic()
+                if batch['has_more']:
+                    continue
+            elif time.monotonic() - last_sent >= keepalive_seconds:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(poll_seconds)
+
+    return Response(
+        stream_with_context(events(since_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @bp.route('/advertisements/<int:ad_id>', methods=['GET'])
+@replica_reads
+@cached_result('advertisement', tags=lambda ad_id: [f'ad:{ad_id}'])
 def get_advertisement_by_id(ad_id):
-    ad = Advertisement.query.get_or_404(ad_id)
-    return jsonify(serialize_advertisement(ad))
+    ad = advertisement_listing_query().filter(Advertisement.id == ad_id).first()
+    if ad is None:
+        ad = archived_or_404(archived_advertisement, ad_id)
+        return conditional_response(
+            f'{advertisement_etag(ad)}-archived',
+            advertisement_last_modified(ad),
+            lambda: jsonify(with_archived_at(serialize_advertisement(ad), ad))
+        )
+    return conditional_response(
+        advertisement_etag(ad),
+        advertisement_last_modified(ad),
+        lambda: jsonify(serialize_advertisement(ad))
+    )
 
 @bp.route('/advertisements', methods=['POST'])
 @login_required
@@ -132,7 +507,15 @@ def create_advertisement():
             user_id=request.current_user.id
         )
         db.session.add(new_ad)
+        db.session.flush()
+        record_facet_change(None, facet_key(new_car, new_ad))
+        record_price_change(new_car.id, new_ad.price)
+        record_listing_changes([new_car.id])
+        notify_saved_searches([listing_of(new_car, new_ad)], REASON_NEW)
+        mark_segments_dirty([segment_of(new_car.make, new_car.model, new_car.year)])
         db.session.commit()
+        result_cache.invalidate(*listing_cache_tags(new_car, new_ad))
+        related_index.update(new_car, new_ad)
         return jsonify(serialize_advertisement(new_ad)), 201
     except IntegrityError:
         db.session.rollback()
@@ -144,6 +527,62 @@ def create_advertisement():
         db.session.rollback()
         abort(500, description=f"An error occurred: {e}")
 
+@bp.route('/advertisements/import', methods=['POST'])
+@login_required
+@roles_required('System', 'Admin', 'Senior', 'User')
+def import_advertisements():
+    report = FeedImporter(request.current_user.id).run(feed_rows(request))
+    return jsonify(report)
+
+@bp.route('/advertisements/<int:ad_id>/images', methods=['POST'])
+@login_required
+@roles_required('System', 'Admin', 'Senior', 'User')
+def upload_advertisement_images(ad_id):
+    ad = Advertisement.query.get_or_404(ad_id)
+
+    if not (request.current_user.has_roles('Admin', 'Senior') or request.current_user.id == ad.user_id):
+        abort(403, description="You do not have permission to add images to this advertisement.")
+
+    # Caps the body before the multipart parser spools any of it to disk
+    request.max_content_length = MAX_IMAGES_PER_UPLOAD * image_store.max_bytes + 64 * 1024
+    uploads = request.files.getlist('image')
+    if not uploads:
+        abort(400, description="No image provided. Send files in the 'image' form field.")
+    if len(uploads) > MAX_IMAGES_PER_UPLOAD:
+        abort(400, description=f"At most {MAX_IMAGES_PER_UPLOAD} images can be uploaded at once.")
+
+    stored = [image_store.store(upload) for upload in uploads]
+
+    try:
+        car = ad.car_details
+        images = {image.content_hash: image for image in car.images if image.content_hash}
+        for item in stored:
+            if item['content_hash'] in images:
+                continue
+            images[item['content_hash']] = CarImage(
+                car_id=car.id,
+                image_url=image_store.url(item['content_hash'], ORIGINAL, item['extension']),
+                description=request.form.get('description'),
+                content_hash=item['content_hash'],
+                content_type=item['content_type'],
+                width=item['width'],
+                height=item['height'],
+                byte_size=item['byte_size']
+            )
+            db.session.add(images[item['content_hash']])
+        # Touching the car bumps its version, so advertisement ETags change with the image list
+        car.updated_at = datetime.utcnow()
+        record_listing_changes([car.id])
+        db.session.commit()
+        result_cache.invalidate(*listing_cache_tags(car, ad))
+    except Exception as e:
+        db.session.rollback()
+        abort(500, description=f"An error occurred: {e}")
+
+    for item in stored:
+        image_store.schedule_renditions(item['content_hash'], item['extension'])
+    return jsonify([serialize_car_image(images[item['content_hash']]) for item in stored]), 201
+
 @bp.route('/advertisements/<int:ad_id>', methods=['PUT'])
 @login_required
 @roles_required('System', 'Admin', 'Senior', 'User')
@@ -154,7 +593,14 @@ def update_advertisement(ad_id):
     if not (request.current_user.has_roles('Admin', 'Senior') or request.current_user.id == ad.user_id):
         abort(403, description="You do not have permission to update this advertisement.")
 
+    require_if_match(advertisement_etag(ad))
+
     try:
+        old_facet_key = facet_key(ad.car_details, ad)
+        old_segment = segment_of(ad.car_details.make, ad.car_details.model, ad.car_details.year)
+        old_price = ad.price
+        stale_tags = listing_cache_tags(ad.car_details, ad)
+
         ad.title = data.get('title', ad.title)
         ad.description = data.get('description', ad.description)
         ad.price = data.get('price', ad.price)
@@ -168,8 +614,21 @@ def update_advertisement(ad_id):
             ad.car_details.color = car_data.get('color', ad.car_details.color)
             ad.car_details.status = car_data.get('status', ad.car_details.status)
 
+        record_facet_change(old_facet_key, facet_key(ad.car_details, ad))
+        if Decimal(str(ad.price)) != old_price:
+            record_price_change(ad.car_id, ad.price)
+            notify_saved_searches([listing_of(ad.car_details, ad)], REASON_REPRICED)
+        record_listing_changes([ad.car_id])
+        mark_segments_dirty([old_segment, segment_of(ad.car_details.make, ad.car_details.model, ad.car_details.year)])
         db.session.commit()
-        return jsonify(serialize_advertisement(ad))
+        result_cache.invalidate(*stale_tags, *listing_cache_tags(ad.car_details, ad))
+        related_index.update(ad.car_details, ad)
+        response = jsonify(serialize_advertisement(ad))
+        response.set_etag(advertisement_etag(ad))
+        return response
+    except StaleDataError:
+        db.session.rollback()
+        abort(412, description="The advertisement was modified by someone else. Reload it and try again.")
     except Exception as e:
         db.session.rollback()
         abort(500, description=f"An error occurred: {e}")
@@ -184,8 +643,16 @@ def delete_advertisement(ad_id):
         abort(403, description="You do not have permission to delete this advertisement.")
 
     try:
+        record_facet_change(facet_key(ad.car_details, ad), None)
+        stale_tags = listing_cache_tags(ad.car_details, ad)
+        segment = segment_of(ad.car_details.make, ad.car_details.model, ad.car_details.year)
+        car_id = ad.car_id
+        record_listing_deletion(ad.id, car_id)
         db.session.delete(ad)
+        mark_segments_dirty([segment])
         db.session.commit()
+        result_cache.invalidate(*stale_tags)
+        related_index.discard(car_id)
         return jsonify({'message': 'Advertisement deleted successfully'}), 204
     except Exception as e:
         db.session.rollback()
@@ -207,23 +674,12 @@ def create_transaction():
     if request.current_user.id == advertisement.user_id:
         abort(400, description="You cannot buy your own advertisement.")
 
-    if Transaction.query.filter_by(car_id=car.id, status='pending').first():
-        abort(409, description="This car is already part of a pending transaction.")
-
-    try:
-        new_transaction = Transaction(
-            car_id=car.id,
-            buyer_id=request.current_user.id,
-            seller_id=advertisement.user_id,
-            agreed_price=data['agreed_price'],
-            status='pending'
-        )
-        db.session.add(new_transaction)
-        db.session.commit()
-        return jsonify({'message': 'Transaction initiated successfully', 'transaction_id': new_transaction.id}), 201
-    except Exception as e:
-        db.session.rollback()
-        abort(500, description=f"Failed to initiate transaction: {e}")
+    # Any number of buyers may bid on the same car; offers only conflict on acceptance
+    buyer_id, seller_id = request.current_user.id, advertisement.user_id
+    new_transaction = run_with_retries(
+        'place_offer', lambda: place_offer(car.id, buyer_id, seller_id, data['agreed_price'])
+    )
+    return jsonify({'message': 'Transaction initiated successfully', 'transaction_id': new_transaction.id}), 201
 
 @bp.route('/transactions/<int:transaction_id>/status', methods=['PUT'])
 @login_required
@@ -239,77 +695,446 @@ def update_transaction_status(transaction_id):
     if not (request.current_user.has_roles('Admin', 'Senior') or request.current_user.id == transaction.seller_id):
         abort(403, description="You do not have permission to update this transaction's status.")
 
+    if new_status == 'completed' and transaction.status != OFFER_ACCEPTED:
+        # A pending offer goes through acceptance first, which rejects its competitors
+        abort(409, description="Only an accepted offer can be completed.")
+
+    stale_tags = offer_cache_tags(transaction)
+    if new_status == OFFER_ACCEPTED:
+        rejected = run_with_retries('accept_offer', lambda: accept_offer(transaction))
+        result_cache.invalidate(*stale_tags)
+        return jsonify({
+            'message': f'Transaction {transaction_id} status updated to {new_status}',
+            'rejected_offers': rejected,
+        })
+
     try:
+        settles = {transaction.status, new_status} & {OFFER_ACCEPTED, 'completed'}
         transaction.status = new_status
         db.session.commit()
+        if settles:
+            result_cache.invalidate(*stale_tags)
         return jsonify({'message': f'Transaction {transaction_id} status updated to {new_status}'})
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, description="Another offer on this car has already been accepted.")
     except Exception as e:
         db.session.rollback()
         abort(500, description=f"Failed to update transaction status: {e}")
 
+TRANSACTION_SORTS = {
+    'newest': ((Transaction.transaction_date, Transaction.id), (datetime.fromisoformat, int), True),
+    'oldest': ((Transaction.transaction_date, Transaction.id), (datetime.fromisoformat, int), False),
+}
+
+TRANSACTION_STATUSES = ('pending', 'accepted', 'rejected', 'completed')
+
+def serialize_transaction(t):
+    car = t.car_transaction or t.archived_car
+    return {
+        'id': t.id,
+        'car_id': t.car_id,
+        'buyer_id': t.buyer_id,
+        'seller_id': t.seller_id,
+        'status': t.status,
+        'agreed_price': str(t.agreed_price),
+        'transaction_date': t.transaction_date.isoformat(),
+        'car_make': car.make if car else None,
+        'buyer_mobile': t.buyer.mobile_number if t.buyer else None,
+        'seller_mobile': t.seller.mobile_number if t.seller else None,
+    }
+
+transaction_buyer, transaction_seller = aliased(User), aliased(User)
+
+TRANSACTION_ENCODER = RowEncoder({
+    'id': Field(Transaction.id, 'int'),
+    'car_id': Field(Transaction.car_id, 'int'),
+    'buyer_id': Field(Transaction.buyer_id, 'int'),
+    'seller_id': Field(Transaction.seller_id, 'int'),
+    'status': Field(Transaction.status, 'str'),
+    'agreed_price': Field(Transaction.agreed_price, 'decimal'),
+    'transaction_date': Field(Transaction.transaction_date, 'datetime'),
+    'car_make': Field(func.coalesce(Car.make, ArchivedCar.make), 'str'),
+    'buyer_mobile': Field(transaction_buyer.mobile_number, 'str'),
+    'seller_mobile': Field(transaction_seller.mobile_number, 'str'),
+})
+
+def parse_iso_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f"{name} must be an ISO 8601 date or timestamp.")
+
+def transaction_listing_query(*leading):
+    """``(leading..., fields...)`` rows for the caller's transactions, and their encoder."""
+    encoder = TRANSACTION_ENCODER.compile(TRANSACTION_ENCODER.requested_fields(), offset=len(leading))
+    # Car and both parties come back in the same SELECT
+    query = (
+        db.session.query(*leading, *encoder.columns)
+        .select_from(Transaction)
+        .outerjoin(Car, Car.id == Transaction.car_id)
+        .outerjoin(ArchivedCar, ArchivedCar.id == Transaction.car_id)
+        .outerjoin(transaction_buyer, transaction_buyer.id == Transaction.buyer_id)
+        .outerjoin(transaction_seller, transaction_seller.id == Transaction.seller_id)
+    )
+
+    user = request.current_user
+    party = request.args.get('party')
+    if party not in (None, 'buyer', 'seller'):
+        abort(400, description="Invalid party. Must be 'buyer' or 'seller'.")
+    if party == 'buyer':
+        query = query.filter(Transaction.buyer_id == user.id)
+    elif party == 'seller':
+        query = query.filter(Transaction.seller_id == user.id)
+    elif not user.has_roles('Admin', 'Senior'):
+        query = query.filter((Transaction.buyer_id == user.id) | (Transaction.seller_id == user.id))
+
+    status = request.args.get('status')
+    if status:
+        statuses = status.split(',')
+        if any(s not in TRANSACTION_STATUSES for s in statuses):
+            abort(400, description=f"Invalid status. Must be among: {', '.join(TRANSACTION_STATUSES)}.")
+        query = query.filter(Transaction.status.in_(statuses))
+
+    since, until = parse_iso_arg('since'), parse_iso_arg('until')
+    if since:
+        query = query.filter(Transaction.transaction_date >= since)
+    if until:
+        query = query.filter(Transaction.transaction_date < until)
+    return query, encoder
+
 @bp.route('/transactions', methods=['GET'])
 @login_required
 @roles_required('User', 'Admin', 'Senior', 'Seller')
 def get_user_transactions():
-    if request.current_user.has_roles('Admin', 'Senior'):
-        transactions = Transaction.query.all()
-    else:
-        transactions = Transaction.query.filter(
-            (Transaction.buyer_id == request.current_user.id) |
-            (Transaction.seller_id == request.current_user.id)
-        ).all()
-
-    serialized_transactions = []
-    for t in transactions:
-        serialized_transactions.append({
-            'id': t.id,
-            'car_id': t.car_id,
-            'buyer_id': t.buyer_id,
-            'seller_id': t.seller_id,
-            'status': t.status,
-            'agreed_price': str(t.agreed_price),
-            'transaction_date': t.transaction_date.isoformat(),
-            'car_make': t.car_transaction.make if t.car_transaction else None,
-            'buyer_mobile': t.buyer.mobile_number if t.buyer else None,
-            'seller_mobile': t.seller.mobile_number if t.seller else None,
-        })
-    return jsonify(serialized_transactions)
+    # Legacy callers without paging params still get the full list
+    if not any(arg in request.args for arg in ('limit', 'cursor', 'sort')):
+        query, encoder = transaction_listing_query()
+        return json_response(encoder.encode_rows(query.order_by(Transaction.id).all()))
+
+    sort = request.args.get('sort', 'newest')
+    if sort not in TRANSACTION_SORTS:
+        abort(400, description=f"Invalid sort. Must be one of: {', '.join(TRANSACTION_SORTS)}.")
+    columns, converters, descending = TRANSACTION_SORTS[sort]
+    limit = get_page_size()
+
+    query, encoder = transaction_listing_query(*columns)
+    rows, next_cursor = paginate_keyset(
+        query,
+        columns,
+        key=lambda row: tuple(row[:len(columns)]),
+        converters=converters,
+        cursor=request.args.get('cursor'),
+        limit=limit,
+        descending=descending
+    )
+    return json_response({
+        'items': encoder.encode_rows(rows),
+        'next_cursor': next_cursor,
+        'sort': sort,
+        'limit': limit
+    })
+
+@bp.route('/export/advertisements', methods=['GET'])
+@login_required
+@roles_required('Admin', 'Senior', 'System')
+@replica_reads
+def export_advertisements():
+    return export_response('advertisements', advertisement_export_query)
+
+@bp.route('/export/transactions', methods=['GET'])
+@login_required
+@roles_required('Admin', 'Senior', 'System')
+@replica_reads
+def export_transactions():
+    return export_response('transactions', transaction_export_query)
 
 @bp.route('/cars/<int:car_id>/related', methods=['GET'])
+@replica_reads
 def get_related_cars(car_id):
-    main_car = Car.query.get_or_404(car_id)
-    related_cars = Car.query.filter(
-        Car.make == main_car.make,
-        Car.id != main_car.id
-    ).limit(5).all()
+    limit = request.args.get('limit', DEFAULT_RELATED_LIMIT, type=int)
+    if not 1 <= limit <= MAX_RELATED_LIMIT:
+        abort(400, description=f"limit must be between 1 and {MAX_RELATED_LIMIT}.")
+    related = related_cars(car_id, limit)
+    if related is None:
+        abort(404)
+    return jsonify(related)
 
-    return jsonify([serialize_car(car) for car in related_cars])
+def get_trend_days():
+    try:
+        days = int(request.args.get('days', DEFAULT_TREND_DAYS))
+    except ValueError:
+        abort(400, description="days must be an integer.")
+    if not 1 <= days <= MAX_TREND_DAYS:
+        abort(400, description=f"days must be between 1 and {MAX_TREND_DAYS}.")
+    return days
+
+@bp.route('/cars/<int:car_id>/price-history', methods=['GET'])
+@replica_reads
+@cached_result('price_history', tags=lambda car_id: [f'car:{car_id}'])
+def get_car_price_history(car_id):
+    car = db.session.get(Car, car_id)
+    history = PriceHistory
+    if car is None:
+        car, history = archived_or_404(archived_car, car_id), ArchivedPriceHistory
+    days = get_trend_days()
+    tag_cached_result(f'make:{car.make.strip().lower()}')
+    payload = {
+        'car_id': car.id,
+        'history': car_price_series(car.id, history),
+        'trend': segment_trend(car.make, car.model, car.year, days)
+    }
+    return jsonify(with_archived_at(payload, car) if history is ArchivedPriceHistory else payload)
+
+@bp.route('/price-trends', methods=['GET'])
+@replica_reads
+@cached_result('price_trends')
+def get_price_trends():
+    make, model, year = request.args.get('make'), request.args.get('model'), request.args.get('year', type=int)
+    if not make or not model or year is None:
+        abort(400, description="make, model and an integer year are required.")
+    days = get_trend_days()
+    tag_cached_result(f'make:{make.strip().lower()}')
+    return jsonify({
+        'make': make.strip(), 'model': model.strip(), 'year': year,
+        'trend': segment_trend(make, model, year, days)
+    })
+
+@bp.route('/valuation', methods=['GET'])
+@replica_reads
+@cached_result('valuation')
+def get_market_valuation():
+    segment = parse_segment(request.args)
+    tag_cached_result(f"make:{segment['make']}")
+    return jsonify(market_valuation(segment))
+
+@bp.route('/cache/stats', methods=['GET'])
+@login_required
+@roles_required('Admin', 'Senior')
+def get_cache_stats():
+    return jsonify(dict(result_cache.stats(), enabled=result_cache.enabled))
+
+def serialize_job_state(state):
+    return {
+        'name': state.name,
+        'status': state.status,
+        'processed': state.processed,
+        'batches': state.batches,
+        'last_started_at': state.last_started_at.isoformat() if state.last_started_at else None,
+        'last_finished_at': state.last_finished_at.isoformat() if state.last_finished_at else None,
+        'last_duration_ms': state.last_duration_ms,
+        'next_run_at': state.next_run_at.isoformat() if state.next_run_at else None,
+        'lease_owner': state.lease_owner,
+        'last_error': state.last_error,
+    }
+
+@bp.route('/jobs', methods=['GET'])
+@login_required
+@roles_required('Admin', 'Senior')
+def get_job_states():
+    return jsonify([serialize_job_state(state) for state in job_runner.states()])
+
+def serialize_search_result(car, ad):
+    result = serialize_car(car)
+    result.update({
+        'advertisement_id': ad.id,
+        'title': ad.title,
+        'price': str(ad.price),
+        'ad_status': ad.status,
+        'created_at': ad.created_at.isoformat()
+    })
+    return result
+
+@bp.route('/search/cars/facets', methods=['GET'])
+@replica_reads
+@cached_result('search_facets', tags=lambda: ['search'])
+def car_search_facets():
+    return jsonify(facet_counts(parse_search_criteria(request.args)))
 
 @bp.route('/search/cars', methods=['GET'])
+@replica_reads
+@cached_result('search')
 def advanced_car_search():
-    query = Car.query.join(Advertisement)
+    criteria = parse_search_criteria(request.args)
+    filters = search_filters(criteria)
+    words = criteria['text']
 
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
-    brand = request.args.get('brand')
-    color = request.args.get('color')
-    status = request.args.get('status')
-
-    filters = []
+    # Legacy callers without paging params keep the plain list of cars
+    if not words and not any(arg in request.args for arg in ('limit', 'cursor', 'sort')):
+        query = Car.query.join(Advertisement)
+        if filters:
+            query = query.filter(and_(*filters))
+        return jsonify([serialize_car(car) for car in query.all()])
 
-    if min_price is not None:
-        filters.append(Advertisement.price >= min_price)
-    if max_price is not None:
-        filters.append(Advertisement.price <= max_price)
-    if brand:
-        filters.append(Car.make.ilike(f'%{brand}%'))
-    if color:
-        filters.append(Car.color.ilike(f'%{color}%'))
-    if status:
-        filters.append(Car.status == status)
+    sort = request.args.get('sort', RELEVANCE_SORT if words else 'newest')
+    if sort == RELEVANCE_SORT and not words:
+        abort(400, description="Sorting by relevance needs a q text query.")
+    if sort != RELEVANCE_SORT and sort not in SEARCH_SORTS:
+        abort(400, description=f"Invalid sort. Must be one of: {', '.join((RELEVANCE_SORT, *SEARCH_SORTS))}.")
+    limit = get_page_size()
 
+    query = db.session.query(Car, Advertisement).join(Advertisement, Advertisement.car_id == Car.id)
     if filters:
         query = query.filter(and_(*filters))
+    if words:
+        query, rank = fulltext_match(query, words, db.session.get_bind().dialect.name)
+        query = query.add_columns(rank.label('rank'))
+
+    if sort == RELEVANCE_SORT:
+        columns, converters, descending = (rank, Advertisement.id), (float, int), True
+        key = lambda row: (row.rank, row[1].id)
+    else:
+        columns, converters, descending = SEARCH_SORTS[sort]
+        key = sort_key(columns)
 
-    search_results = query.all()
-    return jsonify([serialize_car(car) for car in search_results])
\ No newline at end of file
+    rows, next_cursor = paginate_keyset(
+        query,
+        columns,
+        key=key,
+        converters=converters,
+        cursor=request.args.get('cursor'),
+        limit=limit,
+        descending=descending
+    )
+    return jsonify({
+        'items': [serialize_search_result(row[0], row[1]) for row in rows],
+        'next_cursor': next_cursor,
+        'sort': sort,
+        'limit': limit
+    })
+
+def serialize_saved_search(s):
+    return {
+        'id': s.id,
+        'name': s.name,
+        'brand': s.brand,
+        'model': s.model,
+        'color': s.color,
+        'status': s.status,
+        'min_price': str(s.min_price) if s.min_price is not None else None,
+        'max_price': str(s.max_price) if s.max_price is not None else None,
+        'min_year': s.min_year,
+        'max_year': s.max_year,
+        'match': s.match,
+        'created_at': s.created_at.isoformat()
+    }
+
+@bp.route('/saved-searches', methods=['GET'])
+@login_required
+@roles_required('User', 'Admin', 'Senior', 'Seller')
+def get_saved_searches():
+    searches = SavedSearch.query.filter_by(user_id=request.current_user.id).order_by(SavedSearch.id).all()
+    return jsonify([serialize_saved_search(s) for s in searches])
+
+@bp.route('/saved-searches', methods=['POST'])
+@login_required
+@roles_required('User', 'Admin', 'Senior', 'Seller')
+def create_saved_search_api():
+    data = request.get_json()
+    if not data:
+        abort(400, description="No JSON data provided")
+
+    name = str(data.get('name') or '').strip()
+    if not name or len(name) > 100:
+        abort(400, description="A name of at most 100 characters is required.")
+    # Same filters, parsing and normalization as /api/search/cars
+    criteria = parse_search_criteria(MultiDict({
+        key: str(value) for key, value in data.items() if key != 'name' and value not in (None, '')
+    }))
+    validate_saved_search(criteria)
+
+    if SavedSearch.query.filter_by(user_id=request.current_user.id).count() >= MAX_SAVED_SEARCHES_PER_USER:
+        abort(400, description=f"You can keep at most {MAX_SAVED_SEARCHES_PER_USER} saved searches.")
+
+    try:
+        search = create_saved_search(request.current_user.id, name, criteria)
+        db.session.commit()
+        return jsonify(serialize_saved_search(search)), 201
+    except Exception as e:
+        db.session.rollback()
+        abort(500, description=f"An error occurred: {e}")
+
+@bp.route('/saved-searches/<int:search_id>', methods=['DELETE'])
+@login_required
+@roles_required('User', 'Admin', 'Senior', 'Seller')
+def delete_saved_search(search_id):
+    search = SavedSearch.query.filter_by(id=search_id, user_id=request.current_user.id).first_or_404()
+    try:
+        db.session.delete(search)
+        db.session.commit()
+        return jsonify({'message': 'Saved search deleted successfully'}), 204
+    except Exception as e:
+        db.session.rollback()
+        abort(500, description=f"An error occurred: {e}")
+
+def serialize_notification(n):
+    return {
+        'id': n.id,
+        'reason': n.reason,
+        'saved_search_id': n.saved_search_id,
+        'saved_search_name': n.saved_search.name if n.saved_search else None,
+        'advertisement_id': n.advertisement_id,
+        'title': n.advertisement.title if n.advertisement else None,
+        'price': str(n.price) if n.price is not None else None,
+        'created_at': n.created_at.isoformat(),
+        'read': n.read_at is not None
+    }
+
+def unread_notification_count(user_id):
+    return db.session.scalar(
+        db.select(func.count(Notification.id)).where(Notification.user_id == user_id, Notification.read_at.is_(None))
+    )
+
+@bp.route('/notifications', methods=['GET'])
+@login_required
+@roles_required('User', 'Admin', 'Senior', 'Seller')
+def get_notifications():
+    query = Notification.query.options(
+        joinedload(Notification.saved_search), joinedload(Notification.advertisement)
+    ).filter(Notification.user_id == request.current_user.id)
+    if request.args.get('unread') == 'true':
+        query = query.filter(Notification.read_at.is_(None))
+    limit = get_page_size()
+
+    notifications, next_cursor = paginate_keyset(
+        query,
+        (Notification.id,),
+        key=lambda n: (n.id,),
+        converters=(int,),
+        cursor=request.args.get('cursor'),
+        limit=limit,
+        descending=True
+    )
+    return jsonify({
+        'items': [serialize_notification(n) for n in notifications],
+        'next_cursor': next_cursor,
+        'limit': limit,
+        'unread_count': unread_notification_count(request.current_user.id)
+    })
+
+@bp.route('/notifications/read', methods=['POST'])
+@login_required
+@roles_required('User', 'Admin', 'Senior', 'Seller')
+def mark_notifications_read():
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not data.get('all') and not (isinstance(ids, list) and all(isinstance(i, int) for i in ids)):
+        abort(400, description="Send a list of notification ids, or all: true.")
+
+    statement = (
+        db.update(Notification)
+        .where(Notification.user_id == request.current_user.id, Notification.read_at.is_(None))
+        .values(read_at=datetime.utcnow())
+    )
+    if not data.get('all'):
+        statement = statement.where(Notification.id.in_(ids))
+    try:
+        updated = db.session.execute(statement).rowcount
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        abort(500, description=f"An error occurred: {e}")
+    return jsonify({'updated': updated, 'unread_count': unread_notification_count(request.current_user.id)})
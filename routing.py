@@ -0,0 +1,85 @@
+import random
+import time
+from functools import wraps
+
+from flask import g, session, has_request_context, current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_PREFIX = 'replica'
+
+
+def replica_binds(app):
+    return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {} if key.startswith(REPLICA_BIND_PREFIX))
+
+
+def _sticky():
+    return session.get('read_primary_until', 0) > time.time()
+
+
+def _replica_key():
+    if 'replica_key' not in g:
+        binds = replica_binds(current_app)
+        g.replica_key = random.choice(binds) if binds and not _sticky() else None
+    return g.replica_key
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of ``replica_reads`` views to a replica bind.
+
+    Flushes and DML always go to the primary, as does every read for a
+    browser session that committed a write within ``REPLICA_STICKY_SECONDS``.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('replica_reads'):
+            if not getattr(clause, 'is_dml', False):
+                key = _replica_key()
+                if key is not None:
+                    return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_write(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_statement_write(orm_execute_state):
+    # Core and bulk DML run through session.execute() without a flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(db_session):
+    if not db_session.info.pop('wrote', False) or not has_request_context():
+        return
+    sticky_seconds = current_app.config.get('REPLICA_STICKY_SECONDS', 0)
+    if sticky_seconds and replica_binds(current_app):
+        session['read_primary_until'] = time.time() + sticky_seconds
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(db_session):
+    db_session.info.pop('wrote', None)
+
+
+def pinned_to_primary():
+    """Whether this browser session's reads stay on the primary after a recent write."""
+    return has_request_context() and _sticky()
+
+
+def served_from_replica():
+    """Whether this request's reads went to a replica."""
+    return has_request_context() and g.get('replica_key') is not None
+
+
+def replica_reads(f):
+    """Let a read-only view's queries run on a replica."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.replica_reads = True
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,145 @@
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import select, insert, or_, tuple_
+
+from extensions import db
+from models import SavedSearch, SavedSearchTerm, Notification
+from facets import PRICE_BUCKET_EDGES, price_bucket
+
+MAX_SAVED_SEARCHES_PER_USER = 50
+MAX_TERM_LENGTH = 50
+SAVED_SEARCH_FIELDS = ('brand', 'model', 'color', 'status', 'min_price', 'max_price', 'min_year', 'max_year', 'match')
+# Most selective first: a saved search is indexed under the first of these it sets
+TEXT_ANCHORS = ('brand', 'model', 'color')
+# Contains-searches are indexed under one n-gram of their term; shorter terms go in whole
+ANCHOR_GRAM = 3
+
+REASON_NEW = 'new_listing'
+REASON_REPRICED = 'price_change'
+
+Listing = namedtuple('Listing', 'ad_id seller_id make model color status year price ad_status')
+
+
+def listing_of(car, ad):
+    return Listing(ad.id, ad.user_id, car.make, car.model, car.color, car.status, car.year, ad.price, ad.status)
+
+
+def validate_saved_search(criteria):
+    if criteria.get('text'):
+        abort(400, description="Saved searches cannot include a q text query.")
+    if not any(criteria.get(field) is not None for field in SAVED_SEARCH_FIELDS if field != 'match'):
+        abort(400, description="A saved search needs at least one filter.")
+    for field in TEXT_ANCHORS:
+        if criteria.get(field) and len(criteria[field]) > MAX_TERM_LENGTH:
+            abort(400, description=f"{field} may be at most {MAX_TERM_LENGTH} characters.")
+
+
+def anchor_terms(criteria):
+    """The inverted index entries for a saved search.
+
+    Each search is indexed under one predicate only; a listing that cannot
+    satisfy it never looks at the search. Exact matches index the whole
+    term; a substring match indexes the term's first trigram, which any
+    value containing the term contains too. Price ranges cover every
+    bucket they overlap.
+    """
+    for field in TEXT_ANCHORS:
+        if criteria.get(field):
+            if criteria['match'] != 'contains':
+                return [(f'{field}_exact', criteria[field])]
+            return [_contains_anchor(field, criteria[field])]
+    if criteria.get('min_price') is not None or criteria.get('max_price') is not None:
+        low = price_bucket(max(criteria.get('min_price') or 0, 0))
+        high = len(PRICE_BUCKET_EDGES) - 1
+        if criteria.get('max_price') is not None:
+            high = price_bucket(max(criteria['max_price'], 0))
+        return [('price_bucket', str(bucket)) for bucket in range(low, high + 1)]
+    if criteria.get('status'):
+        return [('status', criteria['status'])]
+    return [('any', '')]
+
+
+def create_saved_search(user_id, name, criteria):
+    search = SavedSearch(user_id=user_id, name=name, **{field: criteria.get(field) for field in SAVED_SEARCH_FIELDS})
+    search.terms = [SavedSearchTerm(field=field, term=term) for field, term in anchor_terms(criteria)]
+    db.session.add(search)
+    return search
+
+
+def _contains_anchor(field, term):
+    if len(term) >= ANCHOR_GRAM:
+        return (f'{field}_gram', term[:ANCHOR_GRAM])
+    return (f'{field}_short', term)
+
+
+def _grams(value, length):
+    return {value[i:i + length] for i in range(len(value) - length + 1)}
+
+
+def probe_terms(listing):
+    """Every index entry a listing may satisfy, about three per character of make, model and color.
+
+    A contains-search found through its trigram is only a candidate;
+    ``matching_searches`` checks the whole term afterwards.
+    """
+    terms = {('any', ''), ('price_bucket', str(price_bucket(listing.price))), ('status', listing.status)}
+    for field in TEXT_ANCHORS:
+        # Search compares against lower(column), so listings are probed the same way
+        value = getattr(listing, 'make' if field == 'brand' else field).lower()
+        terms.add((f'{field}_exact', value))
+        terms.update((f'{field}_gram', gram) for gram in _grams(value, ANCHOR_GRAM))
+        for length in range(1, ANCHOR_GRAM):
+            terms.update((f'{field}_short', gram) for gram in _grams(value, length))
+    return terms
+
+
+def _text_matches(term, value, match):
+    if term is None:
+        return True
+    return value.lower() == term if match == 'exact' else term in value.lower()
+
+
+def matching_searches(listing):
+    """Rows of the saved searches, other than the seller's own, that ``listing`` satisfies."""
+    price = listing.price
+    candidates = db.session.execute(
+        select(SavedSearch.id, SavedSearch.user_id, SavedSearch.brand, SavedSearch.model, SavedSearch.color,
+               SavedSearch.match)
+        .distinct()
+        .join(SavedSearchTerm, SavedSearchTerm.saved_search_id == SavedSearch.id)
+        .where(
+            tuple_(SavedSearchTerm.field, SavedSearchTerm.term).in_(list(probe_terms(listing))),
+            SavedSearch.user_id != listing.seller_id,
+            or_(SavedSearch.min_price.is_(None), SavedSearch.min_price <= price),
+            or_(SavedSearch.max_price.is_(None), SavedSearch.max_price >= price),
+            or_(SavedSearch.min_year.is_(None), SavedSearch.min_year <= listing.year),
+            or_(SavedSearch.max_year.is_(None), SavedSearch.max_year >= listing.year),
+            or_(SavedSearch.status.is_(None), SavedSearch.status == listing.status),
+        )
+    ).all()
+    # Text predicates, the anchored one included, are checked on the few candidates
+    return [
+        search for search in candidates
+        if _text_matches(search.brand, listing.make, search.match)
+        and _text_matches(search.model, listing.model, search.match)
+        and _text_matches(search.color, listing.color, search.match)
+    ]
+
+
+def notify_saved_searches(listings, reason, when=None):
+    """Queue inbox notifications for active ``listings``; call before commit. Returns how many."""
+    when = when or datetime.utcnow()
+    rows = []
+    for listing in listings:
+        if listing.ad_status != 'active':
+            continue
+        rows.extend(
+            {'user_id': search.user_id, 'saved_search_id': search.id, 'advertisement_id': listing.ad_id,
+             'reason': reason, 'price': listing.price, 'created_at': when}
+            for search in matching_searches(listing)
+        )
+    if rows:
+        db.session.execute(insert(Notification.__table__), rows)
+    return len(rows)
@@ -0,0 +1,131 @@
+import re
+from datetime import datetime
+from decimal import Decimal
+
+from flask import abort
+from sqlalchemy import func, and_, or_, literal, literal_column, table, column
+
+from models import Car, Advertisement
+
+MATCH_MODES = ('contains', 'exact')
+RELEVANCE_SORT = 'relevance'
+MAX_QUERY_WORDS = 16
+WORD_PATTERN = re.compile(r'\w+')
+
+# FTS5 shadow table on SQLite; its hidden column of the same name is the MATCH target
+ADVERTISEMENTS_FTS = table('advertisements_fts', column('rowid'), column('advertisements_fts'))
+
+# sort name -> (keyset columns, cursor converters, descending)
+SEARCH_SORTS = {
+    'newest': ((Advertisement.created_at, Advertisement.id), (datetime.fromisoformat, int), True),
+    'price_asc': ((Advertisement.price, Advertisement.id), (Decimal, int), False),
+    'price_desc': ((Advertisement.price, Advertisement.id), (Decimal, int), True),
+    'year_desc': ((Car.year, Advertisement.id), (int, int), True),
+    'year_asc': ((Car.year, Advertisement.id), (int, int), False),
+}
+
+
+def normalize_term(value):
+    if value is None:
+        return None
+    normalized = ' '.join(value.split()).lower()
+    return normalized or None
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def text_filter(column, term, match='contains'):
+    # lower(column) is what the functional btree and trigram indexes are built on
+    normalized = func.lower(column)
+    if match == 'exact':
+        return normalized == term
+    return normalized.like(f'%{escape_like(term)}%', escape='\\')
+
+
+def parse_search_criteria(args):
+    """Read the search filters out of a query-string mapping into a plain dict."""
+    match = args.get('match', 'contains')
+    if match not in MATCH_MODES:
+        abort(400, description=f"Invalid match. Must be one of: {', '.join(MATCH_MODES)}.")
+
+    criteria = {
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+        'min_year': args.get('min_year', type=int),
+        'max_year': args.get('max_year', type=int),
+        'brand': normalize_term(args.get('brand')),
+        'model': normalize_term(args.get('model')),
+        'color': normalize_term(args.get('color')),
+        'status': args.get('status') or None,
+        'ad_status': args.get('ad_status') or None,
+        'match': match,
+        'text': query_words(args.get('q')),
+    }
+    return criteria
+
+
+def query_words(value):
+    if value is None:
+        return None
+    words = WORD_PATTERN.findall(value.lower())
+    if not words:
+        abort(400, description="q must contain at least one word.")
+    return words[:MAX_QUERY_WORDS]
+
+
+def fulltext_match(query, words, dialect):
+    """Restrict ``query`` to ads whose title or description match all ``words``.
+
+    Returns ``(query, rank)``, where a higher rank is a better match.
+    """
+    if dialect == 'postgresql':
+        vector = literal_column('advertisements.search_vector')
+        tsquery = func.plainto_tsquery('english', ' '.join(words))
+        return query.filter(vector.op('@@')(tsquery)), func.ts_rank_cd(vector, tsquery)
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{word}"' for word in words)
+        # bm25 is lower-is-better; title hits weigh ten times description hits
+        rank = -func.bm25(literal_column('advertisements_fts'), 10.0, 1.0)
+        query = query.join(ADVERTISEMENTS_FTS, ADVERTISEMENTS_FTS.c.rowid == Advertisement.id)
+        return query.filter(ADVERTISEMENTS_FTS.c.advertisements_fts.op('MATCH')(match)), rank
+    # No text index elsewhere: every word has to appear somewhere, unranked
+    return query.filter(and_(*(
+        or_(text_filter(Advertisement.title, word), text_filter(Advertisement.description, word))
+        for word in words
+    ))), literal(0.0)
+
+
+def search_filters(criteria):
+    filters = []
+    match = criteria.get('match', 'contains')
+
+    if criteria.get('min_price') is not None:
+        filters.append(Advertisement.price >= criteria['min_price'])
+    if criteria.get('max_price') is not None:
+        filters.append(Advertisement.price <= criteria['max_price'])
+    if criteria.get('min_year') is not None:
+        filters.append(Car.year >= criteria['min_year'])
+    if criteria.get('max_year') is not None:
+        filters.append(Car.year <= criteria['max_year'])
+    if criteria.get('brand'):
+        filters.append(text_filter(Car.make, criteria['brand'], match))
+    if criteria.get('model'):
+        filters.append(text_filter(Car.model, criteria['model'], match))
+    if criteria.get('color'):
+        filters.append(text_filter(Car.color, criteria['color'], match))
+    if criteria.get('status'):
+        filters.append(Car.status == criteria['status'])
+    if criteria.get('ad_status'):
+        filters.append(Advertisement.status == criteria['ad_status'])
+
+    return filters
+
+
+def sort_key(columns):
+    """Build a keyset key function for ``(Car, Advertisement)`` result rows."""
+    def key(row):
+        car, ad = row[0], row[1]
+        return tuple(getattr(car if column.class_ is Car else ad, column.key) for column in columns)
+    return key
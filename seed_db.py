@@ -22,7 +22,7 @@ def seed_initial_data():
         admin_mobile = '09123456789'
         admin_password = 'adminpass'
         if not User.query.filter_by(mobile_number=admin_mobile).first():
-            user = User(mobile_number=admin_mobile, password_hash=generate_password_hash(admin_password))
+            user = User(mobile_number=admin_mobile, password_hash=generate_password_hash(admin_password, app.config['PASSWORD_HASH_METHOD']))
             db.session.add(user)
             db.session.commit()
 
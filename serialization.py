@@ -0,0 +1,142 @@
+import json
+from collections import namedtuple
+from json.encoder import encode_basestring_ascii
+from threading import Lock
+
+from flask import current_app, request, abort
+from sqlalchemy import String
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# value kind -> JSON text for a non-null value, written the way jsonify writes it
+VALUE_ENCODERS = {
+    'int': int.__repr__,
+    'str': encode_basestring_ascii,
+    # Numeric columns go out as strings, like str(Decimal)
+    'decimal': lambda value: f'"{value}"',
+    'datetime': lambda value: f'"{value.isoformat()}"',
+    'bool': lambda value: 'true' if value else 'false',
+}
+_JSON = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+# ``kind`` names a ``VALUE_ENCODERS`` entry, or is itself a function from a non-null value to JSON text
+Field = namedtuple('Field', 'column kind')
+
+
+class json_rows(FunctionElement):
+    """Aggregate: the grouped rows of ``columns`` as JSON text, one array per row, or NULL for none.
+
+    Rows come in the order the aggregated subquery yields them.
+    """
+    type = String()
+    inherit_cache = True
+
+
+@compiles(json_rows, 'sqlite')
+def _json_rows_sqlite(element, compiler, **kw):
+    return f'json_group_array(json_array({compiler.process(element.clauses, **kw)}))'
+
+
+@compiles(json_rows, 'postgresql')
+def _json_rows_postgresql(element, compiler, **kw):
+    return f'CAST(json_agg(json_build_array({compiler.process(element.clauses, **kw)})) AS TEXT)'
+
+
+class RawJSON(str):
+    """JSON text that ``dumps`` splices into the enclosing document as it is."""
+
+
+def dumps(value):
+    """Compact, key-sorted ASCII JSON, byte for byte what jsonify writes outside debug mode.
+
+    A ``RawJSON`` value, or a dict member that is one, is spliced in as it is.
+    """
+    if isinstance(value, RawJSON):
+        return value
+    if isinstance(value, dict) and any(isinstance(member, RawJSON) for member in value.values()):
+        return '{' + ','.join(f'{encode_basestring_ascii(key)}:{dumps(value[key])}' for key in sorted(value)) + '}'
+    return _JSON.encode(value)
+
+
+def json_response(value):
+    return current_app.response_class(dumps(value) + '\n', mimetype=current_app.json.mimetype)
+
+
+class CompiledEncoder:
+    """A ``RowEncoder`` specialized to one field selection and row layout."""
+
+    def __init__(self, columns, template, parts):
+        self.columns = columns
+
+        def encode_row(row):
+            return template % tuple([part(row) for part in parts])
+        self.encode_row = encode_row
+
+    def encode_rows(self, rows):
+        """A JSON array of ``rows``, ready to drop into a document as ``RawJSON``."""
+        return RawJSON('[' + ','.join(map(self.encode_row, rows)) + ']')
+
+
+class RowEncoder:
+    """Writes JSON objects straight from result row tuples instead of ORM objects.
+
+    ``fields`` maps each output key to a ``Field`` (a column and how to
+    encode its value), or a nested ``RowEncoder`` for an embedded object
+    that is ``null`` when its first column is. ``compile`` lays
+    the needed columns out after ``offset`` leading columns the caller keeps
+    for itself (keyset values, versions) and is cached per field selection.
+    Keys come out sorted, like jsonify.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._compiled = {}
+        self._lock = Lock()
+
+    def requested_fields(self):
+        """The field names in ``?fields=``, validated; ``None`` selects every field."""
+        value = request.args.get('fields')
+        if not value:
+            return None
+        names = tuple(sorted({name.strip() for name in value.split(',') if name.strip()}))
+        if not names or any(name not in self.fields for name in names):
+            abort(400, description=f"Invalid fields. Must be among: {', '.join(self.fields)}.")
+        return names
+
+    def compile(self, names=None, offset=0):
+        key = (names, offset)
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            with self._lock:
+                compiled = self._compiled.setdefault(key, self._compile(names, offset))
+        return compiled
+
+    def _compile(self, names, offset):
+        names = sorted(names or self.fields)
+        columns, parts = [], []
+        for name in names:
+            spec = self.fields[name]
+            position = offset + len(columns)
+            if isinstance(spec, RowEncoder):
+                nested = spec.compile(offset=position)
+                columns.extend(nested.columns)
+                parts.append(_nested_part(position, nested.encode_row))
+            else:
+                columns.append(spec.column)
+                encode = spec.kind if callable(spec.kind) else VALUE_ENCODERS[spec.kind]
+                parts.append(_value_part(position, encode))
+
+        # Keys are identifiers, so the whole object is one format string
+        template = '{' + ','.join(f'{encode_basestring_ascii(name)}:%s' for name in names) + '}'
+        return CompiledEncoder(columns, template, parts)
+
+
+def _value_part(position, encode):
+    def part(row):
+        value = row[position]
+        return 'null' if value is None else encode(value)
+    return part
+
+
+def _nested_part(position, encode_row):
+    return lambda row: 'null' if row[position] is None else encode_row(row)
@@ -0,0 +1,349 @@
+import heapq
+import math
+import time
+from threading import Lock, Thread
+
+from sqlalchemy import select
+
+from extensions import db
+from models import Car, Advertisement
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python scoring; install numpy for large makes
+    np = None
+
+DEFAULT_RELATED_LIMIT = 5
+MAX_RELATED_LIMIT = 20
+
+# Distance = |year gap| / YEAR_SCALE + |log price ratio| / PRICE_SCALE + mismatch penalties
+YEAR_SCALE = 3.0
+PRICE_SCALE = math.log(1.25)
+MODEL_PENALTY = 2.0
+COLOR_PENALTY = 0.5
+STATUS_PENALTY = 0.5
+# Extra nearest slots scored per query, for the car itself and cars removed mid-query
+RESCORE_SLACK = 4
+
+
+def _entry(car_id, make, model, year, color, status, ad_id, title, price):
+    payload = {
+        'id': car_id, 'make': make, 'model': model, 'year': year, 'color': color, 'status': status,
+        'advertisement_id': ad_id, 'title': title, 'price': str(price) if price is not None else None,
+    }
+    # A car without an advertisement has no price, and is ranked on its other features
+    log_price = math.log1p(float(price)) if price is not None else None
+    features = (year, log_price, model.strip().lower(), color.strip().lower(), status.strip().lower())
+    return make.strip().lower(), features, payload
+
+
+def _distance(a, b):
+    return (
+        abs(a[0] - b[0]) / YEAR_SCALE
+        + (abs(a[1] - b[1]) / PRICE_SCALE if a[1] is not None else 0)
+        + (a[2] != b[2]) * MODEL_PENALTY
+        + (a[3] != b[3]) * COLOR_PENALTY
+        + (a[4] != b[4]) * STATUS_PENALTY
+    )
+
+
+class _MakeBucket:
+    """Advertised cars of one make, scored from columnar arrays kept up to date in place.
+
+    Each car owns a slot in the arrays; model, color and status are stored as
+    integer codes, and a removed car's slot is parked at an infinite year
+    until a new car reuses it. Writes go through the index lock. Readers
+    never take it: they score the arrays as they find them and then
+    re-check each winner against ``entries``.
+    """
+
+    def __init__(self, capacity=64):
+        # car_id -> (features, payload, slot)
+        self.entries = {}
+        self.codes = {}
+        self.size = 0
+        self.free = []
+        self.arrays = self._allocate(capacity) if np is not None else None
+
+    @staticmethod
+    def _allocate(capacity):
+        return (
+            np.full(capacity, -1, dtype=np.int64),
+            np.full(capacity, np.inf, dtype=np.float64),
+            np.zeros(capacity, dtype=np.float64),
+            np.full(capacity, -1, dtype=np.int32),
+            np.full(capacity, -1, dtype=np.int32),
+            np.full(capacity, -1, dtype=np.int32),
+        )
+
+    def _code(self, value):
+        return self.codes.setdefault(value, len(self.codes))
+
+    def _slot(self):
+        if self.free:
+            return self.free.pop()
+        capacity = len(self.arrays[0])
+        if self.size == capacity:
+            # Readers holding the old arrays keep a consistent copy
+            grown = self._allocate(capacity * 2)
+            for old, new in zip(self.arrays, grown):
+                new[:capacity] = old
+            self.arrays = grown
+        self.size += 1
+        return self.size - 1
+
+    def put(self, car_id, features, payload):
+        previous = self.entries.get(car_id)
+        if np is None:
+            self.entries[car_id] = (features, payload, None)
+            return
+        slot = previous[2] if previous is not None else self._slot()
+        car_ids, years, log_prices, models, colors, statuses = self.arrays
+        years[slot] = features[0]
+        log_prices[slot] = features[1] if features[1] is not None else np.nan
+        models[slot] = self._code(features[2])
+        colors[slot] = self._code(features[3])
+        statuses[slot] = self._code(features[4])
+        car_ids[slot] = car_id
+        self.entries[car_id] = (features, payload, slot)
+
+    def remove(self, car_id):
+        entry = self.entries.pop(car_id, None)
+        if entry is None or np is None:
+            return
+        slot = entry[2]
+        car_ids, years = self.arrays[0], self.arrays[1]
+        car_ids[slot] = -1
+        years[slot] = np.inf
+        self.free.append(slot)
+
+    def nearest(self, features, exclude, limit):
+        if np is None:
+            candidates = (
+                (_distance(features, entry[0]), car_id)
+                for car_id, entry in list(self.entries.items()) if car_id != exclude
+            )
+            return [car_id for _, car_id in heapq.nsmallest(limit, candidates)]
+
+        size, (car_ids, years, log_prices, models, colors, statuses) = self.size, self.arrays
+        if not size:
+            return []
+        distances = np.subtract(years[:size], features[0])
+        np.abs(distances, out=distances)
+        distances *= 1 / YEAR_SCALE
+        if features[1] is not None:
+            gaps = np.subtract(log_prices[:size], features[1])
+            np.abs(gaps, out=gaps)
+            gaps *= 1 / PRICE_SCALE
+            distances += gaps
+        # An unseen value has no code, so every car mismatches it
+        for column, value, penalty in (
+            (models, features[2], MODEL_PENALTY), (colors, features[3], COLOR_PENALTY),
+            (statuses, features[4], STATUS_PENALTY)
+        ):
+            distances += (column[:size] != self.codes.get(value, -1)) * penalty
+
+        # Spare candidates cover the excluded car and any removed while scoring
+        count = min(limit + 1 + RESCORE_SLACK, size)
+        candidates = np.argpartition(distances, count - 1)[:count]
+        ordered = candidates[np.argsort(distances[candidates], kind='stable')]
+        nearest = []
+        for car_id in car_ids[ordered].tolist():
+            if car_id != exclude and car_id in self.entries:
+                nearest.append(car_id)
+                if len(nearest) == limit:
+                    break
+        return nearest
+
+
+class SimilarityIndex:
+    """In-memory nearest-neighbour index over actively advertised cars.
+
+    Cars are partitioned by make and ranked by a weighted distance over
+    year, log price, model, color and status. Writers in this process
+    update it as they commit. Every ``SIMILARITY_INDEX_REFRESH`` seconds one
+    background thread reloads it from the database to pick up other
+    workers' changes; writes made meanwhile are replayed onto the reload.
+    Queries never touch the database once the first load is done.
+    """
+
+    def __init__(self, app=None):
+        self.refresh_interval = 300
+        self._buckets = {}
+        self._makes = {}
+        self._loaded_at = None
+        self._app = None
+        self._lock = Lock()
+        self._load_lock = Lock()
+        self._refreshing = False
+        # Writes seen while a reload is reading the database, or None
+        self._pending = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SIMILARITY_INDEX_REFRESH', 300)
+        self.refresh_interval = app.config['SIMILARITY_INDEX_REFRESH']
+        self._app = app
+        app.extensions['similarity_index'] = self
+
+    def _put(self, car_id, make, features, payload):
+        if self._pending is not None:
+            self._pending.append((car_id, (make, features, payload)))
+        previous = self._makes.get(car_id)
+        if previous is not None and previous != make:
+            self._buckets[previous].remove(car_id)
+        self._makes[car_id] = make
+        self._buckets.setdefault(make, _MakeBucket()).put(car_id, features, payload)
+
+    def _discard(self, car_id):
+        if self._pending is not None:
+            self._pending.append((car_id, None))
+        make = self._makes.pop(car_id, None)
+        if make is not None:
+            self._buckets[make].remove(car_id)
+
+    def rebuild(self):
+        with self._lock:
+            self._pending = []
+        try:
+            rows = db.session.execute(
+                select(
+                    Car.id, Car.make, Car.model, Car.year, Car.color, Car.status,
+                    Advertisement.id, Advertisement.title, Advertisement.price
+                )
+                .join(Advertisement, Advertisement.car_id == Car.id)
+                .where(Advertisement.status == 'active')
+            ).all()
+            grouped = {}
+            for row in rows:
+                make, features, payload = _entry(*row)
+                grouped.setdefault(make, []).append((row[0], features, payload))
+            buckets, makes = {}, {}
+            for make, cars in grouped.items():
+                bucket = buckets[make] = _MakeBucket(capacity=max(64, len(cars) * 2))
+                for car_id, features, payload in cars:
+                    makes[car_id] = make
+                    bucket.put(car_id, features, payload)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._buckets, self._makes = buckets, makes
+            # Writes committed after the read above would otherwise be lost until the next reload
+            for car_id, entry in pending:
+                if entry is None:
+                    self._discard(car_id)
+                else:
+                    self._put(car_id, *entry)
+            self._loaded_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        try:
+            with self._app.app_context():
+                try:
+                    self.rebuild()
+                finally:
+                    db.session.remove()
+        except Exception:
+            self._app.logger.exception('Related-cars index reload failed')
+        finally:
+            self._refreshing = False
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None:
+            # The first load blocks, once, for every waiting request
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self.rebuild()
+            return
+        if time.monotonic() - self._loaded_at > self.refresh_interval and not self._refreshing:
+            with self._lock:
+                if self._refreshing:
+                    return
+                self._refreshing = True
+            Thread(target=self._refresh_in_background, name='related-index-refresh', daemon=True).start()
+
+    def update(self, car, ad):
+        """Reflect a committed car/advertisement write."""
+        if self._loaded_at is None and self._pending is None:
+            return
+        with self._lock:
+            if ad is None or ad.status != 'active':
+                self._discard(car.id)
+                return
+            make, features, payload = _entry(
+                car.id, car.make, car.model, car.year, car.color, car.status, ad.id, ad.title, ad.price
+            )
+            self._put(car.id, make, features, payload)
+
+    def discard(self, car_id):
+        with self._lock:
+            self._discard(car_id)
+
+    def refresh_cars(self, car_ids):
+        """Reload the given cars after a bulk write."""
+        if (self._loaded_at is None and self._pending is None) or not car_ids:
+            return
+        rows = db.session.execute(
+            select(
+                Car.id, Car.make, Car.model, Car.year, Car.color, Car.status,
+                Advertisement.id, Advertisement.title, Advertisement.price, Advertisement.status
+            )
+            .join(Advertisement, Advertisement.car_id == Car.id)
+            .where(Car.id.in_(list(car_ids)))
+        ).all()
+        with self._lock:
+            found = set()
+            for row in rows:
+                found.add(row[0])
+                if row[-1] == 'active':
+                    self._put(row[0], *_entry(*row[:-1]))
+                else:
+                    self._discard(row[0])
+            for car_id in set(car_ids) - found:
+                self._discard(car_id)
+
+    def lookup(self, car_id):
+        """Features of an indexed car, or ``None`` when it is not actively advertised."""
+        self._ensure_loaded()
+        make = self._makes.get(car_id)
+        entry = self._buckets[make].entries.get(car_id) if make is not None else None
+        return (make, entry[0]) if entry is not None else None
+
+    def related(self, make, features, exclude=None, limit=DEFAULT_RELATED_LIMIT):
+        self._ensure_loaded()
+        bucket = self._buckets.get(make)
+        if bucket is None:
+            return []
+        payloads = []
+        for car_id in bucket.nearest(features, exclude, limit):
+            entry = bucket.entries.get(car_id)
+            if entry is not None:
+                payloads.append(entry[1])
+        return payloads
+
+
+related_index = SimilarityIndex()
+
+
+def related_cars(car_id, limit=DEFAULT_RELATED_LIMIT):
+    """Nearest advertised cars to ``car_id``; only cars outside the index cost a query."""
+    indexed = related_index.lookup(car_id)
+    if indexed is None:
+        row = db.session.execute(
+            select(
+                Car.id, Car.make, Car.model, Car.year, Car.color, Car.status,
+                Advertisement.id, Advertisement.title, Advertisement.price
+            )
+            .outerjoin(Advertisement, Advertisement.car_id == Car.id)
+            .where(Car.id == car_id)
+        ).first()
+        if row is None:
+            return None
+        indexed = _entry(*row)[:2]
+    make, features = indexed
+    return related_index.related(make, features, exclude=car_id, limit=limit)
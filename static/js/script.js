@@ -12,11 +12,13 @@ const carSearchForm = document.getElementById('carSearchForm');
 const searchResultsSection = document.getElementById('searchResultsSection');
 const searchResultsContainer = document.getElementById('searchResultsContainer');
 const clearSearchResultsBtn = document.getElementById('clearSearchResultsBtn');
+const searchLoadMoreBtn = document.getElementById('searchLoadMoreBtn');
 const relatedCarsSection = document.getElementById('relatedCarsSection');
 const relatedCarsContainer = document.getElementById('relatedCarsContainer');
 const clearRelatedCarsBtn = document.getElementById('clearRelatedCarsBtn');
 
 const adsContainer = document.getElementById('adsContainer');
+const adsLoadMoreBtn = document.getElementById('adsLoadMoreBtn');
 
 const showRegisterFormBtn = document.getElementById('showRegisterFormBtn');
 const showLoginFormBtn = document.getElementById('showLoginFormBtn');
@@ -34,15 +36,42 @@ const newAdvertisementForm = document.getElementById('newAdvertisementForm');
 const showUserManagementBtn = document.getElementById('showUserManagementBtn');
 const userManagementSection = document.getElementById('userManagementSection');
 const userListContainer = document.getElementById('userListContainer');
+const usersLoadMoreBtn = document.getElementById('usersLoadMoreBtn');
+const userSearchMobile = document.getElementById('userSearchMobile');
+const deactivateSelectedUsersBtn = document.getElementById('deactivateSelectedUsersBtn');
 
 const showAllTransactionsBtn = document.getElementById('showAllTransactionsBtn');
 const allTransactionsSection = document.getElementById('allTransactionsSection');
 const transactionListContainer = document.getElementById('transactionListContainer');
+const transactionsLoadMoreBtn = document.getElementById('transactionsLoadMoreBtn');
 
 
 let currentUserMobile = null;
 let currentUserRoles = []; // NEW: Store user roles
 
+const ADS_PAGE_SIZE = 20;
+let adsNextCursor = null;
+let adsLoading = false;
+let adsRequestId = 0;
+
+// Local copy of the loaded listing, kept current from the change feed instead of refetching
+const CHANGES_POLL_INTERVAL_MS = 15000;
+const listingAds = new Map();
+let adsNewestCreatedAt = null;
+let changesCursor = null;
+let changeStream = null;
+let changesPollTimer = null;
+
+const USERS_PAGE_SIZE = 50;
+let usersNextCursor = null;
+let usersRequestId = 0;
+
+const TRANSACTIONS_PAGE_SIZE = 20;
+let transactionsNextCursor = null;
+
+let searchQueryParams = null;
+let searchNextCursor = null;
+
 function showMessage(msg, type = 'success') {
     messageDiv.textContent = msg;
     messageDiv.className = `message ${type}`;
@@ -183,7 +212,7 @@ logoutBtn.addEventListener('click', async () => {
             localStorage.removeItem('userRoles'); // NEW: Clear roles on logout
             showMessage(data.message, 'success');
             updateAuthUI();
-            fetchAllAdvertisements();
+            rerenderAdvertisements();
             hideAllSearchSections();
         } else {
             showMessage(data.message || 'Logout failed.', 'error');
@@ -248,7 +277,7 @@ loginUserForm.addEventListener('submit', async (event) => {
             showMessage(data.message, 'success');
             loginUserForm.reset();
             updateAuthUI();
-            fetchAllAdvertisements();
+            rerenderAdvertisements();
             hideAllSearchSections();
         } else {
             showMessage(data.message || 'Login failed.', 'error');
@@ -293,10 +322,14 @@ newAdvertisementForm.addEventListener('submit', async (event) => {
 
         const data = await response.json();
         if (response.ok) {
+            const photos = document.getElementById('adImages').files;
+            if (photos.length && !(await uploadAdvertisementImages(data.id, photos))) {
+                return;
+            }
             showMessage('Advertisement created successfully!', 'success');
             newAdvertisementForm.reset();
             hideAllForms();
-            fetchAllAdvertisements();
+            applyListingChanges({ upserted: [data], deleted: [] });
         } else {
             showMessage(data.description || data.message || 'Failed to create advertisement.', 'error');
         }
@@ -306,6 +339,27 @@ newAdvertisementForm.addEventListener('submit', async (event) => {
     }
 });
 
+async function uploadAdvertisementImages(adId, files) {
+    const formData = new FormData();
+    Array.from(files).forEach(file => formData.append('image', file));
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/advertisements/${adId}/images`, {
+            method: 'POST',
+            body: formData
+        });
+        if (!response.ok) {
+            const data = await response.json();
+            showMessage(`Advertisement created, but the photos failed: ${data.description || data.message || response.statusText}`, 'error');
+            return false;
+        }
+        return true;
+    } catch (error) {
+        console.error('Upload images error:', error);
+        showMessage('Advertisement created, but the photos could not be uploaded.', 'error');
+        return false;
+    }
+}
+
 // Advanced Car Search Logic
 carSearchForm.addEventListener('submit', async (event) => {
     event.preventDefault();
@@ -313,37 +367,60 @@ carSearchForm.addEventListener('submit', async (event) => {
 });
 
 async function performAdvancedSearch() {
+    const text = document.getElementById('searchText').value.trim();
     const minPrice = document.getElementById('searchMinPrice').value;
     const maxPrice = document.getElementById('searchMaxPrice').value;
     const brand = document.getElementById('searchBrand').value;
+    const model = document.getElementById('searchModel').value;
     const color = document.getElementById('searchColor').value;
+    const minYear = document.getElementById('searchMinYear').value;
+    const maxYear = document.getElementById('searchMaxYear').value;
     const status = document.getElementById('searchStatus').value;
+    const sort = document.getElementById('searchSort').value;
 
-    const queryParams = new URLSearchParams();
+    // Relevance only means something with keywords
+    const effectiveSort = sort === 'relevance' && !text ? 'newest' : sort;
+    const queryParams = new URLSearchParams({ limit: ADS_PAGE_SIZE, sort: effectiveSort || 'newest' });
+    if (text) queryParams.append('q', text);
     if (minPrice) queryParams.append('min_price', minPrice);
     if (maxPrice) queryParams.append('max_price', maxPrice);
     if (brand) queryParams.append('brand', brand);
+    if (model) queryParams.append('model', model);
     if (color) queryParams.append('color', color);
+    if (minYear) queryParams.append('min_year', minYear);
+    if (maxYear) queryParams.append('max_year', maxYear);
     if (status) queryParams.append('status', status);
 
+    searchQueryParams = queryParams;
+    searchNextCursor = null;
+    searchLoadMoreBtn.style.display = 'none';
+
     searchResultsContainer.innerHTML = 'Searching for cars...';
     searchResultsSection.style.display = 'block';
     document.getElementById('advertisementListing').style.display = 'none';
     hideAllForms();
     clearSearchResultsBtn.style.display = 'block';
 
+    await loadSearchResultsPage(true);
+}
+
+async function loadSearchResultsPage(reset) {
+    const queryParams = new URLSearchParams(searchQueryParams);
+    if (!reset && searchNextCursor) queryParams.append('cursor', searchNextCursor);
+
     try {
         const response = await fetch(`${API_BASE_URL}/api/search/cars?${queryParams.toString()}`);
-        const cars = await response.json();
+        const page = await response.json();
 
         if (response.ok) {
-            if (cars.length === 0) {
-                searchResultsContainer.innerHTML = '<p>No cars found matching your criteria.</p>';
-                return;
+            if (reset) {
+                searchResultsContainer.innerHTML = '';
+                if (page.items.length === 0) {
+                    searchResultsContainer.innerHTML = '<p>No cars found matching your criteria.</p>';
+                }
             }
 
-            searchResultsContainer.innerHTML = '';
-            cars.forEach(car => {
+            page.items.forEach(car => {
                 const carCard = document.createElement('div');
                 carCard.className = 'ad-card';
                 carCard.innerHTML = `
@@ -351,11 +428,14 @@ async function performAdvancedSearch() {
                     <p><strong>Year:</strong> ${car.year}</p>
                     <p><strong>Color:</strong> ${car.color}</p>
                     <p><strong>Status:</strong> ${car.status}</p>
+                    <p class="price">Price: $${parseFloat(car.price).toLocaleString()}</p>
                 `;
                 searchResultsContainer.appendChild(carCard);
             });
+            searchNextCursor = page.next_cursor;
+            searchLoadMoreBtn.style.display = searchNextCursor ? 'block' : 'none';
         } else {
-            searchResultsContainer.innerHTML = `<p class="error">Error during search: ${cars.message || 'Unknown error'}</p>`;
+            searchResultsContainer.innerHTML = `<p class="error">Error during search: ${page.description || page.message || 'Unknown error'}</p>`;
         }
     } catch (error) {
         console.error('Advanced search error:', error);
@@ -363,13 +443,20 @@ async function performAdvancedSearch() {
     }
 }
 
+searchLoadMoreBtn.addEventListener('click', () => {
+    if (searchNextCursor) {
+        loadSearchResultsPage(false);
+    }
+});
+
 // Clear Search Results
 clearSearchResultsBtn.addEventListener('click', () => {
     searchResultsSection.style.display = 'none';
     searchResultsContainer.innerHTML = '';
     clearSearchResultsBtn.style.display = 'none';
+    searchLoadMoreBtn.style.display = 'none';
     document.getElementById('advertisementListing').style.display = 'block';
-    fetchAllAdvertisements();
+    syncListingChanges();
 });
 
 
@@ -400,6 +487,7 @@ async function fetchRelatedCars(carId) {
                     <p><strong>Year:</strong> ${car.year}</p>
                     <p><strong>Color:</strong> ${car.color}</p>
                     <p><strong>Status:</strong> ${car.status}</p>
+                    ${car.price ? `<p class="price">Price: $${parseFloat(car.price).toLocaleString()}</p>` : ''}
                 `;
                 relatedCarsContainer.appendChild(carCard);
             });
@@ -417,107 +505,269 @@ clearRelatedCarsBtn.addEventListener('click', () => {
     relatedCarsSection.style.display = 'none';
     relatedCarsContainer.innerHTML = '';
     document.getElementById('advertisementListing').style.display = 'block';
-    fetchAllAdvertisements();
+    syncListingChanges();
 });
 
 
+// Advertisement listing is paged with the API's keyset cursor and extended by infinite scroll
 async function fetchAllAdvertisements() {
+    adsNextCursor = null;
+    listingAds.clear();
+    adsNewestCreatedAt = null;
     adsContainer.innerHTML = 'Loading advertisements...';
+    adsLoadMoreBtn.style.display = 'none';
+    // Take the feed position first, so nothing written while the page loads is missed
+    changesCursor = await fetchChangesCursor();
+    await loadAdvertisementsPage(true);
+    subscribeToListingChanges();
+}
+
+async function loadMoreAdvertisements() {
+    if (adsLoading || !adsNextCursor) {
+        return;
+    }
+    await loadAdvertisementsPage(false);
+}
+
+async function loadAdvertisementsPage(reset) {
+    const requestId = ++adsRequestId;
+    adsLoading = true;
+
+    const queryParams = new URLSearchParams({ limit: ADS_PAGE_SIZE, sort: 'newest' });
+    if (!reset && adsNextCursor) queryParams.append('cursor', adsNextCursor);
+
     try {
-        const response = await fetch(`${API_BASE_URL}/api/advertisements`);
-        const ads = await response.json();
+        const response = await fetch(`${API_BASE_URL}/api/advertisements?${queryParams.toString()}`);
+        const page = await response.json();
+
+        if (requestId !== adsRequestId) {
+            return; // A newer reload superseded this page
+        }
 
         if (response.ok) {
-            if (ads.length === 0) {
-                adsContainer.innerHTML = '<p>No advertisements found.</p>';
-                return;
+            if (reset) {
+                adsContainer.innerHTML = '';
+                if (page.items.length === 0) {
+                    adsContainer.innerHTML = '<p>No advertisements found.</p>';
+                }
             }
 
-            adsContainer.innerHTML = '';
-            ads.forEach(ad => {
-                const adCard = document.createElement('div');
-                adCard.className = 'ad-card';
-                adCard.setAttribute('data-ad-id', ad.id); // Store ad ID for potential actions
-                adCard.setAttribute('data-car-id', ad.car_details ? ad.car_details.id : ''); // Store car ID
-                adCard.setAttribute('data-publisher-id', ad.user_id); // Store publisher ID
-
-                adCard.innerHTML = `
-                    <h3>${ad.title}</h3>
-                    <p><strong>Car:</strong> ${ad.car_details ? ad.car_details.make + ' ' + ad.car_details.model : 'N/A'}</p>
-                    <p><strong>Year:</strong> ${ad.car_details ? ad.car_details.year : 'N/A'}</p>
-                    <p><strong>Color:</strong> ${ad.car_details ? ad.car_details.color : 'N/A'}</p>
-                    <p><strong>Status:</strong> ${ad.status}</p>
-                    <p>${ad.description || 'No description provided.'}</p>
-                    <p class="price">Price: $${parseFloat(ad.price).toLocaleString()}</p>
-                    <p><strong>Published by:</strong> ${ad.publisher_mobile || 'Unknown'}</p>
-                    <p><small>Created: ${new Date(ad.created_at).toLocaleString()}</small></p>
-                    ${ad.car_details && ad.car_details.id ? `<button class="view-related-btn" data-car-id="${ad.car_details.id}">View Related Cars</button>` : ''}
-                    <div class="ad-actions" style="margin-top: 10px;">
-                        ${(hasRole('Admin') || hasRole('Senior') || (localStorage.getItem('userMobile') === ad.publisher_mobile)) ?
-                            `<button class="edit-ad-btn" data-ad-id="${ad.id}" style="background-color: #ffc107; margin-right: 5px;">Edit</button>
-                             <button class="delete-ad-btn" data-ad-id="${ad.id}" style="background-color: #dc3545;">Delete</button>`
-                            : ''
-                        }
-                        ${hasRole('User') && (localStorage.getItem('userMobile') !== ad.publisher_mobile) ?
-                            `<button class="initiate-transaction-btn" data-car-id="${ad.car_details.id}" data-ad-id="${ad.id}" data-ad-price="${ad.price}" style="background-color: #28a745;">Buy Now</button>`
-                            : ''
-                        }
-                    </div>
-                `;
-                adsContainer.appendChild(adCard);
-            });
-
-            // Attach event listeners to newly created buttons
-            document.querySelectorAll('.view-related-btn').forEach(button => {
-                button.addEventListener('click', (event) => {
-                    const carId = event.target.dataset.carId;
-                    if (carId) {
-                        fetchRelatedCars(carId);
-                    }
-                });
+            page.items.forEach(ad => {
+                listingAds.set(ad.id, ad);
+                adsContainer.appendChild(renderAdCard(ad));
             });
+            if (reset && page.items.length) {
+                adsNewestCreatedAt = page.items[0].created_at;
+            }
+            adsNextCursor = page.next_cursor;
+            adsLoadMoreBtn.style.display = adsNextCursor ? 'block' : 'none';
+        } else {
+            adsContainer.innerHTML = `<p class="error">Error loading advertisements: ${page.message || 'Unknown error'}</p>`;
+        }
+    } catch (error) {
+        console.error('Error fetching advertisements:', error);
+        if (reset) {
+            adsContainer.innerHTML = '<p class="error">Failed to load advertisements. Please check server connection.</p>';
+        } else {
+            showMessage('Failed to load more advertisements.', 'error');
+        }
+    } finally {
+        if (requestId === adsRequestId) {
+            adsLoading = false;
+        }
+    }
+}
 
-            // NEW: Edit Ad Button Event Listener (example - you'd need a separate edit form)
-            document.querySelectorAll('.edit-ad-btn').forEach(button => {
-                button.addEventListener('click', (event) => {
-                    const adId = event.target.dataset.adId;
-                    showMessage(`Editing advertisement ID: ${adId} (Functionality not fully implemented yet)`, 'info');
-                    // TODO: Implement actual edit form and PUT request
-                });
-            });
+async function fetchChangesCursor() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/advertisements/changes`);
+        return response.ok ? (await response.json()).cursor : null;
+    } catch (error) {
+        console.error('Error fetching change cursor:', error);
+        return null;
+    }
+}
 
-            // NEW: Delete Ad Button Event Listener
-            document.querySelectorAll('.delete-ad-btn').forEach(button => {
-                button.addEventListener('click', async (event) => {
-                    const adId = event.target.dataset.adId;
-                    if (confirm(`Are you sure you want to delete advertisement ID: ${adId}?`)) {
-                        await deleteAdvertisement(adId);
-                    }
-                });
-            });
+function findAdCard(adId) {
+    return adsContainer.querySelector(`.ad-card[data-ad-id="${adId}"]`);
+}
 
-            // NEW: Initiate Transaction Button Event Listener
-            document.querySelectorAll('.initiate-transaction-btn').forEach(button => {
-                button.addEventListener('click', async (event) => {
-                    const carId = event.target.dataset.carId;
-                    const adId = event.target.dataset.adId;
-                    const adPrice = event.target.dataset.adPrice;
-                    if (confirm(`Initiate transaction for Car ID: ${carId} at price $${adPrice}?`)) {
-                        await initiateTransaction(carId, adPrice);
-                    }
-                });
-            });
+function applyListingChanges(batch) {
+    batch.deleted.forEach(adId => {
+        listingAds.delete(adId);
+        const card = findAdCard(adId);
+        if (card) card.remove();
+    });
+    batch.upserted.forEach(ad => {
+        const card = findAdCard(ad.id);
+        if (card) {
+            card.replaceWith(renderAdCard(ad));
+        } else if (!adsNewestCreatedAt || ad.created_at >= adsNewestCreatedAt) {
+            // The listing is newest first; older unseen ads arrive with their page instead
+            if (listingAds.size === 0) adsContainer.innerHTML = '';
+            adsContainer.prepend(renderAdCard(ad));
+            adsNewestCreatedAt = ad.created_at;
+        } else {
+            return;
+        }
+        listingAds.set(ad.id, ad);
+    });
+    if (listingAds.size === 0 && !adsNextCursor) {
+        adsContainer.innerHTML = '<p>No advertisements found.</p>';
+    }
+}
 
+function rerenderAdvertisements() {
+    adsContainer.querySelectorAll('.ad-card').forEach(card => {
+        const ad = listingAds.get(Number(card.dataset.adId));
+        if (ad) card.replaceWith(renderAdCard(ad));
+    });
+}
 
-        } else {
-            adsContainer.innerHTML = `<p class="error">Error loading advertisements: ${ads.message || 'Unknown error'}</p>`;
+async function syncListingChanges() {
+    if (!changesCursor) {
+        return fetchAllAdvertisements();
+    }
+    try {
+        let hasMore = true;
+        while (hasMore) {
+            const response = await fetch(`${API_BASE_URL}/api/advertisements/changes?since=${encodeURIComponent(changesCursor)}`);
+            if (response.status === 410) {
+                return fetchAllAdvertisements(); // Too far behind the retained log
+            }
+            if (!response.ok) {
+                return;
+            }
+            const batch = await response.json();
+            applyListingChanges(batch);
+            changesCursor = batch.cursor;
+            hasMore = batch.has_more;
         }
     } catch (error) {
-        console.error('Error fetching advertisements:', error);
-        adsContainer.innerHTML = '<p class="error">Failed to load advertisements. Please check server connection.</p>';
+        console.error('Error syncing advertisement changes:', error);
     }
 }
 
+function subscribeToListingChanges() {
+    if (changeStream) changeStream.close();
+    clearInterval(changesPollTimer);
+    changeStream = null;
+    if (!changesCursor) {
+        return;
+    }
+    if (!window.EventSource) {
+        changesPollTimer = setInterval(syncListingChanges, CHANGES_POLL_INTERVAL_MS);
+        return;
+    }
+
+    changeStream = new EventSource(`${API_BASE_URL}/api/advertisements/changes/stream?since=${encodeURIComponent(changesCursor)}`);
+    changeStream.addEventListener('changes', event => {
+        const batch = JSON.parse(event.data);
+        applyListingChanges(batch);
+        changesCursor = batch.cursor;
+    });
+    changeStream.addEventListener('reset', () => {
+        changeStream.close();
+        fetchAllAdvertisements();
+    });
+    changeStream.onerror = () => {
+        // A closed stream (e.g. disabled on the server) is not retried by the browser; poll instead
+        if (changeStream.readyState === EventSource.CLOSED) {
+            changeStream = null;
+            changesPollTimer = setInterval(syncListingChanges, CHANGES_POLL_INTERVAL_MS);
+        }
+    };
+}
+
+function renderAdCard(ad) {
+    const adCard = document.createElement('div');
+    adCard.className = 'ad-card';
+    adCard.setAttribute('data-ad-id', ad.id); // Store ad ID for potential actions
+    adCard.setAttribute('data-car-id', ad.car_details ? ad.car_details.id : ''); // Store car ID
+    adCard.setAttribute('data-publisher-id', ad.user_id); // Store publisher ID
+
+    // Cards only ever need the thumbnail rendition
+    const cover = ad.images && ad.images.length ? ad.images[0] : null;
+    adCard.innerHTML = `
+        ${cover ? `<img class="ad-thumbnail" src="${cover.thumbnail_url}" alt="${ad.title}" loading="lazy">` : ''}
+        <h3>${ad.title}</h3>
+        <p><strong>Car:</strong> ${ad.car_details ? ad.car_details.make + ' ' + ad.car_details.model : 'N/A'}</p>
+        <p><strong>Year:</strong> ${ad.car_details ? ad.car_details.year : 'N/A'}</p>
+        <p><strong>Color:</strong> ${ad.car_details ? ad.car_details.color : 'N/A'}</p>
+        <p><strong>Status:</strong> ${ad.status}</p>
+        <p>${ad.description || 'No description provided.'}</p>
+        <p class="price">Price: $${parseFloat(ad.price).toLocaleString()}</p>
+        <p><strong>Published by:</strong> ${ad.publisher_mobile || 'Unknown'}</p>
+        <p><small>Created: ${new Date(ad.created_at).toLocaleString()}</small></p>
+        ${ad.car_details && ad.car_details.id ? `<button class="view-related-btn" data-car-id="${ad.car_details.id}">View Related Cars</button>` : ''}
+        <div class="ad-actions" style="margin-top: 10px;">
+            ${(hasRole('Admin') || hasRole('Senior') || (localStorage.getItem('userMobile') === ad.publisher_mobile)) ?
+                `<button class="edit-ad-btn" data-ad-id="${ad.id}" style="background-color: #ffc107; margin-right: 5px;">Edit</button>
+                 <button class="delete-ad-btn" data-ad-id="${ad.id}" style="background-color: #dc3545;">Delete</button>`
+                : ''
+            }
+            ${hasRole('User') && ad.car_details && (localStorage.getItem('userMobile') !== ad.publisher_mobile) ?
+                `<button class="initiate-transaction-btn" data-car-id="${ad.car_details.id}" data-ad-id="${ad.id}" data-ad-price="${ad.price}" style="background-color: #28a745;">Buy Now</button>`
+                : ''
+            }
+        </div>
+    `;
+
+    // Listeners are bound per card so appended pages don't re-bind earlier cards
+    adCard.querySelectorAll('.view-related-btn').forEach(button => {
+        button.addEventListener('click', (event) => {
+            const carId = event.target.dataset.carId;
+            if (carId) {
+                fetchRelatedCars(carId);
+            }
+        });
+    });
+
+    // NEW: Edit Ad Button Event Listener (example - you'd need a separate edit form)
+    adCard.querySelectorAll('.edit-ad-btn').forEach(button => {
+        button.addEventListener('click', (event) => {
+            const adId = event.target.dataset.adId;
+            showMessage(`Editing advertisement ID: ${adId} (Functionality not fully implemented yet)`, 'info');
+            // TODO: Implement actual edit form and PUT request
+        });
+    });
+
+    // NEW: Delete Ad Button Event Listener
+    adCard.querySelectorAll('.delete-ad-btn').forEach(button => {
+        button.addEventListener('click', async (event) => {
+            const adId = event.target.dataset.adId;
+            if (confirm(`Are you sure you want to delete advertisement ID: ${adId}?`)) {
+                await deleteAdvertisement(adId);
+            }
+        });
+    });
+
+    // NEW: Initiate Transaction Button Event Listener
+    adCard.querySelectorAll('.initiate-transaction-btn').forEach(button => {
+        button.addEventListener('click', async (event) => {
+            const carId = event.target.dataset.carId;
+            const adId = event.target.dataset.adId;
+            const adPrice = event.target.dataset.adPrice;
+            if (confirm(`Initiate transaction for Car ID: ${carId} at price $${adPrice}?`)) {
+                await initiateTransaction(carId, adPrice);
+            }
+        });
+    });
+
+    return adCard;
+}
+
+adsLoadMoreBtn.addEventListener('click', loadMoreAdvertisements);
+
+if ('IntersectionObserver' in window) {
+    const adsScrollObserver = new IntersectionObserver((entries) => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMoreAdvertisements();
+        }
+    }, { rootMargin: '400px' });
+    adsScrollObserver.observe(adsLoadMoreBtn);
+}
+
 // NEW: Function to handle deleting an advertisement
 async function deleteAdvertisement(adId) {
     const token = localStorage.getItem('authToken');
@@ -536,7 +786,7 @@ async function deleteAdvertisement(adId) {
 
         if (response.ok) {
             showMessage(`Advertisement ${adId} deleted successfully!`, 'success');
-            fetchAllAdvertisements(); // Refresh the list
+            applyListingChanges({ upserted: [], deleted: [Number(adId)] });
         } else {
             const data = await response.json();
             showMessage(data.description || data.message || `Failed to delete advertisement ${adId}.`, 'error');
@@ -579,9 +829,15 @@ async function initiateTransaction(carId, agreedPrice) {
 }
 
 
-// NEW: Fetch All Users (Admin/Senior)
+// NEW: Fetch All Users (Admin/Senior), a cursor page at a time
 async function fetchAllUsers() {
+    usersNextCursor = null;
     userListContainer.innerHTML = 'Loading users...';
+    usersLoadMoreBtn.style.display = 'none';
+    await loadUsersPage(true);
+}
+
+async function loadUsersPage(reset) {
     const token = localStorage.getItem('authToken');
     if (!token) {
         userListContainer.innerHTML = '<p class="error">Not authorized to view users.</p>';
@@ -589,49 +845,38 @@ async function fetchAllUsers() {
         return;
     }
 
+    const requestId = ++usersRequestId;
+    const queryParams = new URLSearchParams({ limit: USERS_PAGE_SIZE });
+    const mobilePrefix = userSearchMobile.value.trim();
+    if (mobilePrefix) queryParams.append('mobile', mobilePrefix);
+    if (!reset && usersNextCursor) queryParams.append('cursor', usersNextCursor);
+
     try {
-        const response = await fetch(`${API_BASE_URL}/api/users`, {
+        const response = await fetch(`${API_BASE_URL}/api/users?${queryParams.toString()}`, {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
         });
-        const users = await response.json();
+        const page = await response.json();
+
+        if (requestId !== usersRequestId) {
+            return; // A newer search superseded this page
+        }
 
         if (response.ok) {
-            if (users.length === 0) {
-                userListContainer.innerHTML = '<p>No users found.</p>';
-                return;
+            if (reset) {
+                userListContainer.innerHTML = '';
+                if (page.items.length === 0) {
+                    userListContainer.innerHTML = '<p>No users found.</p>';
+                }
             }
 
-            userListContainer.innerHTML = '';
-            users.forEach(user => {
-                const userCard = document.createElement('div');
-                userCard.className = 'ad-card'; // Reusing card styling
-                userCard.innerHTML = `
-                    <h3>User: ${user.mobile_number}</h3>
-                    <p>ID: ${user.id}</p>
-                    <p>Active: ${user.active ? 'Yes' : 'No'}</p>
-                    <p>Roles: ${user.roles.join(', ')}</p>
-                    ${user.active && user.mobile_number !== currentUserMobile ?
-                        `<button class="deactivate-user-btn" data-user-id="${user.id}" style="background-color: #dc3545;">Deactivate</button>` : ''
-                    }
-                `;
-                userListContainer.appendChild(userCard);
-            });
-
-            // Attach event listeners for deactivate buttons
-            document.querySelectorAll('.deactivate-user-btn').forEach(button => {
-                button.addEventListener('click', async (event) => {
-                    const userId = event.target.dataset.userId;
-                    if (confirm(`Are you sure you want to deactivate user ID: ${userId}?`)) {
-                        await deactivateUser(userId);
-                    }
-                });
-            });
-
+            page.items.forEach(user => userListContainer.appendChild(renderUserCard(user)));
+            usersNextCursor = page.next_cursor;
+            usersLoadMoreBtn.style.display = usersNextCursor ? 'block' : 'none';
         } else {
-            userListContainer.innerHTML = `<p class="error">Error loading users: ${users.message || 'Unknown error'}</p>`;
-            showMessage(users.message || 'Failed to load users.', 'error');
+            userListContainer.innerHTML = `<p class="error">Error loading users: ${page.message || 'Unknown error'}</p>`;
+            showMessage(page.message || 'Failed to load users.', 'error');
         }
     } catch (error) {
         console.error('Error fetching users:', error);
@@ -640,6 +885,75 @@ async function fetchAllUsers() {
     }
 }
 
+function renderUserCard(user) {
+    const userCard = document.createElement('div');
+    userCard.className = 'ad-card'; // Reusing card styling
+    const canDeactivate = user.active && user.mobile_number !== currentUserMobile;
+    userCard.innerHTML = `
+        <h3>User: ${user.mobile_number}</h3>
+        <p>ID: ${user.id}</p>
+        <p>Active: ${user.active ? 'Yes' : 'No'}</p>
+        <p>Roles: ${user.roles.join(', ')}</p>
+        ${canDeactivate ?
+            `<label><input type="checkbox" class="select-user-checkbox" value="${user.id}"> Select</label>
+             <button class="deactivate-user-btn" data-user-id="${user.id}" style="background-color: #dc3545;">Deactivate</button>` : ''
+        }
+    `;
+
+    userCard.querySelectorAll('.deactivate-user-btn').forEach(button => {
+        button.addEventListener('click', async (event) => {
+            const userId = event.target.dataset.userId;
+            if (confirm(`Are you sure you want to deactivate user ID: ${userId}?`)) {
+                await deactivateUser(userId);
+            }
+        });
+    });
+    return userCard;
+}
+
+let userSearchTimer = null;
+userSearchMobile.addEventListener('input', () => {
+    clearTimeout(userSearchTimer);
+    userSearchTimer = setTimeout(fetchAllUsers, 300);
+});
+
+usersLoadMoreBtn.addEventListener('click', () => loadUsersPage(false));
+
+deactivateSelectedUsersBtn.addEventListener('click', async () => {
+    const userIds = Array.from(userListContainer.querySelectorAll('.select-user-checkbox:checked'))
+        .map(checkbox => parseInt(checkbox.value, 10));
+    if (userIds.length === 0) {
+        showMessage('Select at least one user to deactivate.', 'error');
+        return;
+    }
+    if (!confirm(`Deactivate ${userIds.length} selected user(s)?`)) {
+        return;
+    }
+
+    const token = localStorage.getItem('authToken');
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/users/deactivate`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${token}`,
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ user_ids: userIds })
+        });
+        const data = await response.json();
+
+        if (response.ok) {
+            showMessage(`${data.count} user(s) deactivated successfully!`, 'success');
+            fetchAllUsers();
+        } else {
+            showMessage(data.description || data.message || 'Failed to deactivate users.', 'error');
+        }
+    } catch (error) {
+        console.error('Bulk deactivate error:', error);
+        showMessage('An error occurred while deactivating users.', 'error');
+    }
+});
+
 // NEW: Deactivate User Functionality
 async function deactivateUser(userId) {
     const token = localStorage.getItem('authToken');
@@ -669,9 +983,15 @@ async function deactivateUser(userId) {
     }
 }
 
-// NEW: Fetch All Transactions (Admin/Senior/Seller/User)
+// NEW: Fetch All Transactions (Admin/Senior/Seller/User), a cursor page at a time
 async function fetchAllTransactions() {
+    transactionsNextCursor = null;
     transactionListContainer.innerHTML = 'Loading transactions...';
+    transactionsLoadMoreBtn.style.display = 'none';
+    await loadTransactionsPage(true);
+}
+
+async function loadTransactionsPage(reset) {
     const token = localStorage.getItem('authToken');
     if (!token) {
         transactionListContainer.innerHTML = '<p class="error">Not authorized to view transactions.</p>';
@@ -679,61 +999,31 @@ async function fetchAllTransactions() {
         return;
     }
 
+    const queryParams = new URLSearchParams({ limit: TRANSACTIONS_PAGE_SIZE, sort: 'newest' });
+    if (!reset && transactionsNextCursor) queryParams.append('cursor', transactionsNextCursor);
+
     try {
-        const response = await fetch(`${API_BASE_URL}/api/transactions`, {
+        const response = await fetch(`${API_BASE_URL}/api/transactions?${queryParams.toString()}`, {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
         });
-        const transactions = await response.json();
+        const page = await response.json();
 
         if (response.ok) {
-            if (transactions.length === 0) {
-                transactionListContainer.innerHTML = '<p>No transactions found.</p>';
-                return;
+            if (reset) {
+                transactionListContainer.innerHTML = '';
+                if (page.items.length === 0) {
+                    transactionListContainer.innerHTML = '<p>No transactions found.</p>';
+                }
             }
 
-            transactionListContainer.innerHTML = '';
-            transactions.forEach(t => {
-                const transactionCard = document.createElement('div');
-                transactionCard.className = 'ad-card'; // Reusing card styling
-                transactionCard.innerHTML = `
-                    <h3>Transaction ID: ${t.id}</h3>
-                    <p>Car: ${t.car_make || 'N/A'} (ID: ${t.car_id})</p>
-                    <p>Buyer: ${t.buyer_mobile} (ID: ${t.buyer_id})</p>
-                    <p>Seller: ${t.seller_mobile} (ID: ${t.seller_id})</p>
-                    <p>Agreed Price: $${parseFloat(t.agreed_price).toLocaleString()}</p>
-                    <p>Status: <strong>${t.status}</strong></p>
-                    <p>Date: ${new Date(t.transaction_date).toLocaleString()}</p>
-                    <div class="transaction-actions" style="margin-top: 10px;">
-                        ${(hasRole('Admin') || hasRole('Senior') || (t.seller_mobile === currentUserMobile)) && t.status === 'pending' ?
-                            `<button class="update-transaction-status-btn" data-transaction-id="${t.id}" data-status="accepted" style="background-color: #28a745; margin-right: 5px;">Accept</button>
-                             <button class="update-transaction-status-btn" data-transaction-id="${t.id}" data-status="rejected" style="background-color: #dc3545;">Reject</button>`
-                            : ''
-                        }
-                        ${(hasRole('Admin') || hasRole('Senior') || (t.seller_mobile === currentUserMobile)) && (t.status === 'accepted' || t.status === 'rejected') ?
-                            `<button class="update-transaction-status-btn" data-transaction-id="${t.id}" data-status="completed" style="background-color: #007bff;">Mark as Completed</button>`
-                            : ''
-                        }
-                    </div>
-                `;
-                transactionListContainer.appendChild(transactionCard);
-            });
-
-            // Attach event listeners for transaction status update buttons
-            document.querySelectorAll('.update-transaction-status-btn').forEach(button => {
-                button.addEventListener('click', async (event) => {
-                    const transactionId = event.target.dataset.transactionId;
-                    const newStatus = event.target.dataset.status;
-                    if (confirm(`Change transaction ${transactionId} status to ${newStatus}?`)) {
-                        await updateTransactionStatus(transactionId, newStatus);
-                    }
-                });
-            });
-
+            page.items.forEach(t => transactionListContainer.appendChild(renderTransactionCard(t)));
+            transactionsNextCursor = page.next_cursor;
+            transactionsLoadMoreBtn.style.display = transactionsNextCursor ? 'block' : 'none';
         } else {
-            transactionListContainer.innerHTML = `<p class="error">Error loading transactions: ${transactions.message || 'Unknown error'}</p>`;
-            showMessage(transactions.message || 'Failed to load transactions.', 'error');
+            transactionListContainer.innerHTML = `<p class="error">Error loading transactions: ${page.message || 'Unknown error'}</p>`;
+            showMessage(page.message || 'Failed to load transactions.', 'error');
         }
     } catch (error) {
         console.error('Error fetching transactions:', error);
@@ -742,6 +1032,45 @@ async function fetchAllTransactions() {
     }
 }
 
+function renderTransactionCard(t) {
+    const transactionCard = document.createElement('div');
+    transactionCard.className = 'ad-card'; // Reusing card styling
+    transactionCard.innerHTML = `
+        <h3>Transaction ID: ${t.id}</h3>
+        <p>Car: ${t.car_make || 'N/A'} (ID: ${t.car_id})</p>
+        <p>Buyer: ${t.buyer_mobile} (ID: ${t.buyer_id})</p>
+        <p>Seller: ${t.seller_mobile} (ID: ${t.seller_id})</p>
+        <p>Agreed Price: $${parseFloat(t.agreed_price).toLocaleString()}</p>
+        <p>Status: <strong>${t.status}</strong></p>
+        <p>Date: ${new Date(t.transaction_date).toLocaleString()}</p>
+        <div class="transaction-actions" style="margin-top: 10px;">
+            ${(hasRole('Admin') || hasRole('Senior') || (t.seller_mobile === currentUserMobile)) && t.status === 'pending' ?
+                `<button class="update-transaction-status-btn" data-transaction-id="${t.id}" data-status="accepted" style="background-color: #28a745; margin-right: 5px;">Accept</button>
+                 <button class="update-transaction-status-btn" data-transaction-id="${t.id}" data-status="rejected" style="background-color: #dc3545;">Reject</button>`
+                : ''
+            }
+            ${(hasRole('Admin') || hasRole('Senior') || (t.seller_mobile === currentUserMobile)) && (t.status === 'accepted' || t.status === 'rejected') ?
+                `<button class="update-transaction-status-btn" data-transaction-id="${t.id}" data-status="completed" style="background-color: #007bff;">Mark as Completed</button>`
+                : ''
+            }
+        </div>
+    `;
+
+    // Listeners are bound per card so appended pages don't double-bind earlier ones
+    transactionCard.querySelectorAll('.update-transaction-status-btn').forEach(button => {
+        button.addEventListener('click', async (event) => {
+            const transactionId = event.target.dataset.transactionId;
+            const newStatus = event.target.dataset.status;
+            if (confirm(`Change transaction ${transactionId} status to ${newStatus}?`)) {
+                await updateTransactionStatus(transactionId, newStatus);
+            }
+        });
+    });
+    return transactionCard;
+}
+
+transactionsLoadMoreBtn.addEventListener('click', () => loadTransactionsPage(false));
+
 // NEW: Update Transaction Status Functionality
 async function updateTransactionStatus(transactionId, newStatus) {
     const token = localStorage.getItem('authToken');
@@ -0,0 +1,138 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update, exists
+
+from extensions import db, result_cache
+from models import Car, Advertisement, Transaction
+from facets import facet_cell, apply_facet_deltas, rebuild_facet_counts
+from price_trends import (
+    segment_of, mark_segments_dirty, claim_dirty_segments, refresh_segment_rollups, refresh_all_rollups
+)
+from changefeed import record_listing_changes, prune_listing_changes
+from similarity import related_index
+from archive import cold_listing_batch, archive_listings
+from jobs import job_runner
+
+AD_EXPIRED = 'expired'
+AD_SOLD = 'sold'
+
+
+def _listing_batch(*conditions, order_by):
+    # SKIP LOCKED leaves ads a user is editing for the next run instead of
+    # waiting on them; SQLite ignores it
+    return db.session.execute(
+        select(
+            Advertisement.id, Advertisement.car_id, Advertisement.price, Advertisement.status,
+            Car.make, Car.model, Car.color, Car.status.label('car_status'), Car.year
+        )
+        .join(Car, Car.id == Advertisement.car_id)
+        .where(*conditions)
+        .order_by(*order_by)
+        .limit(job_runner.batch_size)
+        .with_for_update(of=Advertisement, skip_locked=True)
+    ).all()
+
+
+def _set_listing_status(rows, status, now):
+    """Move a batch of ads to ``status`` with the same bookkeeping a single update gets."""
+    deltas, segments, stale_tags = Counter(), set(), {'cars', 'search'}
+    for row in rows:
+        deltas[facet_cell(row.make, row.color, row.car_status, row.year, row.price, row.status)] -= 1
+        deltas[facet_cell(row.make, row.color, row.car_status, row.year, row.price, status)] += 1
+        segments.add(segment_of(row.make, row.model, row.year))
+        stale_tags.update({f'car:{row.car_id}', f'ad:{row.id}', f'make:{row.make.strip().lower()}'})
+
+    car_ids = [row.car_id for row in rows]
+    # Bumping the version makes a concurrent edit of the old row fail with 412 instead of undoing this
+    db.session.execute(
+        update(Advertisement)
+        .where(Advertisement.id.in_([row.id for row in rows]))
+        .values(status=status, version=Advertisement.version + 1, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    apply_facet_deltas(deltas)
+    record_listing_changes(car_ids)
+    mark_segments_dirty(segments)
+    return stale_tags, car_ids
+
+
+def _sweep(progress, next_batch, status):
+    now = datetime.utcnow()
+    while rows := next_batch():
+        stale_tags, car_ids = _set_listing_status(rows, status, now)
+        progress.advance(len(rows))
+        db.session.commit()
+        result_cache.invalidate(*stale_tags)
+        related_index.refresh_cars(car_ids)
+
+
+@job_runner.register('expire_stale_ads', 'EXPIRE_ADS_INTERVAL_SECONDS')
+def expire_stale_ads(progress):
+    """Expire active ads older than ``AD_EXPIRY_DAYS``."""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['AD_EXPIRY_DAYS'])
+    # Expired rows leave the active range, so every batch starts from the front again
+    _sweep(progress, lambda: _listing_batch(
+        Advertisement.status == 'active', Advertisement.created_at < cutoff,
+        order_by=(Advertisement.created_at, Advertisement.id)
+    ), AD_EXPIRED)
+
+
+@job_runner.register('mark_sold_ads', 'MARK_SOLD_INTERVAL_SECONDS')
+def mark_sold_ads(progress):
+    """Mark active ads sold once a transaction for their car has completed."""
+    completed = exists().where(Transaction.car_id == Advertisement.car_id, Transaction.status == 'completed')
+    last_id = 0
+
+    def next_batch():
+        nonlocal last_id
+        # Locked rows are skipped rather than retried, so the id cursor keeps the loop finite
+        rows = _listing_batch(
+            Advertisement.status == 'active', Advertisement.id > last_id, completed, order_by=(Advertisement.id,)
+        )
+        if rows:
+            last_id = rows[-1].id
+        return rows
+
+    _sweep(progress, next_batch, AD_SOLD)
+
+
+@job_runner.register('refresh_aggregates', 'REFRESH_AGGREGATES_INTERVAL_SECONDS')
+def refresh_aggregates(progress):
+    """Rebuild the facet counts and today's price rollups from the live tables.
+
+    Writers keep both up to date incrementally; this corrects any drift.
+    """
+    rebuild_facet_counts()
+    progress.advance(0)
+    segments = refresh_all_rollups()
+    progress.advance(segments)
+    db.session.commit()
+
+
+@job_runner.register('refresh_price_rollups', 'ROLLUP_REFRESH_INTERVAL_SECONDS')
+def refresh_price_rollups(progress):
+    """Recompute today's rollup for each segment a write has marked dirty."""
+    while segments := claim_dirty_segments(job_runner.batch_size):
+        refresh_segment_rollups(segments)
+        progress.advance(len(segments))
+        db.session.commit()
+        result_cache.invalidate(*{f'make:{make.strip()}' for make, _, _ in segments})
+
+
+@job_runner.register('prune_listing_changes', 'PRUNE_LISTING_CHANGES_INTERVAL_SECONDS')
+def prune_listing_change_log(progress):
+    prune_listing_changes(batch_size=job_runner.batch_size, on_batch=progress.advance)
+
+
+@job_runner.register('archive_cold_listings', 'ARCHIVE_INTERVAL_SECONDS')
+def archive_cold_listings(progress):
+    """Move sold and expired listings older than ``ARCHIVE_AFTER_DAYS`` into the archive tables."""
+    now = datetime.utcnow()
+    while rows := cold_listing_batch(job_runner.batch_size):
+        stale_tags = archive_listings(rows, now)
+        progress.advance(len(rows))
+        db.session.commit()
+        result_cache.invalidate(*stale_tags)
+        related_index.refresh_cars([row.car_id for row in rows])
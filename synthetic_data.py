@@ -0,0 +1,270 @@
+"""Populate the database with a synthetic catalog for load tests and benchmarks.
+
+    python synthetic_data.py --users 100000 --ads 1000000 --transactions 50000
+
+Rows go in through multi-row Core inserts in batches, so millions of rows
+take minutes rather than hours. Synthetic users share one password hash
+(BENCHMARK_PASSWORD) and mobile numbers starting with SYNTHETIC_MOBILE_PREFIX.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, func
+
+from app import app
+from extensions import db
+from models import (
+    User, Role, UserRoles, Car, Advertisement, CarImage, PriceHistory, Transaction, SavedSearch, SavedSearchTerm
+)
+from facets import rebuild_facet_counts
+from price_trends import refresh_all_rollups
+from seed_db import seed_initial_data
+from saved_searches import SAVED_SEARCH_FIELDS, anchor_terms
+from werkzeug.security import generate_password_hash
+
+SYNTHETIC_MOBILE_PREFIX = '07'
+BENCHMARK_PASSWORD = 'benchpass'
+
+# make -> {model: base price of a new car}
+CATALOG = {
+    'Toyota': {'Corolla': 22000, 'Camry': 28000, 'RAV4': 32000, 'Yaris': 18000, 'Land Cruiser': 90000},
+    'Honda': {'Civic': 24000, 'Accord': 29000, 'CR-V': 31000, 'Jazz': 19000},
+    'BMW': {'3 Series': 45000, '5 Series': 58000, 'X3': 50000, 'X5': 68000},
+    'Mercedes-Benz': {'C-Class': 47000, 'E-Class': 60000, 'GLC': 52000, 'S-Class': 110000},
+    'Audi': {'A3': 35000, 'A4': 42000, 'Q5': 50000, 'Q7': 65000},
+    'Volkswagen': {'Golf': 27000, 'Passat': 32000, 'Tiguan': 34000, 'Polo': 20000},
+    'Ford': {'Focus': 21000, 'Fiesta': 17000, 'Mustang': 45000, 'Explorer': 40000},
+    'Hyundai': {'Elantra': 21000, 'Tucson': 29000, 'Santa Fe': 35000, 'i20': 17000},
+    'Kia': {'Rio': 17000, 'Sportage': 28000, 'Sorento': 34000, 'Cerato': 20000},
+    'Peugeot': {'206': 12000, '208': 19000, '308': 24000, '3008': 31000},
+    'Nissan': {'Sunny': 16000, 'Qashqai': 28000, 'X-Trail': 32000, 'Patrol': 75000},
+    'Tesla': {'Model 3': 42000, 'Model Y': 48000, 'Model S': 85000},
+}
+COLORS = ['white', 'black', 'silver', 'gray', 'blue', 'red', 'green', 'brown', 'beige', 'yellow']
+AD_STATUSES = [('active', 0.8), ('sold', 0.12), ('expired', 0.08)]
+TRANSACTION_STATUSES = [('completed', 0.5), ('pending', 0.2), ('accepted', 0.15), ('rejected', 0.15)]
+
+
+def _weighted(rng, choices):
+    return rng.choices([value for value, _ in choices], weights=[weight for _, weight in choices])[0]
+
+
+def _insert_returning_ids(table, rows):
+    return db.session.execute(
+        insert(table).returning(table.c.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+
+def _progress(label, done, total, started):
+    rate = done / max(time.monotonic() - started, 1e-9)
+    print(f"  {label}: {done}/{total} ({rate:,.0f} rows/s)", flush=True)
+
+
+def generate_users(rng, count, batch_size):
+    users, user_roles = User.__table__, UserRoles.__table__
+    password_hash = generate_password_hash(BENCHMARK_PASSWORD, app.config['PASSWORD_HASH_METHOD'])
+    roles = {role.name: role.id for role in Role.query}
+    offset = db.session.scalar(
+        select(func.count()).select_from(users).where(users.c.mobile_number.like(f'{SYNTHETIC_MOBILE_PREFIX}%'))
+    )
+
+    user_ids, started = [], time.monotonic()
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        ids = _insert_returning_ids(users, [
+            {'mobile_number': f'{SYNTHETIC_MOBILE_PREFIX}{offset + start + i:09d}', 'password_hash': password_hash, 'active': True}
+            for i in range(size)
+        ])
+        links = [{'user_id': user_id, 'role_id': roles['User']} for user_id in ids]
+        # Roughly one user in ten also sells
+        links += [{'user_id': user_id, 'role_id': roles['Seller']} for user_id in ids if rng.random() < 0.1]
+        db.session.execute(insert(user_roles), links)
+        db.session.commit()
+        user_ids.extend(ids)
+        _progress('users', len(user_ids), count, started)
+    return user_ids
+
+
+def _listing(rng, now):
+    make = rng.choice(list(CATALOG))
+    model, base_price = rng.choice(list(CATALOG[make].items()))
+    year = rng.randint(now.year - 25, now.year)
+    age = now.year - year
+    # ~12% depreciation per year with a floor, then +/-20% noise
+    price = max(base_price * (0.88 ** age), base_price * 0.08) * rng.uniform(0.8, 1.2)
+    created_at = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+    return make, model, year, round(price, -1), created_at
+
+
+def generate_listings(rng, count, user_ids, images_per_ad, history_per_ad, batch_size):
+    cars, ads = Car.__table__, Advertisement.__table__
+    images, history = CarImage.__table__, PriceHistory.__table__
+    now = datetime.utcnow()
+
+    sold_listings, done, started = [], 0, time.monotonic()
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        listings = [_listing(rng, now) for _ in range(size)]
+        car_ids = _insert_returning_ids(cars, [
+            {'make': make, 'model': model, 'year': year, 'color': rng.choice(COLORS),
+             'status': 'new' if year >= now.year - 1 and rng.random() < 0.5 else 'used',
+             'version': 1, 'updated_at': created_at}
+            for make, model, year, _, created_at in listings
+        ])
+
+        ad_rows, image_rows, history_rows = [], [], []
+        for car_id, (make, model, year, price, created_at) in zip(car_ids, listings):
+            seller_id = rng.choice(user_ids)
+            status = _weighted(rng, AD_STATUSES)
+            ad_rows.append({
+                'title': f'{year} {make} {model}', 'description': f'Well kept {make} {model}, {year}.',
+                'price': price, 'status': status, 'created_at': created_at, 'updated_at': created_at,
+                'version': 1, 'car_id': car_id, 'user_id': seller_id,
+            })
+            image_rows += [
+                {'car_id': car_id, 'image_url': f'https://img.example.com/cars/{car_id}/{i}.jpg', 'description': None}
+                for i in range(rng.randint(0, images_per_ad))
+            ]
+            # Asking prices drift down towards the current price
+            points = rng.randint(1, history_per_ad) if history_per_ad else 0
+            for i in range(points):
+                step = points - 1 - i
+                history_rows.append({
+                    'car_id': car_id,
+                    'price': round(price * (1 + 0.03 * step), 2),
+                    'change_date': created_at + (now - created_at) * (i / points),
+                })
+            if status == 'sold':
+                sold_listings.append((car_id, seller_id, price))
+
+        db.session.execute(insert(ads), ad_rows)
+        if image_rows:
+            db.session.execute(insert(images), image_rows)
+        if history_rows:
+            db.session.execute(insert(history), history_rows)
+        db.session.commit()
+        done += size
+        _progress('listings', done, count, started)
+    return sold_listings
+
+
+def _offers(rng, user_ids, car_id, seller_id, price, now):
+    """One to three competing offers on a listing; at most one of them is accepted or completed."""
+    buyers = [buyer_id for buyer_id in rng.sample(user_ids, min(3, len(user_ids))) if buyer_id != seller_id]
+    buyers = buyers[:rng.randint(1, 3)]
+    winner = _weighted(rng, TRANSACTION_STATUSES)
+    rows = []
+    for i, buyer_id in enumerate(buyers):
+        if i == 0:
+            status = winner
+        elif winner in ('accepted', 'completed'):
+            status = 'rejected'
+        else:
+            status = rng.choice(['pending', 'rejected'])
+        rows.append({
+            'car_id': car_id, 'buyer_id': buyer_id, 'seller_id': seller_id, 'status': status,
+            'agreed_price': round(price * rng.uniform(0.85, 1.0), -1),
+            'transaction_date': now - timedelta(seconds=rng.randint(0, 180 * 24 * 3600)),
+        })
+    return rows
+
+
+def generate_transactions(rng, count, user_ids, sold_listings, batch_size):
+    transactions = Transaction.__table__
+    now = datetime.utcnow()
+    # Listings draw several offers each, so fewer of them are needed to reach the count
+    picked = rng.sample(sold_listings, min(count, len(sold_listings)))
+
+    rows = []
+    for car_id, seller_id, price in picked:
+        if len(rows) >= count:
+            break
+        rows.extend(_offers(rng, user_ids, car_id, seller_id, price, now))
+    rows = rows[:count]
+
+    started = time.monotonic()
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(transactions), rows[start:start + batch_size])
+        db.session.commit()
+        _progress('transactions', min(start + batch_size, len(rows)), len(rows), started)
+
+
+def _saved_search_criteria(rng):
+    make = rng.choice(list(CATALOG))
+    criteria = dict.fromkeys(SAVED_SEARCH_FIELDS)
+    criteria['match'] = 'contains'
+    # Mostly brand-led searches, as buyers write them, with some price-only and colour-only ones
+    kind = rng.random()
+    if kind < 0.7:
+        criteria['brand'] = make.lower()
+        if rng.random() < 0.5:
+            criteria['model'] = rng.choice(list(CATALOG[make])).lower()
+    elif kind < 0.85:
+        criteria['color'] = rng.choice(COLORS)
+    if kind >= 0.85 or rng.random() < 0.6:
+        low = rng.choice([0, 2000, 5000, 10000, 20000, 40000])
+        criteria['min_price'], criteria['max_price'] = low, low + rng.choice([5000, 10000, 30000])
+    if rng.random() < 0.3:
+        criteria['min_year'] = rng.randint(2005, 2022)
+    return criteria
+
+
+def generate_saved_searches(rng, count, user_ids, batch_size):
+    searches, terms = SavedSearch.__table__, SavedSearchTerm.__table__
+    now = datetime.utcnow()
+
+    done, started = 0, time.monotonic()
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        batch = [_saved_search_criteria(rng) for _ in range(size)]
+        ids = _insert_returning_ids(searches, [
+            dict(criteria, user_id=rng.choice(user_ids), name=f'Saved search {start + i}', created_at=now)
+            for i, criteria in enumerate(batch)
+        ])
+        db.session.execute(insert(terms), [
+            {'saved_search_id': search_id, 'field': field, 'term': term}
+            for search_id, criteria in zip(ids, batch) for field, term in anchor_terms(criteria)
+        ])
+        db.session.commit()
+        done += size
+        _progress('saved searches', done, count, started)
+
+
+def generate(users, ads, transactions, images_per_ad=3, history_per_ad=3, batch_size=5000, seed=1, saved_searches=0):
+    rng = random.Random(seed)
+    seed_initial_data()
+    with app.app_context():
+        started = time.monotonic()
+        print(f"Generating {users} users, {ads} listings and up to {transactions} transactions...")
+        user_ids = generate_users(rng, users, batch_size)
+        sold_listings = generate_listings(rng, ads, user_ids, images_per_ad, history_per_ad, batch_size)
+        generate_transactions(rng, transactions, user_ids, sold_listings, batch_size)
+        if saved_searches:
+            generate_saved_searches(rng, saved_searches, user_ids, batch_size)
+
+        print("Rebuilding search facets and price rollups...")
+        rebuild_facet_counts()
+        refresh_all_rollups()
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.exec_driver_sql('ANALYZE')
+        print(f"Synthetic data generated in {time.monotonic() - started:.1f}s.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--ads', type=int, default=100000)
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--images-per-ad', type=int, default=3, help="Upper bound; each ad gets 0..N images.")
+    parser.add_argument('--history-per-ad', type=int, default=3, help="Upper bound; each ad gets 1..N price points.")
+    parser.add_argument('--saved-searches', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if args.users < 2 or args.ads < 1:
+        parser.error("Need at least 2 users and 1 ad.")
+    generate(args.users, args.ads, args.transactions, args.images_per_ad, args.history_per_ad, args.batch_size, args.seed,
+             args.saved_searches)
@@ -1,6 +1,95 @@
-from flask import session, redirect, url_for, flash, abort, request, jsonify
+from flask import session, redirect, url_for, flash, abort, request, jsonify, g, current_app
 from functools import wraps
-from models import User
+from threading import Lock
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+from extensions import db
+from models import User, UserRoles
+
+DEFAULT_PRINCIPAL_CACHE_TTL = 30
+
+class Principal:
+    """Detached snapshot of an authenticated user and their role names."""
+    __slots__ = ('id', 'mobile_number', 'active', 'roles')
+
+    def __init__(self, user):
+        self.id = user.id
+        self.mobile_number = user.mobile_number
+        self.active = user.active
+        self.roles = frozenset(role.name for role in user.roles)
+
+    @property
+    def is_active(self):
+        return self.active
+
+    def has_roles(self, *requirements):
+        return any(requirement in self.roles for requirement in requirements)
+
+_principal_cache = {}
+_principal_cache_lock = Lock()
+
+def invalidate_principal(*user_ids):
+    with _principal_cache_lock:
+        for user_id in user_ids:
+            _principal_cache.pop(user_id, None)
+
+def clear_principal_cache():
+    with _principal_cache_lock:
+        _principal_cache.clear()
+
+def _cached_principal(user_id):
+    with _principal_cache_lock:
+        entry = _principal_cache.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _load_principal(user_id):
+    principal = _cached_principal(user_id)
+    if principal is not None:
+        return principal
+
+    user = db.session.get(User, user_id, options=[joinedload(User.roles)])
+    if not user or not user.is_active:
+        return None
+
+    principal = Principal(user)
+    ttl = current_app.config.get('PRINCIPAL_CACHE_TTL', DEFAULT_PRINCIPAL_CACHE_TTL)
+    if ttl:
+        with _principal_cache_lock:
+            _principal_cache[user_id] = (time.monotonic() + ttl, principal)
+    return principal
+
+def _authenticate():
+    """Resolve the session's principal once per request; returns None if it is gone or inactive."""
+    if 'principal' not in g:
+        g.principal = _load_principal(session['user_id'])
+    return g.principal
+
+# Any flushed change to a user or their role links evicts the cached principal once it commits
+@event.listens_for(Session, 'after_flush')
+def _collect_principal_changes(db_session, flush_context):
+    changed = db_session.info.setdefault('changed_principals', set())
+    for obj in list(db_session.dirty) + list(db_session.deleted) + list(db_session.new):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+        elif isinstance(obj, UserRoles) and obj.user_id is not None:
+            changed.add(obj.user_id)
+    if changed:
+        invalidate_principal(*changed)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_principals(db_session):
+    changed = db_session.info.pop('changed_principals', None)
+    if changed:
+        invalidate_principal(*changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_principal_changes(db_session):
+    db_session.info.pop('changed_principals', None)
 
 def login_required(f):
     @wraps(f)
@@ -9,8 +98,8 @@ def login_required(f):
             flash('You need to be logged in to access this page.', 'error')
             return redirect(url_for('login_api'))
 
-        user = User.query.get(session.get('user_id'))
-        if not user or not user.is_active:
+        user = _authenticate()
+        if not user:
             session.pop('user_id', None)
             flash('Your session has expired or account is inactive.', 'error')
             return redirect(url_for('login_api'))
@@ -27,8 +116,8 @@ def roles_required(*roles):
                 flash('You need to be logged in to access this page.', 'error')
                 return redirect(url_for('login_api'))
 
-            user = User.query.get(session.get('user_id'))
-            if not user or not user.is_active:
+            user = _authenticate()
+            if not user:
                 session.pop('user_id', None)
                 flash('Your session has expired or account is inactive.', 'error')
                 return redirect(url_for('login_api'))
@@ -41,4 +130,4 @@ def roles_required(*roles):
 
             return f(*args, **kwargs)
         return decorated_function
-    return wrapper
\ No newline at end of file
+    return wrapper
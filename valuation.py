@@ -0,0 +1,145 @@
+from statistics import fmean
+
+from flask import abort
+from sqlalchemy import select, union_all, literal, exists
+
+from extensions import db
+from models import Car, Advertisement, Transaction, ArchivedCar
+from search import normalize_term, text_filter
+from offers import SETTLED_STATUSES
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python fallback; install numpy for large segments
+    np = None
+
+VALUATION_PERCENTILES = (10, 25, 50, 75, 90)
+# Prices beyond this many interquartile ranges outside the quartiles are left out of the fair band
+OUTLIER_FENCE = 1.5
+SOURCE_ADVERTISEMENT, SOURCE_TRANSACTION = 0, 1
+
+
+def parse_segment(args):
+    segment = {
+        'make': normalize_term(args.get('make')),
+        'model': normalize_term(args.get('model')),
+        'year': args.get('year', type=int),
+        'color': normalize_term(args.get('color')),
+        'status': normalize_term(args.get('status')),
+    }
+    if not segment['make'] or not segment['model'] or segment['year'] is None:
+        abort(400, description="make, model and an integer year are required.")
+    return segment
+
+
+def _segment_filters(segment, car=Car):
+    filters = [
+        text_filter(car.make, segment['make'], 'exact'),
+        text_filter(car.model, segment['model'], 'exact'),
+        car.year == segment['year'],
+    ]
+    if segment['color']:
+        filters.append(text_filter(car.color, segment['color'], 'exact'))
+    if segment['status']:
+        filters.append(text_filter(car.status, segment['status'], 'exact'))
+    return filters
+
+
+def segment_price_query(segment):
+    """(source, price) for the segment's active asking prices and completed sale prices.
+
+    An ad stays active until the ``mark_sold_ads`` sweep catches up with its
+    sale, so a car with an accepted or completed offer is left out of the
+    asking prices; once completed it counts once, as a sale.
+    """
+    filters = _segment_filters(segment)
+    asking = (
+        select(literal(SOURCE_ADVERTISEMENT).label('source'), Advertisement.price.label('price'))
+        .join(Car, Car.id == Advertisement.car_id)
+        .where(
+            Advertisement.status == 'active',
+            ~exists().where(Transaction.car_id == Car.id, Transaction.status.in_(SETTLED_STATUSES)),
+            *filters
+        )
+    )
+    sold = (
+        select(literal(SOURCE_TRANSACTION).label('source'), Transaction.agreed_price.label('price'))
+        .join(Car, Car.id == Transaction.car_id)
+        .where(Transaction.status == 'completed', *filters)
+    )
+    # Transactions stay hot after their car is archived
+    sold_archived = (
+        select(literal(SOURCE_TRANSACTION).label('source'), Transaction.agreed_price.label('price'))
+        .join(ArchivedCar, ArchivedCar.id == Transaction.car_id)
+        .where(Transaction.status == 'completed', *_segment_filters(segment, ArchivedCar))
+    )
+    return union_all(asking, sold, sold_archived)
+
+
+def load_segment_prices(segment):
+    rows = db.session.execute(segment_price_query(segment)).all()
+    if np is None:
+        return [source for source, _ in rows], [float(price) for _, price in rows]
+    sources = np.fromiter((source for source, _ in rows), dtype=np.int8, count=len(rows))
+    prices = np.fromiter((price for _, price in rows), dtype=np.float64, count=len(rows))
+    return sources, prices
+
+
+def _percentiles(sorted_prices, ranks):
+    # Linear interpolation between closest ranks, as numpy.percentile does by default
+    last = len(sorted_prices) - 1
+    values = []
+    for rank in ranks:
+        position = last * rank / 100
+        low = int(position)
+        high = min(low + 1, last)
+        values.append(sorted_prices[low] + (sorted_prices[high] - sorted_prices[low]) * (position - low))
+    return values
+
+
+def _summarize_numpy(sources, prices):
+    percentiles = np.percentile(prices, VALUATION_PERCENTILES)
+    q1, q3 = np.percentile(prices, (25, 75))
+    fence = OUTLIER_FENCE * (q3 - q1)
+    inliers = prices[(prices >= q1 - fence) & (prices <= q3 + fence)]
+    return {
+        'count': int(prices.size),
+        'advertisements': int(np.count_nonzero(sources == SOURCE_ADVERTISEMENT)),
+        'transactions': int(np.count_nonzero(sources == SOURCE_TRANSACTION)),
+        'mean': float(prices.mean()),
+        'percentiles': [float(value) for value in percentiles],
+        'fair_price': [float(value) for value in np.percentile(inliers, (25, 75))],
+    }
+
+
+def _summarize_python(sources, prices):
+    ordered = sorted(prices)
+    q1, q3 = _percentiles(ordered, (25, 75))
+    fence = OUTLIER_FENCE * (q3 - q1)
+    inliers = [price for price in ordered if q1 - fence <= price <= q3 + fence]
+    return {
+        'count': len(ordered),
+        'advertisements': sources.count(SOURCE_ADVERTISEMENT),
+        'transactions': sources.count(SOURCE_TRANSACTION),
+        'mean': fmean(ordered),
+        'percentiles': _percentiles(ordered, VALUATION_PERCENTILES),
+        'fair_price': _percentiles(inliers, (25, 75)),
+    }
+
+
+def market_valuation(segment):
+    """Price distribution for a segment, from one narrow query and no ORM objects."""
+    sources, prices = load_segment_prices(segment)
+    valuation = {'segment': segment, 'count': len(prices), 'sources': {'advertisements': 0, 'transactions': 0},
+                 'mean': None, 'percentiles': None, 'fair_price': None}
+    if not len(prices):
+        return valuation
+
+    summary = _summarize_numpy(sources, prices) if np is not None else _summarize_python(sources, prices)
+    valuation.update({
+        'sources': {'advertisements': summary['advertisements'], 'transactions': summary['transactions']},
+        'mean': round(summary['mean'], 2),
+        'percentiles': {f'p{rank}': round(value, 2) for rank, value in zip(VALUATION_PERCENTILES, summary['percentiles'])},
+        'fair_price': {'low': round(summary['fair_price'][0], 2), 'high': round(summary['fair_price'][1], 2)},
+    })
+    return valuation